@@ -0,0 +1,204 @@
+import getopt
+import json
+import math
+import multiprocessing
+import platform
+import sys
+import time
+
+from simulator import runner, warehouse
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, JSON manifests only
+    tomllib = None
+
+# Set in every pool process by `init_worker`
+_scenarios = None
+
+
+def usage(file):
+    print("Usage: {0} [OPTION...] MANIFEST".format(file))
+    print()
+    print("Runs every scenario of a JSON or TOML manifest on one pool of processes")
+    print("and writes a single JSON report.")
+    print()
+    print("  {:<24}{}".format("-h, --help", "print this help"))
+    print("  {:<24}{}".format("-o, --out=FILE", "write the report to FILE (default stdout)"))
+    print("  {:<24}{}".format("    --threads=N", "how many processes to use (default 0 = auto)"))
+    print("  {:<24}{}".format("    --store", "save every scenario into the results database"))
+    print("  {:<24}{}".format("    --db=FILE", "results database (default"))
+    print("  {:<24}{}".format("", "\"~/.cache/casinosim/results.db\"), implies --store"))
+    print("  {:<24}{}".format("    --chunk=ITS", "iterations per task (default: spread every"))
+    print("  {:<24}{}".format("", "scenario over about 4 tasks per process)"))
+
+
+def load_manifest(path):
+    """
+    Loads a manifest, returning its list of `runner.Scenario`s.
+
+    A manifest has an optional `defaults` table, applied to every scenario, and a list of
+    `scenarios`, each taking the keys of `runner.Scenario.from_dict`. TOML is used for
+    files ending in ".toml", JSON otherwise.
+    """
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML manifests need Python 3.11 or newer")
+        with open(path, "rb") as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+
+    defaults = manifest.get("defaults", {})
+    scenarios = []
+    for i, d in enumerate(manifest.get("scenarios", [])):
+        scenario = runner.Scenario.from_dict(d, defaults)
+        if scenario.name is None:
+            scenario.name = "scenario-{}".format(i + 1)
+        scenario.validate()
+        scenarios.append(scenario)
+    if not scenarios:
+        raise ValueError("Manifest has no scenarios")
+    return scenarios
+
+
+def init_worker(scenarios, strategies):
+    global _scenarios
+    _scenarios = scenarios
+    runner.warm(strategies=strategies)
+
+
+def run_task(task):
+    """
+    Runs one chunk of a scenario in a pool process. Simulators are built once per
+    scenario and process, and reused by every later chunk of the same scenario.
+    """
+    (index, iterations, first) = task
+    return (index,) + runner.run_chunk(_scenarios[index], iterations, first)
+
+
+def make_tasks(scenarios, threads, chunk=None):
+    tasks = []
+    for index, scenario in enumerate(scenarios):
+        size = chunk or max(1, int(math.ceil(scenario.iterations / float(threads * 4))))
+        tasks.extend((index, n, first) for (n, first) in runner.split_iterations(scenario.iterations, size))
+    return tasks
+
+
+def run_batch(scenarios, threads, chunk=None, out=sys.stderr):
+    """
+    Runs all `scenarios` on one pool of `threads` processes, returning the report.
+    Every strategy file is loaded once and shared by all scenarios and processes.
+    """
+    strategies = {}
+    for scenario in scenarios:
+        runner.load_strategies(scenario.strat_files(), strategies)
+
+    results = [{
+        "reasons": [],
+        "stats": scenario.new_stats(),
+        "iterations": 0,
+        "cpu_time": 0.0,
+    } for scenario in scenarios]
+    # the stats of every task, per scenario and player, merged at once when all are done
+    task_stats = [[[] for _ in scenario.players] for scenario in scenarios]
+
+    tasks = make_tasks(scenarios, threads, chunk)
+    start = time.perf_counter()
+    with multiprocessing.Pool(threads, initializer=init_worker, initargs=(scenarios, strategies)) as pool:
+        done = 0
+        for (index, iterations, elapsed, reasons, total_stats) in pool.imap_unordered(run_task, tasks):
+            res = results[index]
+            runner.add_compact_reasons(res["reasons"], runner.compact_reasons(reasons))
+            for i, st in enumerate(total_stats):
+                task_stats[index][i].append(st)
+            res["iterations"] += iterations
+            res["cpu_time"] += elapsed
+            done += 1
+            if out is not None:
+                out.write("\r{}/{} tasks".format(done, len(tasks)))
+                out.flush()
+    if out is not None:
+        out.write("\n")
+    for res, scenario_stats in zip(results, task_stats):
+        for st, records in zip(res["stats"], scenario_stats):
+            st.add_all(records)
+    end = time.perf_counter()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "threads": threads,
+        "elapsed": end - start,
+        "strategies": len(strategies),
+        "scenarios": [],
+    }
+    for scenario, res in zip(scenarios, results):
+        report["scenarios"].append(runner.scenario_report(
+            scenario, res["reasons"], res["stats"], res["iterations"], res["cpu_time"]))
+    return report
+
+
+def main():
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "ho:", ["help", "out=", "threads=", "chunk=", "store", "db="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage(sys.argv[0])
+        sys.exit(2)
+
+    out = None
+    threads = 0
+    chunk = None
+    db_path = None
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            usage(sys.argv[0])
+            sys.exit()
+        elif o in ('-o', '--out'):
+            out = a
+        elif o == '--threads':
+            threads = int(a)
+        elif o == '--chunk':
+            chunk = int(a)
+        elif o == '--store':
+            db_path = db_path or warehouse.DEFAULT_PATH
+        elif o == '--db':
+            db_path = a
+
+    if len(args) != 1:
+        usage(sys.argv[0])
+        sys.exit(1)
+
+    try:
+        scenarios = load_manifest(args[0])
+    except (OSError, ValueError, KeyError) as err:
+        print("Invalid manifest:", err)
+        sys.exit(1)
+
+    if threads == 0:
+        threads = multiprocessing.cpu_count()
+
+    print("Running {} scenarios using {} processes...".format(len(scenarios), threads), file=sys.stderr)
+    report = run_batch(scenarios, threads, chunk)
+    print("Completed in {:.2f}s".format(report["elapsed"]), file=sys.stderr)
+
+    if db_path is not None:
+        store = warehouse.Warehouse(db_path)
+        for scenario_report in report["scenarios"]:
+            store.record(scenario_report, source="batch", processes=threads)
+        store.close()
+        print("Stored {} scenarios in: {}".format(len(report["scenarios"]), db_path), file=sys.stderr)
+
+    if out is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Report written to:", out, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
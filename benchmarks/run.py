@@ -0,0 +1,138 @@
+import getopt
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks import suite
+from simulator import threaded
+
+DEFAULT_THRESHOLD = 10.0
+
+
+def usage():
+    print("Usage: python -m benchmarks.run run [OPTION...]")
+    print("       python -m benchmarks.run compare BASELINE RESULT [--threshold=PERCENT]")
+    print()
+    print("Run options:")
+    print("  {:<24}{}".format("-o, --out=FILE", "save results as a JSON baseline"))
+    print("  {:<24}{}".format("-q, --quick", "run 10x fewer operations"))
+    print("  {:<24}{}".format("-r, --repeat=N", "times to repeat each benchmark (default 5)"))
+    print("  {:<24}{}".format("-b, --bench=NAME", "only run benchmarks starting with NAME, repeatable"))
+    print("  {:<24}{}".format("    --max-procs=N", "scale from 1 to N processes (default all cores)"))
+    print()
+    print("Compare options:")
+    print("  {:<24}{}".format("-t, --threshold=PERCENT",
+                              "flag results slower than the baseline by more"))
+    print("  {:<24}{}".format("", "than PERCENT (default {})".format(DEFAULT_THRESHOLD)))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    opts, _ = getopt.getopt(args, "o:qr:b:", ["out=", "quick", "repeat=", "bench=", "max-procs="])
+    out = None
+    quick = False
+    repeat = 5
+    only = []
+    max_procs = None
+    for o, a in opts:
+        if o in ('-o', '--out'):
+            out = a
+        elif o in ('-q', '--quick'):
+            quick = True
+        elif o in ('-r', '--repeat'):
+            repeat = int(a)
+        elif o in ('-b', '--bench'):
+            only.append(a)
+        elif o == '--max-procs':
+            max_procs = int(a)
+
+    results = suite.run_all(quick=quick, max_procs=max_procs, repeat=repeat, only=only)
+
+    print("{:<28}{:>16}{:>16}  {}".format("Benchmark", "best", "median", "unit"))
+    for res in results:
+        print("{:<28}{:>16,.0f}{:>16,.0f}  {}".format(res.name, res.best, res.median, res.unit))
+
+    if out is not None:
+        baseline = {
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "cpu_count": multiprocessing.cpu_count(),
+                "free_threaded": threaded.free_threaded(),
+                "quick": quick,
+                "repeat": repeat,
+            },
+            "results": {res.name: res.to_dict() for res in results},
+        }
+        with open(out, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print("\nSaved results to", out)
+
+
+def compare(args):
+    opts, files = getopt.gnu_getopt(args, "t:", ["threshold="])
+    threshold = DEFAULT_THRESHOLD
+    for o, a in opts:
+        if o in ('-t', '--threshold'):
+            threshold = float(a)
+    if len(files) != 2:
+        usage()
+        sys.exit(2)
+
+    with open(files[0]) as f:
+        base = json.load(f)["results"]
+    with open(files[1]) as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    print("{:<28}{:>16}{:>16}{:>10}".format("Benchmark", "baseline", "result", "change"))
+    for name in sorted(set(base) | set(new)):
+        if name not in base or name not in new:
+            print("{:<28}{:>16}{:>16}".format(
+                name, "-" if name not in base else "{:,.0f}".format(base[name]["best"]),
+                "-" if name not in new else "{:,.0f}".format(new[name]["best"])))
+            continue
+        change = new[name]["best"] / base[name]["best"] - 1
+        flag = ""
+        if change < -threshold / 100:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("{:<28}{:>16,.0f}{:>16,.0f}{:>+10.1%}{}".format(
+            name, base[name]["best"], new[name]["best"], change, flag))
+
+    if regressions > 0:
+        print("\n{} benchmark(s) regressed by more than {}%".format(regressions, threshold))
+        sys.exit(1)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("run", "compare"):
+        usage()
+        sys.exit(1)
+
+    try:
+        if sys.argv[1] == "run":
+            run(sys.argv[2:])
+        else:
+            compare(sys.argv[2:])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import random
+import statistics
+import time
+
+import casinosim
+from casinobot import cards, player
+from casinobot.blackjack import hand_value
+from simulator import simulator, stats, strategy
+
+STRAT_FILE = "strats/strat.txt"
+
+# Options to construct every betting system in `casinosim.BETTING_SYSTEMS` with
+BET_OPTIONS = {
+    "none": "",
+    "simple": "bet=10",
+    "martingale": "starting-bet=10",
+    "idkmartingale": "starting-bet=10",
+    "fibonacci": "starting-bet=10",
+    "labouchere": "starting-bet=10,seq=1-2-3-5-8-3-2",
+    "fp": "stacks=3,levels=5,stack-multi=2.223,bet-multi=2.223",
+    "oscarsgrind": "starting-bet=10",
+}
+
+# Enough gold that flat betting never runs out during a benchmark
+BENCH_GOLD = 10 ** 12
+
+
+class Result:
+    """
+    Timings of one benchmark, reported as operations per second.
+    """
+
+    def __init__(self, name, unit, ops, times):
+        self.name = name
+        self.unit = unit
+        self.ops = ops
+        self.times = times
+
+    @property
+    def best(self):
+        return self.ops / min(self.times)
+
+    @property
+    def median(self):
+        return self.ops / statistics.median(self.times)
+
+    def to_dict(self):
+        return {
+            "unit": self.unit,
+            "ops": self.ops,
+            "best": self.best,
+            "median": self.median,
+            "times": self.times,
+        }
+
+
+def measure(name, unit, ops, fn, repeat, setup=None):
+    """
+    Times `fn` `repeat` times, each call performing `ops` operations.
+    `setup` is called (untimed) before every call, and its return value is passed to `fn`.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    return Result(name, unit, ops, times)
+
+
+def make_simulator(bet_system="simple", gold=BENCH_GOLD, target=0, seats=1):
+    """
+    Builds a `BlackjackSimulator` with `seats` identical players.
+    """
+    strat = strategy.BlackjackStrategy.from_file(STRAT_FILE)
+    players = []
+    for i in range(seats):
+        bet = casinosim.BETTING_SYSTEMS[bet_system].from_options(BET_OPTIONS[bet_system])
+        players.append(simulator.Player(strat, bet, BET_OPTIONS[bet_system], gold, target, str(i + 1)))
+    return simulator.BlackjackSimulator(players)
+
+
+def bench_engine(rounds, repeat):
+    bj = make_simulator()
+
+    def run(_):
+        bj.run(rounds)
+
+    return measure("engine.run", "rounds/s", rounds, run, repeat, setup=bj.reset)
+
+
+def bench_strategy(decisions, repeat):
+    strat = strategy.BlackjackStrategy.from_file(STRAT_FILE)
+    deck = cards.Deck()
+    deck.cards = deck.cards + deck.cards
+    # Pre-deal a mix of two and three card hands, so only the lookup is timed.
+    # Hands of 21 or more never reach the strategy in a real game.
+    situations = []
+    while len(situations) < 1000:
+        deck.shuffle()
+        hand = cards.Hand()
+        for card in deck.cards[:random.choice((2, 2, 2, 3))]:
+            hand.add_card(card)
+        if hand_value(hand) <= 20:
+            situations.append((deck.cards[-1].rank, hand))
+
+    def run(_):
+        get_strat = strat.get_strat
+        n = len(situations)
+        for i in range(decisions):
+            dealer, hand = situations[i % n]
+            get_strat(dealer, hand)
+
+    return measure("strategy.get_strat", "decisions/s", decisions, run, repeat)
+
+
+def bench_betting(name, steps, repeat):
+    bet = casinosim.BETTING_SYSTEMS[name].from_options(BET_OPTIONS[name])
+    pl = player.Player(-1, 'Bench')
+    pl.gold = BENCH_GOLD
+    # Same outcomes for every run: +1 win, -1 loss, 0 tie
+    outcomes = [random.choice((1, 1, -1, -1, -1, 0)) for _ in range(1000)]
+
+    def setup():
+        bet.set_player(pl)
+        bet.set_starting_gold(pl.gold)
+        bet.reset()
+
+    def run(_):
+        n = len(outcomes)
+        for i in range(steps):
+            bet.get_next_bet()
+            res = outcomes[i % n]
+            if res > 0:
+                bet.on_win(res)
+            elif res < 0:
+                bet.on_loss(-res)
+            else:
+                bet.on_tie()
+            if bet.end_reason is not None:
+                setup()
+
+    return measure("betting." + name, "steps/s", steps, run, repeat, setup=setup)
+
+
+def bench_deck(shuffles, repeat):
+    def shuffle(_):
+        for _ in range(shuffles):
+            deck = cards.Deck()
+            deck.cards = deck.cards + deck.cards
+            deck.shuffle()
+
+    def new_deck():
+        deck = cards.Deck()
+        deck.cards = deck.cards + deck.cards
+        deck.shuffle()
+        return [deck] + [cards.Deck() for _ in range(shuffles - 1)]
+
+    def deal(decks):
+        for deck in decks:
+            while deck.cards:
+                deck.deal_card()
+
+    # every deck but the first in `new_deck` is a single deck, count what is actually dealt
+    dealt = 104 + 52 * (shuffles - 1)
+    return [
+        measure("deck.shuffle", "shuffles/s", shuffles, shuffle, repeat),
+        measure("deck.deal_card", "cards/s", dealt, deal, repeat, setup=new_deck),
+    ]
+
+
+def bench_scaling(max_procs, iterations, rounds, repeat):
+    """
+    Weak scaling of the full multi-process run: `iterations` per process with 1 to `max_procs` processes.
+    """
+    bj = make_simulator()
+    results = []
+    for procs in range(1, max_procs + 1):
+        def run(_):
+            total_stats = [stats.BlackjackStats() for _ in bj.players]
+            casinosim.simulate(bj, iterations * procs, procs, rounds, total_stats)
+
+        results.append(measure("scaling.procs-{}".format(procs), "iterations/s",
+                               iterations * procs, run, repeat))
+    return results
+
+
+def bench_executors(max_procs, iterations, rounds, repeat):
+    """
+    The full run on 1 and `max_procs` workers as processes and as threads, `iterations` per worker.
+    Threads only run in parallel on a free-threaded build, with the GIL they take turns.
+    """
+    bj = make_simulator()
+    results = []
+    for executor in casinosim.EXECUTORS:
+        for workers in sorted({1, max_procs}):
+            def run(_):
+                total_stats = [stats.BlackjackStats() for _ in bj.players]
+                casinosim.simulate(bj, iterations * workers, workers, rounds, total_stats,
+                                   executor=executor, build=make_simulator)
+
+            results.append(measure("executor.{}-{}".format(executor, workers), "iterations/s",
+                                   iterations * workers, run, repeat))
+    return results
+
+
+def run_all(quick=False, max_procs=None, repeat=5, only=None, seed=1234):
+    """
+    Runs every benchmark (or those whose name starts with one of `only`), returning a list of `Result`s.
+    """
+    scale = 10 if quick else 1
+    if max_procs is None:
+        max_procs = casinosim.multiprocessing.cpu_count()
+
+    benches = [
+        ("engine", lambda: [bench_engine(20000 // scale, repeat)]),
+        ("strategy", lambda: [bench_strategy(200000 // scale, repeat)]),
+        ("betting", lambda: [bench_betting(name, 200000 // scale, repeat)
+                             for name in sorted(casinosim.BETTING_SYSTEMS.keys())]),
+        ("deck", lambda: bench_deck(2000 // scale, repeat)),
+        ("scaling", lambda: bench_scaling(max_procs, 200 // scale, 100, max(1, repeat // 2))),
+        ("executor", lambda: bench_executors(max_procs, 200 // scale, 100, max(1, repeat // 2))),
+    ]
+
+    results = []
+    for (name, bench) in benches:
+        if only and not any(name.startswith(o) or o.startswith(name) for o in only):
+            continue
+        # reseed per group, so every group sees the same hands and outcomes whatever else runs
+        random.seed(seed)
+        for res in bench():
+            if only and not any(res.name.startswith(o) for o in only):
+                continue
+            results.append(res)
+    return results
@@ -39,10 +39,28 @@ def hand_value(self):
     return value
 
 
+def bind_hand_value(hand):
+    # Add the hand_value function, once per hand object
+    if 'hand_value' not in hand.__dict__:
+        hand.hand_value = MethodType(hand_value, hand)
+
+
 class Game:
     # The main game object for blackjack
-    def __init__(self, phenny, uid, nick, hooks):
+    def __init__(self, phenny, uid, nick, hooks, keep_dealer=False):
         self.game_type = "blackjack"
+        self.phenny = phenny
+        self.hooks = hooks
+        # Keep the dealer in the player table after the game is over, so the next
+        # round (see `new_round`) reuses it instead of allocating a new one
+        self.keep_dealer = keep_dealer
+        # The shoe and its cards in order, built by the first `new_deck`
+        self.shoe = None
+
+        self.new_round(uid)
+
+    def new_round(self, uid):
+        # Sets the table up for a new game started by uid, reusing this object
         self.started = False
         self.deck = False
         self.accept_bets = False
@@ -54,23 +72,25 @@ class Game:
         self.timer_start = 0
         self.starter_uid = False
         self.turns = False  # The users who have turns, in order, current is at index 0
-        self.phenny = phenny
-
-        self.hooks = hooks
 
         p.remove_all_from_game()
 
-        p.add_player(0, 'Dealer')
-        p.players[0].hand.hand_value = MethodType(
-            hand_value, p.players[0].hand)
+        if 0 in p.players:
+            # A kept dealer, moved to the end of the table as a new one would be
+            dealer = p.players.pop(0)
+            dealer.reset()
+            dealer.name = 'Dealer'
+            p.players[0] = dealer
+        else:
+            p.add_player(0, 'Dealer')
+        bind_hand_value(p.players[0].hand)
         p.players[0].add_gold(1000000)
         self.starter_uid = uid
 
         self.phenny.say(
             "A new game of blackjack has begun! Type !enter if you'd like to play. You have 30 seconds to join.")
         self.phenny.say(p.add_to_game(self.phenny, uid))
-        p.players[uid].hand.hand_value = MethodType(
-            hand_value, p.players[uid].hand)
+        bind_hand_value(p.players[uid].hand)
 
         self.hooks.on_init(self)
 
@@ -80,8 +100,7 @@ class Game:
         if len(p.in_game) < 6 and uid not in p.in_game:
             msg = p.add_to_game(self.phenny, uid)
             # Add the hand_value function
-            p.players[uid].hand.hand_value = MethodType(
-                hand_value, p.players[uid].hand)
+            bind_hand_value(p.players[uid].hand)
             return msg
         elif uid in p.in_game:
             return "You have already joined the game!"
@@ -108,6 +127,18 @@ class Game:
 
         self.deal_cards()
 
+    def new_deck(self):
+        # Build the deck and shuffle it, reshuffling the same cards in later rounds
+        if self.shoe is None:
+            deck = c.Deck()
+            # We use 2 decks to give the house a better advantage
+            deck.cards = deck.cards + deck.cards
+            self.shoe = (deck, list(deck.cards))
+        deck, cards = self.shoe
+        deck.cards[:] = cards
+        deck.shuffle()
+        return deck
+
     def bet(self, uid, amount):
         self.phenny.say(p.players[uid].place_bet(amount))
 
@@ -116,11 +147,8 @@ class Game:
         # Stop betting
         self.accept_bets = False
 
-        # Build the deck and shuffle it
-        self.deck = c.Deck()
-        # We use 2 decks to give the house a better advantage
-        self.deck.cards = self.deck.cards + self.deck.cards
-        self.deck.shuffle()
+        # The hooks may provide their own shoe, e.g. for importance sampling
+        self.deck = self.hooks.new_deck(self)
 
         # Deal the cards to the players
         self.phenny.say("The Dealer begins dealing...")
@@ -214,7 +242,7 @@ class Game:
             self.game_over()  # All players already lost
             return
         # Start by reversing the in-game list as the dealer starts on their left
-        p.in_game = p.in_game[::-1]
+        p.in_game.reverse()
 
         # Hit or stand? Keep asking until the user stands or busts
         self.turns = p.in_game[:]
@@ -461,7 +489,8 @@ class Game:
         self.hooks.on_game_over(self)
 
         del p.in_game[:]
-        del p.players[0]
+        if not self.keep_dealer:
+            del p.players[0]
         if self.t and self.t.is_alive():
             self.t.cancel()
             self.t = False
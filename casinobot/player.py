@@ -34,6 +34,30 @@ class Player:
         self.surrender_streak_max = 0
         self.hooks = None
 
+    def reset(self):
+        # Puts the player back to a new player's state, keeping its hand object
+        self.gold = 0
+        self.bet = 0
+        self.hand.empty_hand()
+        self.in_game = False
+        self.did_doubledown = False
+        self.wins = 0
+        self.nats = 0
+        self.losses = 0
+        self.ties = 0
+        self.splits = 0
+        self.surrenders = 0
+        self.natlosses = 0
+        self.losing_streak = 0
+        self.losing_streak_max = 0
+        self.winning_streak = 0
+        self.winning_streak_max = 0
+        self.tie_streak = 0
+        self.tie_streak_max = 0
+        self.surrender_streak = 0
+        self.surrender_streak_max = 0
+        self.hooks = None
+
     def __str__(self):
         string = "Player ID: %s  Name: %s  Gold: %d  Wins: %d  Losses: %d" % (
             self.uid, self.name, self.gold, self.wins, self.losses)
@@ -1,41 +1,96 @@
 import getopt
 import math
 import multiprocessing
-import statistics
+import os
+import queue
+import shutil
 import sys
+import tempfile
+import threading
 import time
 
-from simulator import betting, simulator, stats, strategy
+from simulator import (betting, cache, checkpoints, crn, history, importance, intervals, passage, paths, placement,
+                       profiling, progress, records, runner, shared, stratified, threaded, warehouse)
 
-BETTING_SYSTEMS = {
-    "none": betting.NoBetting,
-    "martingale": betting.Martingale,
-    "idkmartingale": betting.IdkMartingale,
-    "fp": betting.FPBetting,
-    "fibonacci": betting.Fibonacci,
-    "labouchere": betting.Labouchere,
-    "simple": betting.SimpleBetting,
-    "oscarsgrind": betting.OscarsGrind
-}
+BETTING_SYSTEMS = betting.BETTING_SYSTEMS
+
+# Iterations run with --time-limit and no --iterations, far more than fit in any time limit
+TIME_LIMIT_ITERATIONS = 2 ** 40
+
+# What `simulate` runs the workers on
+EXECUTORS = ["processes", "threads"]
+
+# Seconds `simulate` waits for results before checking that no worker died
+WORKER_POLL = 1.0
 
 
 HELP_GENERAL = [
     (['-h', '--help'], ['print this help']),
-    (['-v', '--verbose'], ['print a LOT of extra info']),
+    (['-v', '--verbose'], ['print a LOT of extra info: every message, bet and', 'decision of every round']),
     (['-f', '--out-file'], ['output the results to a file']),
+    (['    --profile'], ['run every process under cProfile and report', 'the merged hotspots']),
+    (['    --profile-phases'],
+     ['time the deal, decisions, dealer, settlement,', 'betting and aggregation phases']),
+    (['    --profile-memory'], ['report peak memory of every process (tracemalloc)']),
+    (['    --profile-dump=FILE'],
+     ['write the profile as JSON to FILE and the merged', 'cProfile stats to FILE with a .prof extension']),
 ]
 
 
 HELP_SIMULATOR = [
-    (['-s', '--strat=FILE'], ['playing strategy file to use (default "strats/strat.txt")']),
+    (['-s', '--strat=FILE'], ['playing strategy file to use (default "strats/strat.txt"),',
+                          'once for all players or once per player']),
     (['-i', '--iterations=ITS'],
      ['how many times to run the simulation until', 'an end condition is reached (default 1)']),
+    (['    --time-limit=TIME'], ['run iterations until TIME is up (like "600", "10m"',
+                              'or "1h") instead, at most --iterations if given']),
     (['-g', '--gold=GOLD'], ['total gold to start with, or 0 to disable gold',
                              'completely (default 0)']),
     (['    --threads'],
      ['how many processes to run the simulation on (default 0 = auto)']),
+    (['    --executor=EXECUTOR'], ['"processes" (default) or "threads", which play in',
+                                'parallel on free-threaded Python 3.13+ builds only', '(processes are used otherwise)']),
     (['    --anti-fallacy'],
-     ['enable anti-fallacy strat (after a loss, bet 0 until a win, repeat)'])
+     ['enable anti-fallacy strat (after a loss, bet 0 until a win, repeat)']),
+    (['    --compare=FILE'], ['compare strategy FILE against --strat, both', 'playing the same cards (repeatable)']),
+    (['    --stratify=ROUNDS'], ['estimate the EV per round of --strat with a flat',
+                              'bet from ROUNDS rounds stratified by player hand', 'and dealer cards, then exit']),
+    (['    --allocation=MODE'], ['"neyman" (default) or "proportional" rounds per', 'stratum for --stratify']),
+    (['    --seed=SEED'], ['seed the cards, iteration N always plays the same', 'cards for the same seed']),
+    (['    --cache'], ['reuse cached results of the same configuration, only',
+                     'running iterations beyond the cached ones (seed 0', 'unless --seed is given)']),
+    (['    --cache-dir=DIR'], ['cache directory (default "~/.cache/casinosim"),', 'implies --cache']),
+    (['    --cache-size=MB'], ['evict least recently used results beyond this', 'size (default 64)']),
+    (['    --store'], ['save the configuration, results, timings and code',
+                     'version into the results database (see results.py)']),
+    (['    --db=FILE'], ['results database (default',
+                       '"~/.cache/casinosim/results.db"), implies --store']),
+    (['    --records=DIR'],
+     ['write per-iteration results as columnar shards', 'into DIR (one shard per process)']),
+    (['    --paths=DIR'],
+     ['record every player\'s gold after every round,', 'downsampled, into memory-mapped files in DIR']),
+    (['    --path-points=N'], ['points kept per player and iteration (default 64,', 'at most 65535)']),
+    (['    --trace=DIR'],
+     ['write hand histories of some rounds into DIR (one', 'binary file per process), see histories.py']),
+    (['    --trace-every=N'], ['trace 1 in N rounds (default 1000 without', '--trace-on)']),
+    (['    --trace-on=CONDS'], ['trace rounds with a "split", a "loss=X" of more',
+                            'than X gold, or before "ruin", like "split,ruin"']),
+    (['    --tilt=TILT'], ['importance sampling: deal more high (> 0) or low',
+                         '(< 0) cards and estimate the probability of', '--rare-event from the reweighted iterations']),
+    (['    --rare-event=EVENT'], ['"ruin" (default) or "target"']),
+    (['    --ci'], ['report 95% confidence intervals of every metric,',
+                  'by batch means over the processes\' batches']),
+    (['    --batches=N'], ['batches to split the iterations into for --ci', '(default 64)']),
+    (['    --affinity=MODE'], ['pin every process to its own CPU: "physical" uses',
+                            'one CPU per core, "logical" every CPU, "none"',
+                            'leaves it to the OS; reports iterations/s of', 'every process']),
+    (['    --cpus=LIST'], ['CPUs to place processes on, like "0-7,16"', '(default: all usable)']),
+    (['    --progress'],
+     ['show a live line with iterations/s, rounds/s,', 'ETA and ruin probability']),
+    (['    --progress-interval=SECS'],
+     ['how often to read the progress of the processes', '(default 1)']),
+    (['    --metrics-file=FILE'],
+     ['append every progress sample to FILE as JSON lines'])
 ]
 
 
@@ -50,11 +105,14 @@ HELP_BETTING = [
 
 HELP_CONDITIONS = [
     (['-r', '--rounds=ROUNDS'], ['maximum number of rounds to run']),
+    (['    --checkpoints=LIST'], ['snapshot end reasons and gold after every round of',
+                               'LIST (like "100,500" or "100:1000:100"), playing', 'to the last one']),
     (['-t', '--target=GOLD'], ['target gold amount to reach']),
+    (['    --targets=LIST'], ['play to the highest of LIST (like "1100,1500" or',
+                           '"1100:2000:100") and report the probability of',
+                           'reaching every target before the iteration ended']),
 ]
 
-players = []
-
 
 def print_help_thing(thing):
     """
@@ -87,26 +145,232 @@ def usage(file):
     print("  {}".format(", ".join(sorted(BETTING_SYSTEMS.keys()))))
 
 
-def worker(num, iterations, outq, bj, rounds, gold, players):
-    total_stats = []
-    reasons = []
-    for i, _ in enumerate(players):
-        total_stats.append(stats.BlackjackStats())
-        total_stats[i].gold_min = gold[i]
-        reasons.append({})
-    for _ in range(iterations):
+class WorkerOptions:
+    """
+    What every worker process does besides playing: seeding, records, paths, profiling
+    and importance sampling.
+    """
+
+    def __init__(self):
+        self.seed = None
+        self.records_dir = None
+        self.paths_dir = None
+        self.path_points = paths.DEFAULT_POINTS
+        self.profile = None
+        # with a tilt, cards are dealt by an `importance.ImportanceSampler`
+        self.tilt = None
+        self.rare_event = "ruin"
+        # how to pin workers to CPUs, see `placement.plan`
+        self.placement = "none"
+        self.cpus = None
+        # with targets, the first passage of every one is counted, see `passage.FirstPassage`
+        self.targets = None
+        # rounds to snapshot the players at, see `checkpoints.Checkpoints`
+        self.checkpoints = None
+        # with more than one batch, results are kept per batch for `intervals`
+        self.batches = 1
+        # hand histories of the rounds matching `history_conditions` go into this directory
+        self.history_dir = None
+        self.history_conditions = None
+        # with a time limit in seconds, workers stop at the `deadline` (a `time.time()`) `simulate` sets
+        self.time_limit = None
+        self.deadline = None
+
+
+def worker(num, iterations, outq, bj, rounds, options, results, first=0, cpu=None):
+    placement.pin(cpu)
+    deadline = options.deadline
+    slot = results.slot(num, iterations, deadline)
+    profiler = None
+    timer = None
+    if options.profile is not None:
+        profiler = profiling.WorkerProfiler(num, options.profile)
+        timer = profiler.timer
+        profiler.start()
+    writer = None
+    if options.records_dir is not None:
+        writer = records.RecordWriter(options.records_dir, num)
+    recorder = None
+    if options.paths_dir is not None:
+        recorder = paths.PathRecorder(options.paths_dir, num, iterations, len(bj.players), options.path_points)
+        bj.set_recorder(recorder)
+    sampler = None
+    tally = None
+    if options.tilt is not None:
+        sampler = importance.ImportanceSampler(options.tilt)
+        tally = importance.ImportanceTally(len(bj.players), options.rare_event)
+        bj.set_sampler(sampler)
+    first_passage = None
+    if options.targets is not None:
+        first_passage = passage.FirstPassage(options.targets, len(bj.players))
+    snapshots = None
+    if options.checkpoints is not None:
+        snapshots = checkpoints.Checkpoints(options.checkpoints, len(bj.players))
+        bj.set_checkpoints(snapshots)
+    tracer = None
+    if options.history_dir is not None:
+        tracer = history.HistoryWriter(options.history_dir, num, options.history_conditions, first)
+        bj.set_tracer(tracer)
+    start = time.perf_counter()
+    done = 0
+    rounds_played = 0
+    for it in range(iterations):
+        # an iteration in progress always finishes, cutting it short would change its end reason
+        if deadline is not None and time.time() >= deadline:
+            break
+        if options.seed is not None:
+            runner.seed_iteration(options.seed, first + it)
         bj.reset()
         pls = bj.run(rounds)
 
-        for i, pl in enumerate(pls):
-            total_stats[i].add(pl.stats)
-            reason = pl.end_reason
-            if reason not in reasons[i]:
-                reasons[i][reason] = {"count": 0, "gold_end": [], "hands": []}
-            reasons[i][reason]["count"] += 1
-            reasons[i][reason]["gold_end"].append(pl.stats.gold_end)
-            reasons[i][reason]["hands"].append(pl.stats.total_hands)
-    outq.put((reasons, total_stats))
+        if timer is not None:
+            timer.enter("aggregation")
+        slot.add_iteration(pls, bj.rounds_played)
+        if writer is not None:
+            for i, pl in enumerate(pls):
+                writer.add(i, pl)
+        if tally is not None:
+            tally.add(sampler.weight(), pls)
+        if first_passage is not None:
+            first_passage.add(pls)
+        if timer is not None:
+            timer.exit()
+        done += 1
+        rounds_played += bj.rounds_played
+
+    elapsed = time.perf_counter() - start
+
+    # everything besides reasons and stats, by the key `simulate` collects it under
+    outputs = {"timings": {"worker": num, "cpu": cpu, "iterations": done, "rounds": rounds_played,
+                           "elapsed": elapsed}}
+    if writer is not None:
+        outputs["shards"] = writer.close()
+    if recorder is not None:
+        outputs["paths"] = recorder.close()
+    if tally is not None:
+        outputs["importance"] = tally
+    if first_passage is not None:
+        outputs["passage"] = first_passage
+    if snapshots is not None:
+        outputs["checkpoints"] = snapshots
+    if tracer is not None:
+        outputs["histories"] = tracer.close()
+    if profiler is not None:
+        outputs["reports"] = profiler.stop()
+    outq.put(("result", num, slot.other_reasons, outputs))
+
+
+def thread_worker(num, iterations, outq, build, rounds, options, results, first=0, cpu=None):
+    # the simulator is built on its thread, so its seats are in that thread's table
+    worker(num, iterations, outq, build(), rounds, options, results, first, cpu)
+
+
+def simulate(bj, iterations, threads, rounds, total_stats, options=None, monitor=None, first=0,
+             progress_interval=1.0, executor="processes", build=None):
+    """
+    Runs `iterations` of the simulator `bj`, split over `threads` processes, as set up by
+    `options` (a `WorkerOptions`). With a seed, these are iterations `first` to
+    `first + iterations - 1` of the seeded run.
+
+    With the "threads" `executor`, they are threads of this process instead, each playing
+    on a simulator of its own from `build()` with its own table and random number
+    generator (see `threaded.install`). They only run in parallel on free-threaded builds.
+
+    Processes add their results into their slot of a `shared.SharedResults`, which are merged
+    into `total_stats` (one `BlackjackStats` per player) once all are done. Returns the merged
+    compact end reasons per player (see `runner.compact_reasons`), and a dict with the lists of
+    everything else the processes returned: "timings", "shards" of records, "paths" shards,
+    profile "reports", "importance" tallies, "passage" counts, "checkpoints", "histories" files and, with
+    `options.batches` above 1, the "batches" of `SharedResults.batches_done`.
+    With a `progress.ProgressMonitor` as `monitor`, the slots are read into it every
+    `progress_interval` seconds. With `options.time_limit`, `iterations` is only a cap and
+    the processes stop once the time is up; the "timings" have the iterations they did.
+    """
+    if options is None:
+        options = WorkerOptions()
+    chunks = runner.split_iterations(iterations, int(math.ceil(iterations / float(threads))), first)
+    batches = int(math.ceil(options.batches / float(len(chunks))))
+    if executor not in EXECUTORS:
+        raise ValueError("Invalid executor '{}', use one of: {}".format(executor, ", ".join(EXECUTORS)))
+    if executor == "threads" and build is None:
+        raise ValueError("The threads executor needs `build` to create a simulator per thread")
+    results = shared.SharedResults(len(chunks), [pl.starting_gold for pl in bj.players], batches)
+    if executor == "threads":
+        threaded.install()
+        out_q = queue.Queue()
+    else:
+        out_q = multiprocessing.Queue()
+    procs = []
+    if monitor is not None:
+        monitor.iterations = iterations
+
+    cpus = placement.plan(len(chunks), options.placement, options.cpus)
+    if options.time_limit is not None:
+        options.deadline = time.time() + options.time_limit
+    for i, (its, start) in enumerate(chunks):
+        if executor == "threads":
+            p = threading.Thread(target=thread_worker, daemon=True,
+                                 args=(i, its, out_q, build, rounds, options, results, start, cpus[i]))
+        else:
+            p = multiprocessing.Process(target=worker,
+                                        args=(i, its, out_q, bj, rounds, options, results, start, cpus[i]))
+        procs.append(p)
+        p.start()
+
+    other_reasons = []
+    outputs = {"timings": [], "shards": [], "paths": [], "reports": [], "importance": [], "passage": [],
+               "checkpoints": [], "histories": []}
+    reported = set()
+    failed = True
+    try:
+        while len(reported) < len(procs):
+            try:
+                msg = out_q.get(timeout=progress_interval if monitor is not None else WORKER_POLL)
+            except queue.Empty:
+                msg = None
+            if monitor is not None:
+                for num in range(len(procs)):
+                    monitor.update(num, *results.progress(num))
+                monitor.publish()
+            if msg is None:
+                dead = [num for num, p in enumerate(procs) if num not in reported and not p.is_alive()]
+                if not dead:
+                    continue
+                # a worker puts its results before it exits, so they may have only just arrived
+                try:
+                    msg = out_q.get(timeout=WORKER_POLL)
+                except queue.Empty:
+                    raise RuntimeError("Worker {} stopped without its results{}".format(
+                        dead[0], "" if executor == "threads" else " (exit code {})".format(procs[dead[0]].exitcode)))
+            (_, num, reasons, worker_outputs) = msg
+            reported.add(num)
+            if "reports" in worker_outputs:
+                worker_outputs["reports"]["ipc"] = time.time() - worker_outputs["reports"]["sent"]
+            for key, value in worker_outputs.items():
+                outputs[key].append(value)
+            runner.add_compact_reasons(other_reasons, reasons)
+
+        for p in procs:
+            p.join()
+
+        total_reasons, merged = results.reduce()
+        if options.batches > 1:
+            outputs["batches"] = results.batches_done()
+        failed = False
+    finally:
+        if failed and executor != "threads":
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+        results.close()
+        if executor == "threads":
+            threaded.uninstall()
+
+    runner.add_compact_reasons(total_reasons, other_reasons)
+    for i, pl_stats in enumerate(total_stats):
+        pl_stats.add(merged[i])
+    return total_reasons, outputs
 
 
 def main():
@@ -116,7 +380,11 @@ def main():
 
     try:
         opts, _ = getopt.getopt(sys.argv[1:], "hvf:s:i:g:b:o:pr:t:", [
-            "help", "verbose", "threads=", "out-file=", "strat=", "iterations=", "gold=", "bet-system=", "bet-options=", "positive-prog", "list-bet-systems", "rounds=", "target=", "anti-fallacy"])
+            "help", "verbose", "threads=", "executor=", "out-file=", "strat=", "iterations=", "gold=", "bet-system=", "bet-options=", "positive-prog", "list-bet-systems", "rounds=", "target=", "targets=", "checkpoints=", "anti-fallacy", "records=", "paths=", "path-points=", "tilt=", "rare-event=", "compare=", "affinity=", "cpus=", "ci", "batches=", "stratify=", "allocation=", "time-limit=",
+            "trace=", "trace-every=", "trace-on=",
+            "profile", "profile-phases", "profile-memory", "profile-dump=",
+            "progress", "progress-interval=", "metrics-file=",
+            "seed=", "cache", "cache-dir=", "cache-size=", "store", "db="])
     except getopt.GetoptError as err:
         print(err)
         usage(sys.argv[0])
@@ -137,8 +405,10 @@ def main():
 
     # Default options
     iterations = 1
+    iterations_given = False
+    time_limit = None
     starting_golds = []
-    strat_file = "strats/strat.txt"
+    strat_files = []
 
     bet_system_names = []
     bet_options = []
@@ -147,9 +417,42 @@ def main():
 
     # End conditions, at least one should be enabled
     target_gold = []
+    passage_targets = None
     rounds = 0
+    checkpoint_rounds = None
 
     threads = 0
+    executor = "processes"
+    records_dir = None
+    paths_dir = None
+    path_points = paths.DEFAULT_POINTS
+    trace_dir = None
+    trace_every = None
+    trace_conditions = None
+    tilt = None
+    rare_event = "ruin"
+    compare_files = []
+    affinity = None
+    cpus = None
+    ci = False
+    batches = 64
+    stratify_rounds = None
+    allocation = "neyman"
+    profile = None
+    profile_dump = None
+    show_progress = False
+    progress_interval = 1.0
+    metrics_file = None
+    seed = None
+    cache_dir = None
+    cache_size = cache.DEFAULT_MAX_BYTES
+    db_path = None
+
+    def profile_options():
+        nonlocal profile
+        if profile is None:
+            profile = profiling.ProfileOptions(cprofile=False)
+        return profile
 
     for o, a in opts:
         if o in ('-v', '--verbose'):
@@ -159,10 +462,12 @@ def main():
             sys.exit()
         elif o == '--threads':
             threads = int(a)
+        elif o == '--executor':
+            executor = a
         elif o in ('-f', '--out-file'):
             out_file = open(a, mode='w')
         elif o in ('-s', '--strat'):
-            strat_file = a
+            strat_files.append(a)
         elif o in ('-b', '--bet-system'):
             bet_system_names.append(a)
         elif o in ('-o', '--bet-options'):
@@ -175,17 +480,134 @@ def main():
             sys.exit()
         elif o in ('-i', '--iterations'):
             iterations = int(a)
+            iterations_given = True
+        elif o == '--time-limit':
+            try:
+                time_limit = runner.parse_duration(a)
+            except ValueError as err:
+                just_print("Invalid --time-limit:", err)
+                sys.exit(1)
         elif o in ('-r', '--rounds'):
             rounds = int(a)
         elif o in ('-g', '--gold'):
             starting_golds.append(int(a))
         elif o in ('-t', '--target'):
             target_gold.append(int(a))
+        elif o == '--checkpoints':
+            try:
+                checkpoint_rounds = passage.parse_targets(a)
+            except ValueError as err:
+                just_print("Invalid --checkpoints:", err)
+                sys.exit(1)
+        elif o == '--targets':
+            try:
+                passage_targets = passage.parse_targets(a)
+            except ValueError as err:
+                just_print("Invalid --targets:", err)
+                sys.exit(1)
         elif o == '--anti-fallacy':
             bet_anti_fallacy = True
+        elif o == '--records':
+            records_dir = a
+        elif o == '--paths':
+            paths_dir = a
+        elif o == '--path-points':
+            path_points = int(a)
+        elif o == '--trace':
+            trace_dir = a
+        elif o == '--trace-every':
+            trace_every = int(a)
+        elif o == '--trace-on':
+            try:
+                trace_conditions = history.parse_conditions(a)
+            except ValueError as err:
+                just_print("Invalid --trace-on:", err)
+                sys.exit(1)
+        elif o == '--tilt':
+            tilt = float(a)
+        elif o == '--rare-event':
+            rare_event = a
+        elif o == '--compare':
+            compare_files.append(a)
+        elif o == '--affinity':
+            affinity = a
+        elif o == '--cpus':
+            cpus = placement.parse_cpu_list(a)
+        elif o == '--stratify':
+            stratify_rounds = int(a)
+        elif o == '--allocation':
+            allocation = a
+        elif o == '--ci':
+            ci = True
+        elif o == '--batches':
+            batches = int(a)
+        elif o == '--profile':
+            profile_options().cprofile = True
+        elif o == '--profile-phases':
+            profile_options().phases = True
+        elif o == '--profile-memory':
+            profile_options().memory = True
+        elif o == '--profile-dump':
+            profile_dump = a
+        elif o == '--progress':
+            show_progress = True
+        elif o == '--progress-interval':
+            progress_interval = float(a)
+        elif o == '--metrics-file':
+            metrics_file = a
+        elif o == '--seed':
+            seed = int(a)
+        elif o == '--cache':
+            cache_dir = cache_dir or cache.DEFAULT_DIR
+        elif o == '--cache-dir':
+            cache_dir = a
+        elif o == '--cache-size':
+            cache_size = int(float(a) * 1024 * 1024)
+        elif o == '--store':
+            db_path = db_path or warehouse.DEFAULT_PATH
+        elif o == '--db':
+            db_path = a
         else:
             assert False, "unhandled option"
 
+    if not strat_files:
+        strat_files = [runner.DEFAULT_STRAT]
+    strat_file = strat_files[0]
+
+    if executor not in EXECUTORS:
+        just_print("Invalid executor '{}', use one of:".format(executor), ", ".join(EXECUTORS))
+        sys.exit(1)
+    if executor == "threads" and (stratify_rounds is not None or compare_files or profile is not None
+                                or profile_dump is not None):
+        just_print("--executor=threads can't be used with --stratify, --compare or --profile")
+        sys.exit(1)
+    if executor == "threads" and not threaded.free_threaded():
+        # with the GIL, threads would take turns playing on a single core
+        just_print("This Python runs one thread at a time (the GIL is enabled), using processes instead of threads")
+        executor = "processes"
+    workers = "threads" if executor == "threads" else "processes"
+
+    if stratify_rounds is not None:
+        # strategy EV only, no players or end conditions needed
+        if len(strat_files) > 1:
+            just_print("--stratify estimates a single --strat")
+            sys.exit(1)
+        if allocation not in stratified.ALLOCATIONS:
+            just_print("Invalid allocation '{}', use one of:".format(allocation), ", ".join(stratified.ALLOCATIONS))
+            sys.exit(1)
+        if threads == 0:
+            threads = multiprocessing.cpu_count()
+        just_print("Estimating the EV of {} from {:,} stratified rounds using {} processes...".format(
+            strat_file, stratify_rounds, threads))
+        start = time.perf_counter()
+        estimate = stratified.estimate(strat_file, stratify_rounds, threads, allocation, seed=seed)
+        just_print("Completed in {:.2f}s".format(time.perf_counter() - start))
+        just_print()
+        estimate.print(strat_file, just_print)
+        if out_file is not None:
+            out_file.close()
+        return
+
     if not (len(bet_system_names) == len(starting_golds)):
         just_print('You must have an equal amount of --bet-system and --gold')
         sys.exit(1)
@@ -206,11 +628,126 @@ def main():
         just_print("gold required to use a betting system")
         sys.exit(1)
 
+    if len(strat_files) not in (1, playernum):
+        just_print("You must give one --strat for all players, or one per player")
+        sys.exit(1)
+
+    if compare_files and len(strat_files) > 1:
+        just_print("--compare needs a single --strat, played by every player")
+        sys.exit(1)
+
+    if passage_targets is not None:
+        if len(passage_targets) == 0:
+            just_print("--targets needs at least one target")
+            sys.exit(1)
+        if len(target_gold) > 0:
+            just_print("--targets can't be used with --target, it plays to the highest of its targets")
+            sys.exit(1)
+        if tilt is not None or cache_dir is not None or compare_files:
+            just_print("--targets can't be used with --tilt, --compare or the result cache")
+            sys.exit(1)
+        target_gold = [passage_targets[-1]]
+
+    if checkpoint_rounds is not None:
+        if len(checkpoint_rounds) == 0 or checkpoint_rounds[0] < 1:
+            just_print("--checkpoints needs rounds of at least 1")
+            sys.exit(1)
+        if rounds > 0 and rounds < checkpoint_rounds[-1]:
+            just_print("--rounds can't be lower than the last of --checkpoints")
+            sys.exit(1)
+        if cache_dir is not None or compare_files:
+            just_print("--checkpoints can't be used with --compare or the result cache")
+            sys.exit(1)
+        if rounds == 0:
+            rounds = checkpoint_rounds[-1]
+
     if len(target_gold) == 0 and rounds == 0:
         just_print(
             "At least one end condition (--target or --rounds) needs to be enabled.")
         sys.exit(1)
 
+    if rare_event not in importance.EVENTS:
+        just_print("Invalid rare event '{}', use one of:".format(rare_event), ", ".join(importance.EVENTS))
+        sys.exit(1)
+
+    if affinity is not None and affinity not in placement.MODES:
+        just_print("Invalid affinity '{}', use one of:".format(affinity), ", ".join(placement.MODES))
+        sys.exit(1)
+    if affinity not in (None, "none") and not placement.supported():
+        just_print("CPU affinity is not supported on this platform, leaving placement to the OS")
+        affinity = "none"
+
+    if cpus is not None:
+        unavailable = sorted(set(cpus) - set(placement.logical_cpus()))
+        if not cpus or unavailable:
+            just_print("--cpus needs CPUs this process may run on, out of: {}".format(
+                ",".join(str(c) for c in placement.logical_cpus())))
+            sys.exit(1)
+
+    if compare_files and (tilt is not None or cache_dir is not None):
+        just_print("--compare can't be used with --tilt or the result cache")
+        sys.exit(1)
+
+    if db_path is not None and (tilt is not None or compare_files):
+        just_print("--store can't be used with --tilt or --compare")
+        sys.exit(1)
+
+    if tilt is not None and cache_dir is not None:
+        just_print("--tilt can't be used with the result cache")
+        sys.exit(1)
+
+    if ci and (cache_dir is not None or compare_files):
+        just_print("--ci can't be used with --compare or the result cache")
+        sys.exit(1)
+
+    if time_limit is not None and (cache_dir is not None or compare_files or paths_dir is not None):
+        just_print("--time-limit can't be used with --compare, --paths or the result cache")
+        sys.exit(1)
+
+    if time_limit is not None and not iterations_given:
+        # no cap besides the time, every process gets a share it won't finish
+        iterations = TIME_LIMIT_ITERATIONS
+
+    if ci and batches < 2:
+        just_print("--batches needs to be at least 2")
+        sys.exit(1)
+
+    if not 2 <= path_points <= paths.MAX_POINTS:
+        just_print("--path-points needs to be between 2 and {:,}".format(paths.MAX_POINTS))
+        sys.exit(1)
+
+    if trace_dir is not None:
+        if trace_every is not None and trace_every < 1:
+            just_print("--trace-every needs to be at least 1")
+            sys.exit(1)
+        if trace_conditions is None:
+            trace_conditions = history.Conditions()
+            if trace_every is None:
+                trace_every = history.DEFAULT_EVERY
+        trace_conditions.every = trace_every or 0
+    elif trace_every is not None or trace_conditions is not None:
+        just_print("--trace-every and --trace-on need --trace")
+        sys.exit(1)
+
+    def player_target(i):
+        # a single target applies to every player
+        if len(target_gold) >= playernum:
+            return target_gold[i]
+        elif len(target_gold) > 0:
+            return target_gold[0]
+        return 0
+
+    def player_strat(i):
+        # a single strategy file applies to every player
+        return strat_files[i] if len(strat_files) > 1 else strat_file
+
+    # a single file as before, or one per player
+    strat_info = strat_file if len(strat_files) == 1 else strat_files
+
+    if threads == 0 and affinity == "physical":
+        threads = len(placement.physical_cpus(cpus))
+    elif threads == 0 and affinity == "logical":
+        threads = len(cpus or placement.logical_cpus())
     if threads == 0:
         threads = multiprocessing.cpu_count()
 
@@ -219,12 +756,24 @@ def main():
         threads = iterations
 
     just_print("Casino Simulator 9000!")
-    just_print("Using strat file:", strat_file)
+    if len(strat_files) == 1:
+        just_print("Using strat file:", strat_file)
+    else:
+        just_print("Using strat files:", strat_files)
     just_print("Using betting system:", bet_system_names)
     just_print("  with options:", bet_options)
     if bet_anti_fallacy:
         just_print("Using anti-fallacy strategy")
     just_print("Players: " + str(playernum))
+    if records_dir is not None:
+        just_print("Writing per-iteration records to:", records_dir)
+        os.makedirs(records_dir, exist_ok=True)
+    if paths_dir is not None:
+        just_print("Recording bankroll paths to:", paths_dir)
+        os.makedirs(paths_dir, exist_ok=True)
+    if trace_dir is not None:
+        just_print("Writing hand histories to:", trace_dir)
+        os.makedirs(trace_dir, exist_ok=True)
 
     # if len(starting_golds) > 0:
     #     just_print()
@@ -235,96 +784,230 @@ def main():
 
     just_print("{:.<16}{:.>20,}".format("Max rounds", rounds))
 
-    just_print()
-    just_print("Running {0} iterations of blackjack using {1} processes...".format(
-        iterations, threads))
-
-    total_reasons = []
-
-    def add_reasons(many_reasons):
-        for i, reas in enumerate(many_reasons):
-            total_reasons.append({})
-            for reason in reas.keys():
-                if reason not in total_reasons[i]:
-                    total_reasons[i][reason] = reas[reason]
-                else:
-                    total_reasons[i][reason]["count"] += reas[reason]["count"]
-                    total_reasons[i][reason]["gold_end"].extend(
-                        reas[reason]["gold_end"])
-                    total_reasons[i][reason]["hands"].extend(reas[reason]["hands"])
-
-    out_q = multiprocessing.Queue()
-    procs = []
-    chunksize = int(math.ceil(iterations / float(threads)))
-
-    bet_systems = [BETTING_SYSTEMS[name].from_options(bet_options[i]) for i, name in enumerate(bet_system_names)]
-
-    strat = strategy.BlackjackStrategy.from_file(strat_file)
+    if cache_dir is not None and seed is None:
+        seed = 0
+    if seed is not None:
+        just_print("Using seed:", seed)
+
+    scenario = runner.Scenario([], iterations, rounds, bet_anti_fallacy, bet_positive_prog, seed=seed)
+    for i, name in enumerate(bet_system_names):
+        scenario.players.append(runner.PlayerConfig(
+            name, bet_options[i] if i < len(bet_options) else "", starting_golds[i],
+            player_target(i), player_strat(i)))
+
+    if compare_files:
+        if seed is None:
+            seed = scenario.seed = 0
+            just_print("Using seed:", seed)
+        just_print()
+        just_print("Comparing {} strategies on the same cards over {} iterations using {} processes...".format(
+            len(compare_files) + 1, iterations, threads))
+        start = time.perf_counter()
+        comparison = crn.compare(scenario, [strat_file] + compare_files, threads)
+        just_print("Completed in {:.2f}s".format(time.perf_counter() - start))
+        just_print()
+        comparison.print(just_print)
+        if out_file is not None:
+            out_file.close()
+        return
 
     # Track stats over all iterations my merging each iteration's
     # own stats instance with this one
-    total_stats = []
-    for i in range(playernum):
-        players.append(simulator.Player(strat, bet_systems[i], bet_options[i], starting_golds[i], target_gold[i], str(i + 1)))
-        total_stats.append(stats.BlackjackStats())
-        total_stats[i].gold_start = starting_golds[i]
-        total_stats[i].gold_min = starting_golds[i]
-        if len(target_gold) >= playernum:
-            total_stats[i].gold_target = target_gold[i]
-        else:
-            total_stats[i].gold_target = target_gold[0]
+    result = cache.CachedResult(0, [], scenario.new_stats())
+    result_cache = None
+    if cache_dir is not None:
+        result_cache = cache.ResultCache(cache_dir, cache_size)
+        cached = result_cache.get(scenario)
+        if cached is not None:
+            just_print("Found {:,} cached iterations".format(cached.iterations))
+            result = cached
+
+    # Only the iterations beyond the cached ones need to run
+    to_run = max(0, iterations - result.iterations)
+    threads = min(threads, to_run)
 
-    bj = simulator.BlackjackSimulator(players)
-    bj.set_anti_fallacy(bet_anti_fallacy)
-    bj.set_positive_prog(bet_positive_prog)
-    bj.set_target_gold(target_gold[0])
+    just_print()
+    if to_run > 0 and time_limit is not None:
+        just_print("Running blackjack for {:,.0f}s using {} {}...".format(time_limit, threads, workers))
+    elif to_run > 0:
+        just_print("Running {0} iterations of blackjack using {1} {2}...".format(
+            to_run, threads, workers))
 
     start = time.perf_counter()
-    # threads = 1
-    for i in range(threads):
-        p = multiprocessing.Process(
-            target=worker,
-            args=(i, chunksize, out_q, bj, rounds, starting_golds, players))
-        procs.append(p)
-        p.start()
-
-    for _ in range(threads):
-        (reasons, st) = out_q.get()
-        add_reasons(reasons)
-        for i in range(playernum):
-            total_stats[i].add(st[i])
-
-    for p in procs:
-        p.join()
+    if profile_dump is not None and profile is None:
+        profile_options().cprofile = True
+    if profile is not None and profile.cprofile:
+        profile.directory = tempfile.mkdtemp(prefix="casinosim-profile-")
+
+    monitor = None
+    if to_run > 0 and (show_progress or metrics_file is not None):
+        monitor = progress.ProgressMonitor(to_run, render=show_progress, metrics_file=metrics_file,
+                                           time_limit=time_limit)
+
+    options = WorkerOptions()
+    options.seed = seed
+    options.records_dir = records_dir
+    options.paths_dir = paths_dir
+    options.path_points = path_points
+    options.profile = profile
+    options.tilt = tilt
+    options.rare_event = rare_event
+    options.placement = affinity or "none"
+    options.cpus = cpus
+    options.targets = passage_targets
+    options.checkpoints = checkpoint_rounds
+    options.history_dir = trace_dir
+    options.history_conditions = trace_conditions
+    options.time_limit = time_limit
+    if ci:
+        options.batches = batches
+
+    outputs = {"timings": [], "shards": [], "paths": [], "reports": [], "importance": [], "passage": [],
+               "checkpoints": [], "histories": []}
+    if to_run > 0:
+        # every process prints the whole game as it plays with --verbose
+        strategies = runner.load_strategies(scenario.strat_files())
+        bj = scenario.build(strategies, print if verbose else None)
+
+        def build():
+            # every thread plays on its own simulator, sharing the strategies
+            return scenario.build(strategies, print if verbose else None)
+
+        new_stats = scenario.new_stats()
+        try:
+            new_reasons, outputs = simulate(bj, to_run, threads, rounds, new_stats, options, monitor,
+                                            result.iterations, progress_interval, executor, build)
+        except RuntimeError as err:
+            if monitor is not None:
+                monitor.close()
+            just_print(err)
+            sys.exit(1)
+        if time_limit is not None:
+            to_run = sum(t["iterations"] for t in outputs["timings"])
+        result.add(to_run, new_reasons, new_stats)
+        if result_cache is not None:
+            result_cache.put(scenario, result)
+    if monitor is not None:
+        monitor.close()
+    total_reasons = result.reasons
+    total_stats = result.stats
+    ci_results = None
+    if ci and "batches" in outputs:
+        ci_results = intervals.BatchIntervals(outputs["batches"], playernum)
+
+    if records_dir is not None and to_run > 0:
+        records.write_index(records_dir, outputs["shards"], strat=strat_info, bet_systems=bet_system_names,
+                            bet_options=bet_options, gold=starting_golds, target=target_gold, rounds=rounds)
+    if paths_dir is not None and to_run > 0:
+        path_index = paths.write_index(paths_dir, outputs["paths"], len(bet_system_names), path_points,
+                                       strat=strat_info, bet_systems=bet_system_names, bet_options=bet_options,
+                                       gold=starting_golds, target=target_gold, rounds=rounds)
+        if path_index["dropped"] > 0:
+            just_print("Warning: {:,} iterations had no room in the path files and were not recorded".format(
+                path_index["dropped"]))
+    if trace_dir is not None and to_run > 0:
+        history.write_index(trace_dir, outputs["histories"], strat=strat_info, bet_systems=bet_system_names,
+                            bet_options=bet_options, gold=starting_golds, target=target_gold, rounds=rounds,
+                            every=trace_conditions.every, split=trace_conditions.split, loss=trace_conditions.loss,
+                            ruin=trace_conditions.ruin)
 
     end = time.perf_counter()
 
     just_print("Completed in {:.2f}s".format(end - start))
+    if time_limit is not None:
+        played = sum(t["rounds"] for t in outputs["timings"])
+        just_print("Time limit of {:,.0f}s: {:,} iterations, {:,.1f} iterations/s, {:,.0f} rounds/s".format(
+            time_limit, to_run, to_run / (end - start), played / (end - start)))
+        if to_run == 0:
+            just_print("No iteration finished in time, try a longer --time-limit")
+            sys.exit(1)
+    if affinity is not None and outputs["timings"]:
+        just_print()
+        just_print("Threads:" if executor == "threads" else "Processes:")
+        for t in sorted(outputs["timings"], key=lambda t: t["worker"]):
+            just_print("  Worker {:<3} CPU {:>4} {:>10,} its in {:>8.2f}s {:>10,.1f} its/s".format(
+                t["worker"], "-" if t["cpu"] is None else t["cpu"], t["iterations"], t["elapsed"],
+                t["iterations"] / t["elapsed"] if t["elapsed"] > 0 else 0.0))
+    if result.iterations != iterations and time_limit is None:
+        just_print("Results are for {:,} cached iterations".format(result.iterations))
+    if db_path is not None and result.iterations > 0:
+        scenario.iterations = result.iterations
+        report = runner.scenario_report(scenario, total_reasons, total_stats, result.iterations,
+                                        sum(t["elapsed"] for t in outputs["timings"]))
+        store = warehouse.Warehouse(db_path)
+        run_id = store.record(report, processes=threads, elapsed=end - start)
+        store.close()
+        just_print("Stored as run {} in: {}".format(run_id, db_path))
     just_print()
 
+    reports = outputs["reports"]
+    if profile is not None and reports:
+        profiling.print_report(reports, profile, just_print)
+        if profile_dump is not None:
+            profiling.write_dump(profile_dump, reports, profile)
+            just_print()
+            just_print("Profile written to:", profile_dump)
+        if profile.directory is not None:
+            shutil.rmtree(profile.directory, ignore_errors=True)
+        just_print()
+
+    if outputs["importance"]:
+        tally = outputs["importance"][0]
+        for other in outputs["importance"][1:]:
+            tally.merge(other)
+        tally.print(tilt, just_print)
+        just_print("End reasons and stats below are of the tilted cards")
+        just_print()
+
+    if outputs["passage"]:
+        first_passage = outputs["passage"][0]
+        for other in outputs["passage"][1:]:
+            first_passage.merge(other)
+        first_passage.print(just_print, starting_golds)
+        just_print()
+
+    if outputs["checkpoints"]:
+        snapshots = outputs["checkpoints"][0]
+        for other in outputs["checkpoints"][1:]:
+            snapshots.merge(other)
+        snapshots.print(just_print)
+        just_print()
+
     # Display end reasons and stats
     just_print("Results:")
+    if ci_results is not None:
+        just_print("95% confidence intervals by batch means over {:,} batches".format(ci_results.batches))
     for i in range(playernum):
         just_print('\n\nPlayer: ' + str(i + 1))
         just_print('Strat: ' + bet_system_names[i])
+        if len(strat_files) > 1:
+            just_print('Strat file: ' + player_strat(i))
         just_print('Starting gold: ' + str(starting_golds[i]))
-        just_print('Bet options: ' + str(bet_options[i]))
-        if len(target_gold) >= playernum:
-            just_print('Target gold: ' + str(target_gold[i]))
-        elif len(target_gold) > 0:
-            just_print('Target gold: ' + str(target_gold[0]))
+        just_print('Bet options: ' + str(scenario.players[i].bet_options))
+        if len(target_gold) > 0:
+            just_print('Target gold: ' + str(player_target(i)))
         just_print()
         for rs in sorted(total_reasons[i].keys()):
             s = total_reasons[i][rs]
+            ci_reason = None
+            if ci_results is not None and ci_results.has_reason(i, rs):
+                ci_reason = ci_results.reason(i, rs)
             just_print("  {:.<22}{:.>12,} ({:>6.2%})".format(
-                rs, s["count"], s["count"] / iterations))
+                rs, s["count"], s["count"] / result.iterations), end='')
+            if ci_results is not None and ci_reason is None:
+                # only the end reasons with a code are kept per batch
+                just_print(" (no interval)")
+            else:
+                just_print(" +- {:.2%}".format(ci_reason["share"]) if ci_reason else "")
             # just_print(s["gold_end"])
             just_print("    {:.<16}{:.>16,.2f}".format(
-                "Avg. end gold", statistics.mean(s["gold_end"])))
+                "Avg. end gold", s["gold_end"] / s["count"]), end='')
+            just_print(" +- {:,.2f}".format(ci_reason["gold_end"]) if ci_reason else "")
             just_print("    {:.<16}{:.>16,.2f}".format(
-                "Avg. hands dealt", statistics.mean(s["hands"])))
+                "Avg. hands dealt", s["hands"] / s["count"]), end='')
+            just_print(" +- {:,.2f}".format(ci_reason["hands"]) if ci_reason else "")
         just_print("\nStats:")
-        total_stats[i].print(just_print)
+        total_stats[i].print(just_print, ci_results.rates[i] if ci_results is not None else None)
         if out_file is not None:
             out_file.close()
 
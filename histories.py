@@ -0,0 +1,93 @@
+import getopt
+import json
+import sys
+
+from simulator import history
+
+
+def usage():
+    print("Usage: python histories.py DIR [OPTION...]")
+    print()
+    print("Prints the hand histories casinosim.py --trace wrote into DIR.")
+    print()
+    print("Options:")
+    print("  {:<24}{}".format("    --only=FLAGS", "only rounds traced for one of FLAGS, like \"split,ruin\""))
+    print("  {:<24}{}".format("", "(sampled, split, loss, ruin)"))
+    print("  {:<24}{}".format("    --iteration=N", "only rounds of iteration N"))
+    print("  {:<24}{}".format("    --seat=N", "only rounds seat N played in"))
+    print("  {:<24}{}".format("-n, --limit=N", "how many rounds to show (default all)"))
+    print("  {:<24}{}".format("    --json", "print the rounds as JSON lines"))
+
+
+def format_gold(gold):
+    return "{:,}".format(gold)
+
+
+def print_round(rnd):
+    print("Iteration {:,}, round {:,} (worker {}) [{}]".format(
+        rnd["iteration"], rnd["round"], rnd["worker"], ", ".join(rnd["flags"])))
+    print("  Dealer: {}".format(" ".join(rnd["dealer"])))
+    for seat in rnd["seats"]:
+        delta = seat["gold_after"] - seat["gold"]
+        print("  Seat {}: bet {}, gold {} -> {} ({:+,})".format(
+            seat["seat"], format_gold(seat["bet"]), format_gold(seat["gold"]), format_gold(seat["gold_after"]), delta))
+        for i, hand in enumerate(seat["hands"]):
+            print("    {:<8}{:<24}{}".format(
+                "Hand {}".format(i + 1), " ".join(hand["cards"]), " ".join(hand["actions"]) or "-"))
+    print()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith("-"):
+        usage()
+        sys.exit(1)
+
+    try:
+        opts, _ = getopt.gnu_getopt(sys.argv[2:], "n:", ["only=", "iteration=", "seat=", "limit=", "json"])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    only = None
+    iteration = None
+    seat = None
+    limit = None
+    as_json = False
+    for o, a in opts:
+        if o == '--only':
+            only = set(a.split(","))
+            unknown = only - set(name for (_, name) in history.FLAGS)
+            if unknown:
+                print("Unknown flags:", ", ".join(sorted(unknown)))
+                sys.exit(1)
+        elif o == '--iteration':
+            iteration = int(a)
+        elif o == '--seat':
+            seat = int(a)
+        elif o in ('-n', '--limit'):
+            limit = int(a)
+        elif o == '--json':
+            as_json = True
+
+    shown = 0
+    for rnd in history.read_histories(sys.argv[1]):
+        if only is not None and not only.intersection(rnd["flags"]):
+            continue
+        if iteration is not None and rnd["iteration"] != iteration:
+            continue
+        if seat is not None and not any(s["seat"] == seat for s in rnd["seats"]):
+            continue
+        if limit is not None and shown >= limit:
+            break
+        shown += 1
+        if as_json:
+            print(json.dumps(rnd))
+        else:
+            print_round(rnd)
+    if shown == 0 and not as_json:
+        print("No rounds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import getopt
+import json
+import sys
+
+from simulator import warehouse
+
+
+def usage():
+    print("Usage: python results.py query [OPTION...]")
+    print("       python results.py runs [OPTION...]")
+    print()
+    print("Queries the results database that casinosim.py --store and batch.py --store write.")
+    print()
+    print("Common options:")
+    print("  {:<24}{}".format("    --db=FILE", "results database (default"))
+    print("  {:<24}{}".format("", "\"~/.cache/casinosim/results.db\")"))
+    print("  {:<24}{}".format("-n, --limit=N", "how many rows to show (default 10 for query, 20 for runs)"))
+    print("  {:<24}{}".format("    --json", "print the rows as JSON"))
+    print()
+    print("Query options, every given one has to match:")
+    print("  {:<24}{}".format("-b, --bet-system=SYSTEM", "betting system"))
+    print("  {:<24}{}".format("-o, --bet-options=OPTS", "betting system options, exactly as given to the run"))
+    print("  {:<24}{}".format("-g, --gold=GOLD", "starting gold"))
+    print("  {:<24}{}".format("-t, --target=GOLD", "target gold"))
+    print("  {:<24}{}".format("-s, --strat=FILE", "strategy file"))
+    print("  {:<24}{}".format("    --min-iterations=N", "only runs with at least N iterations"))
+    print("  {:<24}{}".format("    --order=METRIC", "sort by METRIC, lowest first (default ruin_rate)"))
+    print("  {:<24}{}".format("    --desc", "sort highest first"))
+    print()
+    print("Metrics:")
+    print("  {}".format(", ".join(warehouse.METRICS)))
+
+
+def print_rows(rows, columns, as_json):
+    if as_json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+    if not rows:
+        print("No results")
+        return
+    widths = [max(len(c), max(len(format_value(row[c])) for row in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)).rstrip())
+    for row in rows:
+        print("  ".join(format_value(row[c]).ljust(w) for c, w in zip(columns, widths)).rstrip())
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.4f}".format(value)
+    return str(value)
+
+
+def query(args):
+    opts, _ = getopt.gnu_getopt(args, "b:o:g:t:s:n:", [
+        "db=", "limit=", "json", "bet-system=", "bet-options=", "gold=", "target=", "strat=", "min-iterations=",
+        "order=", "desc"])
+    db_path = warehouse.DEFAULT_PATH
+    limit = 10
+    as_json = False
+    filters = {}
+    order = "ruin_rate"
+    descending = False
+    for o, a in opts:
+        if o == '--db':
+            db_path = a
+        elif o in ('-n', '--limit'):
+            limit = int(a)
+        elif o == '--json':
+            as_json = True
+        elif o in ('-b', '--bet-system'):
+            filters["bet_system"] = a
+        elif o in ('-o', '--bet-options'):
+            filters["bet_options"] = a
+        elif o in ('-g', '--gold'):
+            filters["gold"] = int(a)
+        elif o in ('-t', '--target'):
+            filters["target"] = int(a)
+        elif o in ('-s', '--strat'):
+            filters["strat"] = a
+        elif o == '--min-iterations':
+            filters["min_iterations"] = int(a)
+        elif o == '--order':
+            order = a
+        elif o == '--desc':
+            descending = True
+
+    store = warehouse.Warehouse(db_path)
+    try:
+        rows = store.query(order=order, descending=descending, limit=limit, **filters)
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+    finally:
+        store.close()
+    columns = ["run_id", "created", "bet_system", "bet_options", "gold", "target", "iterations", order]
+    for c in ["ruin_rate", "target_rate", "avg_gold_end"]:
+        if c not in columns:
+            columns.append(c)
+    print_rows(rows, columns if not as_json else warehouse.COLUMNS, as_json)
+
+
+def runs(args):
+    opts, _ = getopt.gnu_getopt(args, "n:", ["db=", "limit=", "json"])
+    db_path = warehouse.DEFAULT_PATH
+    limit = 20
+    as_json = False
+    for o, a in opts:
+        if o == '--db':
+            db_path = a
+        elif o in ('-n', '--limit'):
+            limit = int(a)
+        elif o == '--json':
+            as_json = True
+
+    store = warehouse.Warehouse(db_path)
+    rows = store.runs(limit)
+    store.close()
+    print_rows(rows, ["id", "created", "source", "name", "version", "iterations", "rounds", "elapsed", "bet_systems"],
+               as_json)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("query", "runs"):
+        usage()
+        sys.exit(1)
+
+    try:
+        if sys.argv[1] == "query":
+            query(sys.argv[2:])
+        else:
+            runs(sys.argv[2:])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
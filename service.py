@@ -0,0 +1,363 @@
+import asyncio
+import concurrent.futures
+import getopt
+import json
+import math
+import multiprocessing
+import sys
+import time
+import urllib.parse
+import uuid
+
+from simulator import betting, cache, runner
+
+# How many finished jobs to keep around for polling
+KEEP_FINISHED = 1000
+
+STATUS_TEXT = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    500: "Internal Server Error",
+}
+
+
+def usage(file):
+    print("Usage: {0} [OPTION...]".format(file))
+    print()
+    print("Runs simulations as jobs behind a local HTTP/JSON API, on a pool of")
+    print("processes that stays warm between jobs.")
+    print()
+    print("  {:<24}{}".format("-h, --help", "print this help"))
+    print("  {:<24}{}".format("    --host=HOST", "address to listen on (default 127.0.0.1)"))
+    print("  {:<24}{}".format("    --port=PORT", "port to listen on (default 8777)"))
+    print("  {:<24}{}".format("    --threads=N", "pool processes (default 0 = auto)"))
+    print("  {:<24}{}".format("    --jobs=N", "jobs to run at the same time (default 2)"))
+    print("  {:<24}{}".format("-s, --strat=FILE", "strategy file to preload, repeatable"))
+    print("  {:<24}{}".format("", "(default \"{}\")".format(runner.DEFAULT_STRAT)))
+    print("  {:<24}{}".format("    --cache-dir=DIR", "reuse and extend cached results (jobs without"))
+    print("  {:<24}{}".format("", "a seed use seed 0)"))
+    print("  {:<24}{}".format("    --cache-size=MB", "cache size limit (default 64)"))
+
+
+class Job:
+    """
+    A simulation request and its progress. Its scenario is run as chunks on the pool.
+    """
+
+    def __init__(self, scenario):
+        self.id = uuid.uuid4().hex[:12]
+        self.scenario = scenario
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.iterations_done = 0
+        self.cached_iterations = 0
+        self.cpu_time = 0.0
+        self.aggregate = cache.CachedResult(0, [], scenario.new_stats())
+        self.result = None
+        self.error = None
+        self.futures = []
+        # bumped on every update, so streams don't miss one between two waits
+        self.version = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    async def notify(self):
+        async with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def to_dict(self, result=True):
+        d = {
+            "id": self.id,
+            "status": self.status,
+            "name": self.scenario.name,
+            "iterations": self.scenario.iterations,
+            "iterations_done": self.iterations_done,
+            "cached_iterations": self.cached_iterations,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.started is not None:
+            d["elapsed"] = (self.finished or time.time()) - self.started
+        if self.error is not None:
+            d["error"] = self.error
+        if result and self.result is not None:
+            d["result"] = self.result
+        return d
+
+
+class SimulationService:
+    """
+    Queues jobs and runs them on a persistent process pool.
+
+    Pool processes keep their loaded strategies and built simulators between jobs
+    (see `runner.run_chunk`), so repeated queries skip all setup.
+    """
+
+    def __init__(self, threads, concurrency=2, strat_files=(runner.DEFAULT_STRAT,), result_cache=None):
+        self.threads = threads
+        self.concurrency = concurrency
+        self.cache = result_cache
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            threads, initializer=runner.warm, initargs=(list(strat_files),))
+        self.queue = asyncio.Queue()
+        self.jobs = {}
+        self.dispatchers = []
+
+    async def start(self):
+        # start every pool process now, instead of on the first job
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, runner.warm) for _ in range(self.threads)])
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.concurrency)]
+
+    def shutdown(self):
+        for task in self.dispatchers:
+            task.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, scenario):
+        if self.cache is not None and scenario.seed is None:
+            scenario.seed = 0
+        job = Job(scenario)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        self.prune()
+        return job
+
+    def prune(self):
+        finished = [job for job in self.jobs.values() if job.done]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.jobs[job.id]
+
+    async def cancel(self, job):
+        if job.done:
+            return False
+        for future in job.futures:
+            future.cancel()
+        job.status = "cancelled"
+        job.finished = time.time()
+        await job.notify()
+        return True
+
+    async def dispatch(self):
+        while True:
+            job = await self.queue.get()
+            if job.status == "queued":
+                try:
+                    await self.run(job)
+                except Exception as err:
+                    job.status = "failed"
+                    job.error = "{}: {}".format(type(err).__name__, err)
+                    job.finished = time.time()
+                    await job.notify()
+            self.queue.task_done()
+
+    async def run(self, job):
+        loop = asyncio.get_running_loop()
+        scenario = job.scenario
+        job.status = "running"
+        job.started = time.time()
+        if self.cache is not None:
+            cached = self.cache.get(scenario)
+            if cached is not None:
+                job.aggregate = cached
+                job.cached_iterations = job.iterations_done = cached.iterations
+        await job.notify()
+
+        # only the iterations beyond the cached ones need to run
+        to_run = max(0, scenario.iterations - job.iterations_done)
+        size = max(1, int(math.ceil(to_run / float(self.threads * 4))))
+        job.futures = [loop.run_in_executor(self.pool, runner.run_chunk, scenario, n, first)
+                       for (n, first) in runner.split_iterations(to_run, size, job.iterations_done)]
+        for future in asyncio.as_completed(job.futures):
+            try:
+                (iterations, elapsed, reasons, total_stats) = await future
+            except asyncio.CancelledError:
+                if job.status == "cancelled":
+                    return
+                raise
+            if job.status == "cancelled":
+                return
+            job.aggregate.add(iterations, runner.compact_reasons(reasons), total_stats)
+            job.iterations_done += iterations
+            job.cpu_time += elapsed
+            await job.notify()
+
+        if self.cache is not None and to_run > 0:
+            self.cache.put(scenario, job.aggregate)
+        agg = job.aggregate
+        job.result = runner.scenario_report(scenario, agg.reasons, agg.stats, agg.iterations, job.cpu_time)
+        job.status = "done"
+        job.finished = time.time()
+        await job.notify()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, value = line.decode("latin-1").split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            path, _, query = target.partition("?")
+            params = dict(urllib.parse.parse_qsl(query))
+            await self.route(method, path.rstrip("/").split("/")[1:], params, body, writer)
+        except (ValueError, KeyError, json.JSONDecodeError) as err:
+            await self.respond(writer, 400, {"error": str(err)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as err:
+            await self.respond(writer, 500, {"error": "{}: {}".format(type(err).__name__, err)})
+        finally:
+            writer.close()
+
+    async def route(self, method, parts, params, body, writer):
+        if parts == ["health"]:
+            await self.respond(writer, 200, {
+                "status": "ok",
+                "threads": self.threads,
+                "queued": sum(1 for job in self.jobs.values() if job.status == "queued"),
+                "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            })
+        elif parts == ["systems"]:
+            await self.respond(writer, 200, {"betting_systems": sorted(betting.BETTING_SYSTEMS.keys())})
+        elif parts == ["jobs"] and method == "GET":
+            await self.respond(writer, 200, {"jobs": [job.to_dict(result=False) for job in self.jobs.values()]})
+        elif parts == ["jobs"] and method == "POST":
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                await self.respond(writer, 400, {"error": "the body needs to be a JSON object"})
+                return
+            scenario = runner.Scenario.from_dict(payload)
+            scenario.validate()
+            job = self.submit(scenario)
+            if params.get("wait") in ("1", "true"):
+                await self.wait(job)
+                await self.respond(writer, 200, job.to_dict())
+            else:
+                await self.respond(writer, 202, job.to_dict())
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                await self.respond(writer, 404, {"error": "no such job"})
+            elif len(parts) == 3 and parts[2] == "stream":
+                await self.stream(job, writer)
+            elif len(parts) == 2 and method == "GET":
+                if params.get("wait") in ("1", "true"):
+                    await self.wait(job)
+                await self.respond(writer, 200, job.to_dict())
+            elif len(parts) == 2 and method == "DELETE":
+                if await self.cancel(job):
+                    await self.respond(writer, 200, job.to_dict())
+                else:
+                    await self.respond(writer, 409, {"error": "job already finished"})
+            else:
+                await self.respond(writer, 405, {"error": "method not allowed"})
+        else:
+            await self.respond(writer, 404, {"error": "not found"})
+
+    @staticmethod
+    async def wait(job):
+        async with job.changed:
+            await job.changed.wait_for(lambda: job.done)
+
+    async def stream(self, job, writer):
+        """
+        Streams the job as newline-delimited JSON, one line per update, until it finishes.
+        """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+        while True:
+            seen = job.version
+            writer.write(json.dumps(job.to_dict(result=job.done)).encode() + b"\n")
+            await writer.drain()
+            if job.done:
+                return
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.version != seen)
+
+    @staticmethod
+    async def respond(writer, status, data):
+        body = json.dumps(data).encode()
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, STATUS_TEXT[status], len(body)).encode())
+        writer.write(body)
+        await writer.drain()
+
+
+async def serve(host, port, threads, concurrency, strat_files, result_cache):
+    service = SimulationService(threads, concurrency, strat_files, result_cache)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print("Listening on http://{}:{} with {} processes".format(host, port, threads))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+def main():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hs:", ["help", "host=", "port=", "threads=", "jobs=", "strat=",
+                                                         "cache-dir=", "cache-size="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage(sys.argv[0])
+        sys.exit(2)
+
+    host = "127.0.0.1"
+    port = 8777
+    threads = 0
+    concurrency = 2
+    strat_files = []
+    cache_dir = None
+    cache_size = cache.DEFAULT_MAX_BYTES
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            usage(sys.argv[0])
+            sys.exit()
+        elif o == '--host':
+            host = a
+        elif o == '--port':
+            port = int(a)
+        elif o == '--threads':
+            threads = int(a)
+        elif o == '--jobs':
+            concurrency = int(a)
+        elif o in ('-s', '--strat'):
+            strat_files.append(a)
+        elif o == '--cache-dir':
+            cache_dir = a
+        elif o == '--cache-size':
+            cache_size = int(float(a) * 1024 * 1024)
+
+    if threads == 0:
+        threads = multiprocessing.cpu_count()
+
+    result_cache = cache.ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+
+    try:
+        asyncio.run(serve(host, port, threads, concurrency, strat_files or [runner.DEFAULT_STRAT], result_cache))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
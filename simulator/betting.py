@@ -450,6 +450,18 @@ class OscarsGrind(BettingSystem):
     def get_next_bet(self):
         return self.next_bet
 
+BETTING_SYSTEMS = {
+    "none": NoBetting,
+    "martingale": Martingale,
+    "idkmartingale": IdkMartingale,
+    "fp": FPBetting,
+    "fibonacci": Fibonacci,
+    "labouchere": Labouchere,
+    "simple": SimpleBetting,
+    "oscarsgrind": OscarsGrind
+}
+
+
 def test_thing():
     fib = FibonacciSequence()
     for _ in range(5):
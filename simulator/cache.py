@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+
+from simulator import runner, stats
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "casinosim")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Part of every key, bumped whenever the engine or the stats change what the same
+# configuration gives, so older entries are never extended with newer iterations
+VERSION = 2
+
+
+class ResultCache:
+    """
+    Aggregated results stored under a hash of everything that decides them: the contents
+    of the strategy files, the betting systems and their options, gold, targets, rounds,
+    rules, seed and the cache `VERSION`. The iteration count is not part of the key, so a
+    cached result can be extended with more iterations later.
+
+    Every entry is one JSON file. Reading an entry touches it, and when the directory
+    grows beyond `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(scenario):
+        config = json.loads(scenario.key())
+        config["version"] = VERSION
+        for pl in config["players"]:
+            with open(pl["strat"], "rb") as f:
+                pl["strat"] = hashlib.sha256(f.read()).hexdigest()
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, scenario):
+        """
+        Returns the cached `CachedResult` for `scenario`, or `None`.
+        """
+        path = self.path(self.key(scenario))
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return CachedResult.from_dict(entry)
+
+    def put(self, scenario, result):
+        key = self.key(scenario)
+        d = result.to_dict()
+        d["key"] = key
+        d["config"] = json.loads(scenario.key())
+        tmp = self.path(key) + ".{}.tmp".format(os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(d, f)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, name) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class CachedResult:
+    """
+    Mergeable aggregates of a run: iteration count, compacted end reasons and stats per player.
+    """
+
+    def __init__(self, iterations, reasons, total_stats):
+        self.iterations = iterations
+        self.reasons = reasons
+        self.stats = total_stats
+
+    def add(self, iterations, reasons, total_stats):
+        """
+        Merges the results of `iterations` more iterations (with compacted `reasons`).
+        """
+        self.iterations += iterations
+        runner.add_compact_reasons(self.reasons, reasons)
+        for i, st in enumerate(total_stats):
+            self.stats[i].add(st)
+
+    def to_dict(self):
+        return {
+            "iterations": self.iterations,
+            "reasons": self.reasons,
+            "stats": [st.to_dict() for st in self.stats],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["iterations"], d["reasons"], [stats.BlackjackStats.from_dict(st) for st in d["stats"]])
@@ -0,0 +1,172 @@
+import math
+
+# End reason of a player that had not ended yet at a checkpoint
+STILL_PLAYING = "Still playing."
+
+# Percentiles of the gold distribution printed for every checkpoint
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+# Most bins a `GoldDistribution` keeps, per checkpoint and player
+MAX_BINS = 4096
+
+
+class GoldDistribution:
+    """
+    Mergeable counts of the gold amounts, for percentiles. Every amount gets its own bin
+    (exact percentiles) until there are more than `MAX_BINS`, then the bins double in width
+    as often as needed, so memory stays bounded however far the bankroll spreads and
+    percentiles are off by less than `width` gold.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0
+        self.sq_total = 0
+        self.low = None
+        self.high = None
+        # gold // width -> count
+        self.width = 1
+        self.counts = {}
+
+    def add(self, gold):
+        self.n += 1
+        self.total += gold
+        self.sq_total += gold * gold
+        if self.low is None or gold < self.low:
+            self.low = gold
+        if self.high is None or gold > self.high:
+            self.high = gold
+        b = gold // self.width
+        self.counts[b] = self.counts.get(b, 0) + 1
+        if len(self.counts) > MAX_BINS:
+            self.widen(self.width * 2)
+
+    def widen(self, width):
+        """
+        Merges the bins into bins `width` gold wide (a multiple of the current width),
+        doubling it further until there are at most `MAX_BINS`.
+        """
+        while True:
+            factor = width // self.width
+            counts = {}
+            for b, count in self.counts.items():
+                counts[b // factor] = counts.get(b // factor, 0) + count
+            self.counts = counts
+            self.width = width
+            if len(counts) <= MAX_BINS:
+                return
+            width *= 2
+
+    def merge(self, other):
+        self.n += other.n
+        self.total += other.total
+        self.sq_total += other.sq_total
+        if other.low is not None:
+            self.low = other.low if self.low is None else min(self.low, other.low)
+            self.high = other.high if self.high is None else max(self.high, other.high)
+        if other.width > self.width:
+            self.widen(other.width)
+        factor = self.width // other.width
+        for b, count in other.counts.items():
+            self.counts[b // factor] = self.counts.get(b // factor, 0) + count
+        if len(self.counts) > MAX_BINS:
+            self.widen(self.width * 2)
+
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def stdev(self):
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(max(0.0, (self.sq_total - self.total * self.total / self.n) / (self.n - 1)))
+
+    def percentiles(self, ps):
+        """
+        The gold at every percentile of `ps` (nearest rank): exact with 1 gold wide bins,
+        otherwise the middle of the bin, within the lowest and highest gold seen.
+        """
+        result = []
+        bins = sorted(self.counts)
+        if not bins:
+            return [0] * len(ps)
+        ranks = [max(1, int(math.ceil(p / 100.0 * self.n))) for p in ps]
+        seen = 0
+        i = 0
+        for b in bins:
+            seen += self.counts[b]
+            gold = min(max(b * self.width + self.width // 2, self.low), self.high)
+            while i < len(ranks) and ranks[i] <= seen:
+                result.append(gold)
+                i += 1
+        result.extend([self.high] * (len(ps) - len(result)))
+        return result
+
+
+class Checkpoints:
+    """
+    Snapshots of every player at a list of round checkpoints, taken during
+    `BlackjackSimulator.run` (see `BlackjackSimulator.set_checkpoints`) and aggregated
+    right away: per checkpoint and player, the end reason so far (`STILL_PLAYING` if
+    none) and the `GoldDistribution` of the gold at that round.
+
+    A player who ended before a checkpoint is counted with their end reason and final gold.
+    """
+
+    def __init__(self, rounds, players):
+        self.rounds = sorted(rounds)
+        self.iterations = 0
+        self.reasons = [[{} for _ in range(players)] for _ in self.rounds]
+        self.gold = [[GoldDistribution() for _ in range(players)] for _ in self.rounds]
+        self.next = 0
+
+    def begin(self, pls):
+        self.iterations += 1
+        self.next = 0
+
+    def due(self, rnd):
+        """
+        Whether round `rnd` (counted from 1) is the next checkpoint.
+        """
+        return self.next < len(self.rounds) and self.rounds[self.next] == rnd
+
+    def snapshot(self, pls):
+        """
+        Takes the snapshot of the next checkpoint.
+        """
+        reasons = self.reasons[self.next]
+        gold = self.gold[self.next]
+        for i, pl in enumerate(pls):
+            reason = pl.end_reason if pl.ended else STILL_PLAYING
+            reasons[i][reason] = reasons[i].get(reason, 0) + 1
+            gold[i].add(pl.player.gold)
+        self.next += 1
+
+    def end(self, pls):
+        # every player ended, so the checkpoints after the last round look the same
+        while self.next < len(self.rounds):
+            self.snapshot(pls)
+
+    def merge(self, other):
+        self.iterations += other.iterations
+        for c in range(len(self.rounds)):
+            for i, reasons in enumerate(other.reasons[c]):
+                for reason, count in reasons.items():
+                    self.reasons[c][i][reason] = self.reasons[c][i].get(reason, 0) + count
+                self.gold[c][i].merge(other.gold[c][i])
+
+    def print(self, print_fn=print):
+        print_fn("Checkpoints ({:,} iterations):".format(self.iterations))
+        for c, rnd in enumerate(self.rounds):
+            print_fn()
+            print_fn("  After round {:,}:".format(rnd))
+            for i, reasons in enumerate(self.reasons[c]):
+                gold = self.gold[c][i]
+                print_fn("    Player {}:".format(i + 1))
+                for reason in sorted(reasons):
+                    print_fn("      {:.<22}{:.>12,} ({:>6.2%})".format(
+                        reason, reasons[reason], reasons[reason] / self.iterations))
+                print_fn("      {:.<22}{:.>12,.2f} (sd {:,.2f})".format("Avg. gold", gold.mean(), gold.stdev()))
+                print_fn("      {:.<22}{}{}".format("Percentiles", ", ".join(
+                    "p{} {:,}".format(p, g) for p, g in zip(PERCENTILES, gold.percentiles(PERCENTILES))),
+                    " (bins of {:,} gold)".format(gold.width) if gold.width > 1 else ""))
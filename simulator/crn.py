@@ -0,0 +1,258 @@
+import math
+import multiprocessing
+
+from simulator import runner
+
+
+class PairedSums:
+    """
+    Mergeable sums of paired differences, for their mean and standard error.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.sq_total = 0.0
+
+    def add(self, d):
+        self.n += 1
+        self.total += d
+        self.sq_total += d * d
+
+    def merge(self, other):
+        self.n += other.n
+        self.total += other.total
+        self.sq_total += other.sq_total
+
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def stderr(self):
+        if self.n < 2:
+            return 0.0
+        var = (self.sq_total - self.total * self.total / self.n) / (self.n - 1)
+        return math.sqrt(max(var, 0.0) / self.n)
+
+
+class IterationSums:
+    """
+    Mergeable sums of paired round differences, kept per iteration: the mean is over all
+    paired rounds, and its standard error treats iterations, not rounds, as independent.
+    Rounds of one iteration are correlated (a progressive bet carries over), so the
+    spread comes from the iteration sums `y` against their round counts `x`, by the
+    ratio estimator `sum(y) / sum(x)`.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.rounds = 0
+        self.total = 0.0
+        self.sq_total = 0.0
+        self.cross = 0.0
+        self.rounds_sq = 0
+
+    def add(self, y, x):
+        """
+        Adds one iteration whose `x` paired rounds differed by `y` in total.
+        """
+        self.n += 1
+        self.rounds += x
+        self.total += y
+        self.sq_total += y * y
+        self.cross += x * y
+        self.rounds_sq += x * x
+
+    def merge(self, other):
+        self.n += other.n
+        self.rounds += other.rounds
+        self.total += other.total
+        self.sq_total += other.sq_total
+        self.cross += other.cross
+        self.rounds_sq += other.rounds_sq
+
+    def mean(self):
+        return self.total / self.rounds if self.rounds else 0.0
+
+    def stderr(self):
+        if self.n < 2 or self.rounds == 0:
+            return 0.0
+        r = self.mean()
+        mean_x = self.rounds / self.n
+        residuals = self.sq_total - 2 * r * self.cross + r * r * self.rounds_sq
+        return math.sqrt(max(residuals, 0.0) / ((self.n - 1) * self.n * mean_x * mean_x))
+
+
+class RoundRecorder:
+    """
+    Records the gold every player won or lost in every round of an iteration, as a
+    `BlackjackSimulator` recorder (see `paths.PathRecorder` for the interface).
+    """
+
+    def __init__(self, players):
+        self.deltas = [[] for _ in range(players)]
+        self.last = [0] * players
+        self.active = [False] * players
+
+    def begin(self, pls):
+        for i, pl in enumerate(pls):
+            del self.deltas[i][:]
+            self.last[i] = pl.player.gold
+            self.active[i] = True
+
+    def record(self, rnd, pls):
+        for i, pl in enumerate(pls):
+            if not self.active[i]:
+                continue
+            gold = pl.player.gold
+            self.deltas[i].append(gold - self.last[i])
+            self.last[i] = gold
+            if pl.ended:
+                self.active[i] = False
+
+    def end(self):
+        pass
+
+
+class Comparison:
+    """
+    Paired differences of every strategy against the first (the baseline), per player:
+    gold won per round over the rounds both played (an `IterationSums`), end gold per
+    iteration and the share of every end reason. Mergeable, so processes can each fill one.
+    """
+
+    def __init__(self, strat_files, players):
+        self.strat_files = strat_files
+        self.players = players
+        self.iterations = 0
+        # [strategy][player], strategy 0 (the baseline) is left empty
+        self.rounds = [[IterationSums() for _ in range(players)] for _ in strat_files]
+        self.gold_end = [[PairedSums() for _ in range(players)] for _ in strat_files]
+        # iterations a reason ended only the strategy's, or only the baseline's, by reason
+        self.reasons = [[{} for _ in range(players)] for _ in strat_files]
+        # end reason counts of every strategy, the baseline included
+        self.counts = [[{} for _ in range(players)] for _ in strat_files]
+
+    def add(self, results):
+        """
+        Adds one iteration, played once per strategy on the same cards. `results` has
+        a (round deltas, end gold, end reason) tuple per player for every strategy.
+        """
+        self.iterations += 1
+        for s, res in enumerate(results):
+            for p, (_, _, reason) in enumerate(res):
+                self.counts[s][p][reason] = self.counts[s][p].get(reason, 0) + 1
+        base = results[0]
+        for s in range(1, len(results)):
+            for p, (deltas, gold_end, reason) in enumerate(results[s]):
+                (base_deltas, base_gold_end, base_reason) = base[p]
+                paired = min(len(deltas), len(base_deltas))
+                self.rounds[s][p].add(sum(deltas[:paired]) - sum(base_deltas[:paired]), paired)
+                self.gold_end[s][p].add(gold_end - base_gold_end)
+                if reason != base_reason:
+                    self.reasons[s][p].setdefault(reason, [0, 0])[0] += 1
+                    self.reasons[s][p].setdefault(base_reason, [0, 0])[1] += 1
+
+    def merge(self, other):
+        self.iterations += other.iterations
+        for s in range(len(self.strat_files)):
+            for p in range(self.players):
+                self.rounds[s][p].merge(other.rounds[s][p])
+                self.gold_end[s][p].merge(other.gold_end[s][p])
+                for r, count in other.counts[s][p].items():
+                    self.counts[s][p][r] = self.counts[s][p].get(r, 0) + count
+                for r, (only, only_base) in other.reasons[s][p].items():
+                    mine = self.reasons[s][p].setdefault(r, [0, 0])
+                    mine[0] += only
+                    mine[1] += only_base
+
+    def reason_difference(self, s, p, reason):
+        """
+        The paired difference of the share of iterations `reason` ended for strategy `s`
+        and the baseline, as `PairedSums`.
+        """
+        (only, only_base) = self.reasons[s][p].get(reason, (0, 0))
+        sums = PairedSums()
+        sums.n = self.iterations
+        sums.total = only - only_base
+        sums.sq_total = only + only_base
+        return sums
+
+    def print(self, print_fn=print):
+        print_fn("Common random numbers: {:,} iterations, every strategy on the same cards".format(self.iterations))
+        print_fn("Baseline: {}".format(self.strat_files[0]))
+        for p in range(self.players):
+            print_fn()
+            print_fn("Player {}:".format(p + 1))
+            for s in range(1, len(self.strat_files)):
+                rounds = self.rounds[s][p]
+                gold_end = self.gold_end[s][p]
+                print_fn("  {} vs baseline:".format(self.strat_files[s]))
+                print_fn("    {:.<22}{:>+14,.3f} +- {:,.3f} gold over {:,} paired rounds".format(
+                    "Per round", rounds.mean(), rounds.stderr(), rounds.rounds))
+                print_fn("    {:.<22}{:>+14,.2f} +- {:,.2f}".format("End gold", gold_end.mean(), gold_end.stderr()))
+                for r in sorted(set(self.counts[s][p]) | set(self.counts[0][p])):
+                    sums = self.reason_difference(s, p, r)
+                    print_fn("    {:.<22}{:>6.2%} vs {:>6.2%}, {:>+7.2%} +- {:.2%}".format(
+                        r, self.counts[s][p].get(r, 0) / self.iterations,
+                        self.counts[0][p].get(r, 0) / self.iterations, sums.mean(), sums.stderr()))
+
+
+def strategy_scenarios(scenario, strat_files):
+    """
+    A copy of `scenario` per strategy file, with every player using that strategy.
+    """
+    scenarios = []
+    for file in strat_files:
+        sc = runner.Scenario.from_dict(scenario.to_dict())
+        for pl in sc.players:
+            pl.strat = file
+        scenarios.append(sc)
+    return scenarios
+
+
+def run_chunk(scenarios, iterations, first=0):
+    """
+    Plays iterations `first` to `first + iterations - 1` once with every scenario of
+    `strategy_scenarios`, every round of an iteration dealt from the same seeded shoe,
+    returning a `Comparison`.
+    """
+    players = len(scenarios[0].players)
+    comparison = Comparison([sc.players[0].strat for sc in scenarios], players)
+    recorder = RoundRecorder(players)
+    for index in range(first, first + iterations):
+        results = []
+        for sc in scenarios:
+            bj = runner.simulator_for(sc)
+            bj.set_recorder(recorder)
+            bj.set_round_seed("{}:{}".format(sc.seed, index))
+            bj.reset()
+            pls = bj.run(sc.rounds)
+            results.append([(list(recorder.deltas[i]), pl.stats.gold_end, pl.end_reason)
+                            for i, pl in enumerate(pls)])
+            bj.set_recorder(None)
+        comparison.add(results)
+    return comparison
+
+
+def _run_task(task):
+    return run_chunk(*task)
+
+
+def compare(scenario, strat_files, processes, chunk=None):
+    """
+    Plays the iterations of `scenario` with every strategy of `strat_files` on a pool of
+    `processes` processes, returning the merged `Comparison` against the first file.
+    Iterations are seeded with the scenario's seed, or 0 without one.
+    """
+    if scenario.seed is None:
+        scenario.seed = 0
+    scenarios = strategy_scenarios(scenario, strat_files)
+    strategies = runner.load_strategies(strat_files)
+    chunk = chunk or max(1, int(math.ceil(scenario.iterations / float(processes * 4))))
+    tasks = [(scenarios, n, first) for (n, first) in runner.split_iterations(scenario.iterations, chunk)]
+
+    comparison = Comparison(list(strat_files), len(scenario.players))
+    with multiprocessing.Pool(processes, initializer=runner.warm, initargs=((), strategies)) as pool:
+        for result in pool.imap_unordered(_run_task, tasks):
+            comparison.merge(result)
+    return comparison
@@ -0,0 +1,354 @@
+import json
+import os
+import struct
+
+from casinobot import cards, player
+
+MAGIC = b"CSHH"
+VERSION = 1
+
+INDEX_FILE = "index.json"
+
+# Why a round was written, a bit field
+SAMPLED = 1
+SPLIT = 2
+LOSS = 4
+RUIN = 8
+FLAGS = [(SAMPLED, "sampled"), (SPLIT, "split"), (LOSS, "loss"), (RUIN, "ruin")]
+
+# Conditions `parse_conditions` knows, "loss" takes the amount as "loss=X"
+CONDITIONS = ["split", "loss", "ruin"]
+
+# Actions as the `blackjack.Game` method names `choose_action` calls, and their codes
+ACTIONS = {"hit": b"H", "stand": b"S", "doubledown": b"D", "split": b"P", "surrender": b"R"}
+
+# The default sampling rate when neither --trace-every nor --trace-on are given
+DEFAULT_EVERY = 1000
+
+RUINED = "Ran out of gold."
+
+HEADER = struct.Struct("<4sBH")
+# iteration, round, flags, seats
+ROUND = struct.Struct("<IIBB")
+# seat, gold before, gold after, bet, hands
+SEAT = struct.Struct("<BqqqB")
+
+# Every card as a single byte: rank index * 4 + suit index
+CARD_CODES = {(suit, rank): r * 4 + s for r, rank in enumerate(cards.RANKS) for s, suit in enumerate(cards.SUITS)}
+CARD_NAMES = {code: rank + suit for (suit, rank), code in CARD_CODES.items()}
+
+
+def file_name(worker):
+    return "history-{:03d}.bin".format(worker)
+
+
+class Conditions:
+    """
+    Which rounds get their hand history written: 1 in `every` rounds, and rounds with
+    a split, a loss of more than `loss` gold by any seat, or that a player played last
+    before running out of gold.
+    """
+
+    def __init__(self, every=0, split=False, loss=None, ruin=False):
+        self.every = every
+        self.split = split
+        self.loss = loss
+        self.ruin = ruin
+
+    def conditional(self):
+        """
+        Whether rounds can only be picked once they are over, so every round is captured.
+        """
+        return self.split or self.loss is not None or self.ruin
+
+
+def parse_conditions(text):
+    """
+    Parses a comma-separated list like "split,loss=500,ruin" into a `Conditions`.
+    """
+    conditions = Conditions()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.partition("=")
+        if name == "split":
+            conditions.split = True
+        elif name == "ruin":
+            conditions.ruin = True
+        elif name == "loss":
+            if not value:
+                raise ValueError("loss needs an amount, like 'loss=500'")
+            conditions.loss = int(value)
+        else:
+            raise ValueError("unknown condition '{}', use: {}".format(name, ", ".join(CONDITIONS)))
+    return conditions
+
+
+class Snapshot:
+    """
+    One captured round: gold and bets per seat, the cards and actions of every hand
+    and the dealer's cards.
+    """
+
+    def __init__(self):
+        self.iteration = 0
+        self.round = 0
+        self.flags = 0
+        self.gold = {}
+        self.gold_after = {}
+        self.bets = {}
+        self.actions = {}
+        self.hands = {}
+        self.dealer = []
+
+    def clear(self):
+        self.flags = 0
+        self.gold.clear()
+        self.gold_after.clear()
+        self.bets.clear()
+        self.actions.clear()
+        self.hands.clear()
+        self.dealer = []
+
+    def encode(self):
+        seats = sorted(self.hands)
+        data = bytearray(ROUND.pack(self.iteration, self.round, self.flags, len(seats)))
+        data.append(len(self.dealer))
+        data += bytes(self.dealer)
+        for seat in seats:
+            hands = self.hands[seat]
+            data += SEAT.pack(seat, int(self.gold.get(seat, 0)), int(self.gold_after.get(seat, 0)),
+                              int(self.bets.get(seat, 0)), len(hands))
+            for (key, codes) in hands:
+                actions = self.actions.get(key, b"")
+                data.append(len(codes))
+                data += bytes(codes)
+                data.append(len(actions))
+                data += actions
+        return data
+
+
+class HistoryWriter:
+    """
+    Writes the hand histories of sampled rounds into one binary file per worker, see
+    `BlackjackSimulator.set_tracer`.
+
+    With only `conditions.every`, nothing is captured on rounds that aren't sampled. The
+    other conditions are only known once a round is over, so every round is captured
+    into a reused `Snapshot` and only encoded and written if it matches; a round is held
+    back until the next one, which is where running out of gold shows.
+    """
+
+    def __init__(self, directory, worker, conditions, first=0, buffer_size=1 << 16):
+        self.directory = directory
+        self.worker = worker
+        self.conditions = conditions
+        self.conditional = conditions.conditional()
+        self.iteration = first - 1
+        self.seen = 0
+        self.written = 0
+        self.capturing = False
+        self.current = Snapshot()
+        self.pending = Snapshot()
+        self.has_pending = False
+        self.file = open(os.path.join(directory, file_name(worker)), "wb", buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, VERSION, worker))
+
+    def begin(self, pls):
+        self.iteration += 1
+
+    def start_round(self, pls):
+        """
+        Called before a round is dealt, decides whether to capture it.
+        """
+        self.seen += 1
+        every = self.conditions.every
+        sampled = every > 0 and self.seen % every == 0
+        self.capturing = sampled or self.conditional
+        if not self.capturing:
+            return
+        snap = self.current
+        snap.clear()
+        if sampled:
+            snap.flags = SAMPLED
+        for pl in pls:
+            if not pl.ended:
+                snap.gold[pl.uid] = pl.player.gold
+
+    def bets(self, pls):
+        """
+        Called when the cards are dealt, after the bets are placed.
+        """
+        for pl in pls:
+            if not pl.ended:
+                self.current.bets[pl.uid] = pl.player.bet
+
+    def action(self, uid, name):
+        """
+        Called with the `blackjack.Game` method name of every action, `uid` being the
+        seat's or a split hand's id.
+        """
+        actions = self.current.actions
+        actions[uid] = actions.get(uid, b"") + ACTIONS[name]
+
+    def snapshot(self):
+        """
+        Called when the round is over, before the table is cleared.
+        """
+        snap = self.current
+        snap.dealer = [CARD_CODES[c.suit, c.rank] for c in player.players[0].hand.cards]
+        for key in sorted(player.players, key=str):
+            if key == 0:
+                continue
+            pp = player.players[key]
+            if not pp.hand.cards:
+                continue
+            hands = snap.hands.setdefault(pp.uid, [])
+            entry = (key, [CARD_CODES[c.suit, c.rank] for c in pp.hand.cards])
+            # the seat's own hand first, then its splits
+            if key == pp.uid:
+                hands.insert(0, entry)
+            else:
+                hands.append(entry)
+
+    def end_round(self, rnd, pls):
+        """
+        Called after round `rnd`, writes what is due.
+        """
+        if not self.capturing:
+            return
+        self.capturing = False
+        snap = self.current
+        conditions = self.conditions
+        if self.has_pending and conditions.ruin:
+            for pl in pls:
+                if pl.uid in snap.gold and pl.uid not in snap.bets and pl.end_reason == RUINED:
+                    # couldn't bet on this round, so the pending round was their last
+                    self.pending.flags |= RUIN
+        if self.has_pending:
+            self.flush_pending()
+        # the starting seat is dealt in even after it ended, without a bet
+        for seat in list(snap.hands):
+            if seat not in snap.bets:
+                del snap.hands[seat]
+        if not snap.hands:
+            # nobody played this round
+            return
+        snap.iteration = self.iteration
+        snap.round = rnd
+        for pl in pls:
+            if pl.uid in snap.hands:
+                snap.gold_after[pl.uid] = pl.player.gold
+        if conditions.split and any(len(hands) > 1 for hands in snap.hands.values()):
+            snap.flags |= SPLIT
+        if conditions.loss is not None and any(
+                snap.gold[seat] - snap.gold_after[seat] > conditions.loss for seat in snap.hands):
+            snap.flags |= LOSS
+        if conditions.ruin:
+            # held back until the next round shows whether it was the last before ruin
+            self.current, self.pending = self.pending, snap
+            self.has_pending = True
+        elif snap.flags:
+            self.write(snap)
+
+    def flush_pending(self):
+        if self.pending.flags:
+            self.write(self.pending)
+        self.has_pending = False
+
+    def write(self, snap):
+        data = snap.encode()
+        self.file.write(struct.pack("<H", len(data)))
+        self.file.write(data)
+        self.written += 1
+
+    def end(self):
+        if self.has_pending:
+            self.flush_pending()
+
+    def close(self):
+        """
+        Flushes and closes the file, returning its entry for the index file.
+        """
+        self.end()
+        self.file.close()
+        return {"worker": self.worker, "rounds": self.written, "file": file_name(self.worker)}
+
+
+def write_index(directory, files, **info):
+    """
+    Writes the index file describing the history `files` of all workers (as returned by
+    `HistoryWriter.close`). Any extra keyword arguments are stored as run information.
+    """
+    files = sorted(files, key=lambda f: f["worker"])
+    index = {
+        "version": VERSION,
+        "rounds": sum(f["rounds"] for f in files),
+        "files": files,
+        "info": info,
+    }
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def load_index(directory):
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        return json.load(f)
+
+
+def flag_names(flags):
+    return [name for (bit, name) in FLAGS if flags & bit]
+
+
+def read_file(path):
+    """
+    Decodes every round of a history file, yielding one dict per round.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, worker = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} hand history file".format(path, VERSION))
+    pos = HEADER.size
+    while pos < len(data):
+        (length,) = struct.unpack_from("<H", data, pos)
+        pos += 2
+        yield decode(data[pos:pos + length], worker)
+        pos += length
+
+
+def decode(data, worker):
+    iteration, rnd, flags, seats = ROUND.unpack_from(data, 0)
+    pos = ROUND.size
+    n = data[pos]
+    dealer = [CARD_NAMES[c] for c in data[pos + 1:pos + 1 + n]]
+    pos += 1 + n
+    result = {"worker": worker, "iteration": iteration, "round": rnd, "flags": flag_names(flags),
+              "dealer": dealer, "seats": []}
+    for _ in range(seats):
+        seat, gold, gold_after, bet, n_hands = SEAT.unpack_from(data, pos)
+        pos += SEAT.size
+        hands = []
+        for _ in range(n_hands):
+            n = data[pos]
+            hand = [CARD_NAMES[c] for c in data[pos + 1:pos + 1 + n]]
+            pos += 1 + n
+            n = data[pos]
+            actions = data[pos + 1:pos + 1 + n].decode("ascii")
+            pos += 1 + n
+            hands.append({"cards": hand, "actions": actions})
+        result["seats"].append({"seat": seat, "gold": gold, "gold_after": gold_after, "bet": bet,
+                                "hands": hands})
+    return result
+
+
+def read_histories(directory):
+    """
+    Decodes every round of every worker's file listed in the index of `directory`.
+    """
+    index = load_index(directory)
+    for entry in index["files"]:
+        for rnd in read_file(os.path.join(directory, entry["file"])):
+            yield rnd
@@ -0,0 +1,150 @@
+import math
+import random
+
+from casinobot import cards
+
+# Events whose probability can be estimated, by the end reason that marks them
+EVENTS = {
+    "ruin": "Ran out of gold.",
+    "target": "Reached target gold.",
+}
+
+# Hi-Lo count of every rank: low cards help the dealer, high cards the player
+HILO = {
+    'A': -1, '2': 1, '3': 1, '4': 1, '5': 1, '6': 1, '7': 0, '8': 0, '9': 0,
+    '10': -1, 'J': -1, 'Q': -1, 'K': -1,
+}
+
+
+class TiltedDeck:
+    """
+    A shoe that deals every card with a probability tilted by its Hi-Lo count.
+
+    A rank with `n` cards left is dealt with probability proportional to
+    `n * exp(-tilt * HILO[rank])`, instead of `n` for a shuffled shoe. Every deal adds
+    the log of its likelihood ratio (shuffled over tilted probability) to the sampler.
+    """
+
+    def __init__(self, sampler, decks=2):
+        self.sampler = sampler
+        self.ranks = list(cards.RANKS)
+        self.by_rank = [[] for _ in self.ranks]
+        index = {rank: i for i, rank in enumerate(self.ranks)}
+        for card in cards.Deck().cards * decks:
+            self.by_rank[index[card.rank]].append(card)
+        for cs in self.by_rank:
+            random.shuffle(cs)
+
+        self.weights = sampler.weights
+        self.left = sum(len(cs) for cs in self.by_rank)
+        self.total = sum(w * len(cs) for w, cs in zip(self.weights, self.by_rank))
+
+    def deal_card(self):
+        x = random.random() * self.total
+        for i, cs in enumerate(self.by_rank):
+            x -= self.weights[i] * len(cs)
+            if x < 0 and cs:
+                break
+        else:
+            # rounding left `x` past the last rank
+            i = max(j for j, cs in enumerate(self.by_rank) if cs)
+            cs = self.by_rank[i]
+
+        w = self.weights[i]
+        self.sampler.log_ratio += math.log(self.total) - math.log(self.left) - math.log(w)
+        self.total -= w
+        self.left -= 1
+        return cs.pop()
+
+
+class ImportanceSampler:
+    """
+    Tilts the cards of every round toward a rare event and tracks the likelihood ratio
+    of the current iteration, which is the iteration's weight in the estimate.
+
+    A positive `tilt` deals more high cards, which favors the player (reaching a target),
+    a negative one more low cards, which favors the dealer (ruin).
+    """
+
+    def __init__(self, tilt):
+        self.tilt = tilt
+        self.weights = [math.exp(-tilt * HILO[rank]) for rank in cards.RANKS]
+        self.log_ratio = 0.0
+
+    def begin(self):
+        self.log_ratio = 0.0
+
+    def new_deck(self):
+        return TiltedDeck(self)
+
+    def weight(self):
+        return math.exp(self.log_ratio)
+
+
+class ImportanceTally:
+    """
+    Mergeable sums of the weighted event indicators of every player.
+
+    The estimate of P(event) is the mean of `weight * [event happened]` over all
+    iterations, and the effective sample size is Kish's `(sum w)^2 / sum w^2`.
+    """
+
+    def __init__(self, players, event="ruin"):
+        self.event = event
+        self.reason = EVENTS[event]
+        self.iterations = 0
+        self.weight_sum = 0.0
+        self.weight_sq_sum = 0.0
+        self.hits = [0] * players
+        self.hit_sum = [0.0] * players
+        self.hit_sq_sum = [0.0] * players
+
+    def add(self, weight, pls):
+        self.iterations += 1
+        self.weight_sum += weight
+        self.weight_sq_sum += weight * weight
+        for i, pl in enumerate(pls):
+            if pl.end_reason == self.reason:
+                self.hits[i] += 1
+                self.hit_sum[i] += weight
+                self.hit_sq_sum[i] += weight * weight
+
+    def merge(self, other):
+        self.iterations += other.iterations
+        self.weight_sum += other.weight_sum
+        self.weight_sq_sum += other.weight_sq_sum
+        for i in range(len(self.hits)):
+            self.hits[i] += other.hits[i]
+            self.hit_sum[i] += other.hit_sum[i]
+            self.hit_sq_sum[i] += other.hit_sq_sum[i]
+
+    def ess(self):
+        if self.weight_sq_sum == 0:
+            return 0.0
+        return self.weight_sum ** 2 / self.weight_sq_sum
+
+    def estimates(self):
+        """
+        Per player: the estimated probability, its standard error, the number of
+        iterations the event happened in and the effective sample size of those.
+        """
+        n = self.iterations
+        result = []
+        for i in range(len(self.hits)):
+            p = self.hit_sum[i] / n if n else 0.0
+            var = (self.hit_sq_sum[i] / n - p * p) / (n - 1) if n > 1 else 0.0
+            result.append({
+                "probability": p,
+                "stderr": math.sqrt(max(var, 0.0)),
+                "hits": self.hits[i],
+                "hit_ess": self.hit_sum[i] ** 2 / self.hit_sq_sum[i] if self.hit_sq_sum[i] > 0 else 0.0,
+            })
+        return result
+
+    def print(self, tilt, print_fn=print):
+        print_fn("Importance sampling (tilt {}, event: {}):".format(tilt, self.event))
+        print_fn("  Effective sample size {:,.1f} of {:,} iterations".format(self.ess(), self.iterations))
+        for i, est in enumerate(self.estimates()):
+            print_fn("  Player {}: P = {:.4e} +- {:.2e} (95% CI {:.4e} .. {:.4e}), {:,} hits, ESS {:,.1f}".format(
+                i + 1, est["probability"], est["stderr"], max(0.0, est["probability"] - 1.96 * est["stderr"]),
+                est["probability"] + 1.96 * est["stderr"], est["hits"], est["hit_ess"]))
@@ -0,0 +1,101 @@
+import math
+
+from simulator import stats
+
+# Two-sided 95% quantiles of Student's t by degrees of freedom, 1.96 beyond the table
+T_975 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+T_975_LARGE = [(40, 2.021), (60, 2.000), (120, 1.980)]
+
+# Stats reported as a rate of all hands
+RATES = [stat["attr"] for (_, stat) in stats.OUTPUT_CONFIG if "percentage" in stat]
+
+# Risk stats reported per iteration, and the one reported as a rate of rounds played
+PER_ITERATION = ["drawdown_sum", "max_bet_sum"] + stats.BET_BUCKETS
+PER_ROUND = ["rounds_under_water"]
+
+
+def t_975(df):
+    if df < 1:
+        return float("nan")
+    if df <= len(T_975):
+        return T_975[df - 1]
+    for limit, t in T_975_LARGE:
+        if df <= limit:
+            return t
+    return 1.96
+
+
+def ratio_interval(ys, xs):
+    """
+    The half-width of the 95% interval of `sum(ys) / sum(xs)`, out of per-batch sums,
+    with the batch means method: the batches are taken as independent, and the variance
+    of the ratio follows from the spread of the batch residuals `y - ratio * x`.
+    NaN with fewer than two batches, 0 when nothing was counted.
+    """
+    b = len(xs)
+    total_x = float(sum(xs))
+    if b < 2:
+        return float("nan")
+    if total_x == 0:
+        return 0.0
+    ratio = sum(ys) / total_x
+    mean_x = total_x / b
+    residuals = sum((y - ratio * x) ** 2 for y, x in zip(ys, xs))
+    return t_975(b - 1) * math.sqrt(residuals / ((b - 1) * b * mean_x * mean_x))
+
+
+class BatchIntervals:
+    """
+    95% confidence intervals of every reported metric, per player, out of batch aggregates
+    (see `shared.SharedResults.batches_done`): the share, average end gold and average hands
+    of every end reason, the rate of every stat in `RATES`, and the risk stats averaged per
+    iteration (`PER_ITERATION`) or round (`PER_ROUND`).
+
+    Maxima (largest drawdown, round loss and bet) have no interval, and neither do end
+    reasons workers send apart from their slots (see `shared.WorkerSlot.other_reasons`).
+
+    Only the batch sums are needed, so processes never keep per-iteration data around.
+    """
+
+    def __init__(self, batches, players):
+        self.batches = len(batches)
+        self.reasons = []
+        self.rates = []
+        done = [b[0] for b in batches]
+        for p in range(players):
+            reasons = {}
+            names = set()
+            for (_, reas, _) in batches:
+                names.update(reas[p])
+            for reason in names:
+                sums = [b[1][p].get(reason, {"count": 0, "gold_end": 0, "hands": 0}) for b in batches]
+                counts = [s["count"] for s in sums]
+                reasons[reason] = {
+                    "share": ratio_interval(counts, done),
+                    "gold_end": ratio_interval([s["gold_end"] for s in sums], counts),
+                    "hands": ratio_interval([s["hands"] for s in sums], counts),
+                }
+            self.reasons.append(reasons)
+
+            hands = [b[2][p].total_hands for b in batches]
+            rates = {attr: ratio_interval([getattr(b[2][p], attr) for b in batches], hands) for attr in RATES}
+            for attr in PER_ITERATION:
+                rates[attr] = ratio_interval([getattr(b[2][p], attr) for b in batches], done)
+            played = [b[2][p].rounds_played for b in batches]
+            for attr in PER_ROUND:
+                rates[attr] = ratio_interval([getattr(b[2][p], attr) for b in batches], played)
+            self.rates.append(rates)
+
+    def has_reason(self, player, reason):
+        return reason in self.reasons[player]
+
+    def reason(self, player, reason):
+        """
+        The half-widths of the "share", "gold_end" and "hands" of `reason`, or NaN ones if no batch has it.
+        """
+        nan = float("nan")
+        return self.reasons[player].get(reason, {"share": nan, "gold_end": nan, "hands": nan})
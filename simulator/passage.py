@@ -0,0 +1,92 @@
+import bisect
+import math
+
+RUINED = "Ran out of gold."
+REACHED = "Reached target gold."
+
+
+def parse_targets(text):
+    """
+    Parses a list of numbers like "1100,1500" or a range "1100:2000:100" (start, stop
+    and step, stop included), or a mix of both like "1100:2000:100,2500", into a sorted
+    list. Used for round checkpoints too.
+    """
+    targets = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (int(x) for x in part.split(":"))
+            if step <= 0:
+                raise ValueError("range step needs to be positive: '{}'".format(part))
+            targets.update(range(start, stop + 1, step))
+        else:
+            targets.add(int(part))
+    return sorted(targets)
+
+
+class FirstPassage:
+    """
+    The probability of reaching every gold target before the iteration ended, per player,
+    out of one run to the highest target.
+
+    An iteration reached a target if the highest gold it ever had (`BlackjackStats.gold_max`)
+    is at least the target. Ruin ends an iteration for good, so this is the probability of
+    reaching it before ruin, unless something else ended the iteration first: those
+    iterations are counted as `cut_short`, and with any the curve is a lower bound of the
+    probability before ruin. Only the number of targets every iteration reached is
+    counted, which is mergeable.
+    """
+
+    def __init__(self, targets, players):
+        self.targets = sorted(targets)
+        self.iterations = 0
+        # [player][k]: iterations that reached exactly the `k` lowest targets
+        self.reached = [[0] * (len(self.targets) + 1) for _ in range(players)]
+        # [player]: iterations that ended neither in ruin nor at the highest target, like at --rounds
+        self.cut_short = [0] * players
+
+    def add(self, pls):
+        self.iterations += 1
+        for i, pl in enumerate(pls):
+            self.reached[i][bisect.bisect_right(self.targets, pl.stats.gold_max)] += 1
+            if pl.end_reason not in (RUINED, REACHED):
+                self.cut_short[i] += 1
+
+    def merge(self, other):
+        self.iterations += other.iterations
+        for mine, theirs in zip(self.reached, other.reached):
+            for k, count in enumerate(theirs):
+                mine[k] += count
+        for i, count in enumerate(other.cut_short):
+            self.cut_short[i] += count
+
+    def curve(self, player):
+        """
+        (target, iterations that reached it, probability, standard error) of every target of `player`.
+        """
+        n = self.iterations
+        result = []
+        hits = n
+        for k, target in enumerate(self.targets):
+            hits -= self.reached[player][k]
+            p = hits / n if n else 0.0
+            result.append((target, hits, p, math.sqrt(p * (1 - p) / n) if n else 0.0))
+        return result
+
+    def print(self, print_fn=print, starting_golds=None):
+        print_fn("Probability of reaching every target before the iteration ended ({:,} iterations):".format(
+            self.iterations))
+        for i in range(len(self.reached)):
+            print_fn()
+            if starting_golds is not None:
+                print_fn("  Player {} (starting gold {:,}):".format(i + 1, starting_golds[i]))
+            else:
+                print_fn("  Player {}:".format(i + 1))
+            for (target, hits, p, stderr) in self.curve(i):
+                print_fn("    {:.<20,}{:.>12,} ({:>7.2%} +- {:.2%})".format(target, hits, p, stderr))
+            if self.cut_short[i] > 0:
+                print_fn("    {:,} iterations ({:.2%}) ended before ruin or the highest target, so reaching".format(
+                    self.cut_short[i], self.cut_short[i] / self.iterations))
+                print_fn("    a target before ruin is at least as likely as above")
@@ -0,0 +1,236 @@
+import array
+import json
+import mmap
+import os
+import sys
+
+# Points kept per player per iteration, by default
+DEFAULT_POINTS = 64
+
+INDEX_FILE = "paths.json"
+
+# (array name, `array` typecode, numpy dtype without byte order)
+ARRAYS = [
+    ("rounds", "L", "u4"),
+    ("gold",   "q", "i8"),
+    ("length", "H", "u2"),
+]
+
+# The most points a path can have, as "length" holds them
+MAX_POINTS = 2 ** 16 - 1
+
+# `array` typecodes are platform sized, pick ones matching the on-disk dtypes
+if array.array("L").itemsize != 4:
+    ARRAYS = [(n, "I" if tc == "L" else tc, dt) for (n, tc, dt) in ARRAYS]
+
+
+def path_file(shard, name):
+    return "paths-{:03d}.{}.bin".format(shard, name)
+
+
+def lttb(xs, ys, n):
+    """
+    Largest-triangle-three-buckets downsampling of the points (`xs`, `ys`) to `n` points.
+
+    Keeps the first and last point, and from every bucket in between the point forming the
+    largest triangle with the previously kept point and the average of the next bucket,
+    which preserves spikes and drops that plain decimation would miss.
+    """
+    size = len(xs)
+    if size <= n:
+        return list(xs), list(ys)
+    if n < 3:
+        return [xs[0], xs[-1]][:n], [ys[0], ys[-1]][:n]
+
+    out_x = [xs[0]]
+    out_y = [ys[0]]
+    every = (size - 2) / (n - 2)
+    a = 0
+    for i in range(n - 2):
+        start = int((i + 1) * every) + 1
+        end = min(int((i + 2) * every) + 1, size)
+        avg_x = sum(xs[start:end]) / (end - start)
+        avg_y = sum(ys[start:end]) / (end - start)
+
+        ax = xs[a]
+        ay = ys[a]
+        best = -1
+        for j in range(int(i * every) + 1, start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best:
+                best = area
+                a = j
+        out_x.append(xs[a])
+        out_y.append(ys[a])
+
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+class PathRecorder:
+    """
+    Records the gold of every player after every round, downsampled to at most `points`
+    (round, gold) pairs per player per iteration, into preallocated memory-mapped arrays.
+
+    The files hold `iterations` x `players` x `points` slots and are created up front, so
+    memory and disk use are bounded by the arguments no matter how long iterations run.
+    While an iteration runs, each player's path is buffered and compacted with `lttb`
+    whenever the buffer fills up, which costs an append per round and amortized O(1).
+    """
+
+    def __init__(self, directory, shard, iterations, players, points=DEFAULT_POINTS):
+        if not 2 <= points <= MAX_POINTS:
+            raise ValueError("points needs to be between 2 and {}".format(MAX_POINTS))
+        self.directory = directory
+        self.shard = shard
+        self.iterations = iterations
+        self.players = players
+        self.points = points
+        self.capacity = max(4 * points, 16)
+        self.rows = 0
+        self.dropped = 0
+
+        counts = {"rounds": iterations * players * points, "gold": iterations * players * points,
+                  "length": iterations * players}
+        self.maps = {}
+        self.views = {}
+        for (name, typecode, _) in ARRAYS:
+            size = counts[name] * array.array(typecode).itemsize
+            with open(os.path.join(directory, path_file(shard, name)), "w+b") as f:
+                f.truncate(size)
+                if size > 0:
+                    self.maps[name] = mmap.mmap(f.fileno(), size)
+                    self.views[name] = memoryview(self.maps[name]).cast(typecode)
+
+        self.xs = [[] for _ in range(players)]
+        self.ys = [[] for _ in range(players)]
+        self.active = [False] * players
+
+    def begin(self, pls):
+        """
+        Starts the path of a new iteration at the starting gold of the players `pls`.
+        """
+        for i, pl in enumerate(pls):
+            del self.xs[i][:]
+            del self.ys[i][:]
+            self.xs[i].append(0)
+            self.ys[i].append(pl.player.gold)
+            self.active[i] = True
+
+    def record(self, rnd, pls):
+        """
+        Adds the gold of the players still playing after round `rnd`. A player's last
+        point is the round its iteration ended in.
+        """
+        for i, pl in enumerate(pls):
+            if not self.active[i]:
+                continue
+            xs = self.xs[i]
+            xs.append(rnd)
+            self.ys[i].append(pl.player.gold)
+            if pl.ended:
+                self.active[i] = False
+            if len(xs) >= self.capacity:
+                xs[:], self.ys[i][:] = lttb(xs, self.ys[i], 2 * self.points)
+
+    def end(self):
+        """
+        Downsamples the paths of the iteration and writes them into the next row.
+        Iterations beyond the preallocated `iterations` are dropped, and counted.
+        """
+        if self.rows >= self.iterations:
+            self.dropped += 1
+            return
+        for i in range(self.players):
+            xs, ys = lttb(self.xs[i], self.ys[i], self.points)
+            slot = self.rows * self.players + i
+            offset = slot * self.points
+            self.views["rounds"][offset:offset + len(xs)] = array.array(self.views["rounds"].format, xs)
+            self.views["gold"][offset:offset + len(ys)] = array.array("q", (int(y) for y in ys))
+            self.views["length"][slot] = len(xs)
+        self.rows += 1
+
+    def close(self):
+        """
+        Flushes the arrays, returning the shard's entry for the index file.
+        """
+        for name in list(self.views.keys()):
+            self.views[name].release()
+            self.maps[name].flush()
+            self.maps[name].close()
+        self.views = {}
+        self.maps = {}
+        return {
+            "shard": self.shard,
+            "rows": self.rows,
+            "allocated": self.iterations,
+            "dropped": self.dropped,
+            "files": {name: path_file(self.shard, name) for (name, _, _) in ARRAYS},
+        }
+
+
+def write_index(directory, shards, players, points, **info):
+    """
+    Writes the index of the path shards (as returned by `PathRecorder.close`).
+    Any extra keyword arguments are stored as run information.
+    """
+    shards = sorted(shards, key=lambda s: s["shard"])
+    index = {
+        "version": 1,
+        "byteorder": sys.byteorder,
+        "players": players,
+        "points": points,
+        "arrays": [{"name": name, "dtype": dtype} for (name, _, dtype) in ARRAYS],
+        "rows": sum(s["rows"] for s in shards),
+        "dropped": sum(s.get("dropped", 0) for s in shards),
+        "shards": shards,
+        "info": info,
+    }
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def open_paths(directory, use_numpy=True):
+    """
+    Memory-maps every path shard listed in the index of `directory`.
+
+    Returns the index and a list with a `{name: array}` dict per shard. With numpy, "rounds"
+    and "gold" have the shape (rows, players, points) and "length" (rows, players); only the
+    first `length` points of a path are used. Without numpy they are flat `memoryview`s in
+    the same order.
+    """
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        index = json.load(f)
+    order = "<" if index["byteorder"] == "little" else ">"
+    players = index["players"]
+    points = index["points"]
+
+    numpy = None
+    if use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            pass
+
+    shards = []
+    for shard in index["shards"]:
+        arrays = {}
+        for (name, typecode, dtype) in ARRAYS:
+            shape = (shard["rows"], players) if name == "length" else (shard["rows"], players, points)
+            count = shape[0] * shape[1] * (1 if len(shape) == 2 else shape[2])
+            path = os.path.join(directory, shard["files"][name])
+            if numpy is not None:
+                if count == 0:
+                    arrays[name] = numpy.zeros(shape, dtype=order + dtype)
+                else:
+                    arrays[name] = numpy.memmap(path, dtype=order + dtype, mode="r", shape=shape)
+            elif count == 0:
+                arrays[name] = memoryview(array.array(typecode))
+            else:
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                arrays[name] = memoryview(mm).cast(typecode)[:count]
+        shards.append(arrays)
+    return index, shards
@@ -0,0 +1,78 @@
+import os
+
+# Worker placement modes of `plan`
+MODES = ["none", "logical", "physical"]
+
+TOPOLOGY = "/sys/devices/system/cpu/cpu{}/topology/thread_siblings_list"
+
+
+def supported():
+    return hasattr(os, "sched_setaffinity")
+
+
+def parse_cpu_list(text):
+    """
+    Parses a CPU list like "0-3,8,10-11" (the kernel's format) into a sorted list.
+    """
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cpus)
+
+
+def logical_cpus():
+    """
+    The CPUs this process may run on.
+    """
+    if supported():
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cpus(cpus=None):
+    """
+    One logical CPU of every physical core among `cpus` (default: `logical_cpus`), so no
+    two of them are hyperthread siblings. Without topology information every CPU is
+    taken as its own core.
+    """
+    if cpus is None:
+        cpus = logical_cpus()
+    allowed = set(cpus)
+    seen = set()
+    result = []
+    for cpu in cpus:
+        try:
+            with open(TOPOLOGY.format(cpu), "r") as f:
+                siblings = tuple(c for c in parse_cpu_list(f.read()) if c in allowed)
+        except OSError:
+            siblings = (cpu,)
+        if siblings not in seen:
+            seen.add(siblings)
+            result.append(cpu)
+    return result
+
+
+def plan(workers, mode="none", cpus=None):
+    """
+    The CPU each of `workers` processes is pinned to, or `None` per worker to leave
+    placement to the OS. Workers are spread round-robin over the physical cores or
+    logical CPUs (see `MODES`) out of `cpus`.
+    """
+    if mode == "none" or not supported():
+        return [None] * workers
+    if cpus is None:
+        cpus = logical_cpus()
+    if mode == "physical":
+        cpus = physical_cpus(cpus)
+    return [cpus[i % len(cpus)] for i in range(workers)]
+
+
+def pin(cpu):
+    """
+    Pins the calling process to `cpu`, doing nothing for `None`.
+    """
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
@@ -0,0 +1,239 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+from casinobot import blackjack
+from simulator import simulator
+
+# Phases timed by `PhaseTimer.instrument`, in report order.
+# Time not spent in any of these while a round runs is reported as "engine".
+PHASES = ["deal", "decisions", "dealer", "settlement", "betting", "engine", "reset", "aggregation"]
+
+# (class, method, phase) to wrap with a timer
+INSTRUMENTED = [
+    (blackjack.Game, "deal_cards", "deal"),
+    (simulator.BlackjackHooks, "choose_action", "decisions"),
+    (blackjack.Game, "dealer_play", "dealer"),
+    (blackjack.Game, "calc_winners", "settlement"),
+    (blackjack.Game, "game_over", "settlement"),
+    (simulator.BlackjackHooks, "on_begin_game", "betting"),
+    (simulator.BlackjackHooks, "on_game_over", "betting"),
+    (simulator.BlackjackSimulator, "run", "engine"),
+    (simulator.BlackjackSimulator, "reset", "reset"),
+]
+
+
+class ProfileOptions:
+    """
+    What to collect in each worker.
+
+    :param cprofile: run the worker under cProfile
+    :param phases: collect per-phase timers
+    :param memory: track peak memory with tracemalloc
+    :param top: number of hotspots to report
+    """
+
+    def __init__(self, cprofile=True, phases=False, memory=False, top=20):
+        self.cprofile = cprofile
+        self.phases = phases
+        self.memory = memory
+        self.top = top
+        # set by the parent, workers dump their cProfile stats here
+        self.directory = None
+
+
+class PhaseTimer:
+    """
+    Exclusive wall-clock timers for the phases of a round.
+
+    Phases nest (the engine calls the dealer from inside a player's decision), so time
+    is always charged to the innermost running phase only.
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.stack = []
+        self.last = time.perf_counter()
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self.stack:
+            self.totals[self.stack[-1]] += now - self.last
+        self.stack.append(phase)
+        self.calls[phase] += 1
+        self.last = now
+
+    def exit(self):
+        now = time.perf_counter()
+        self.totals[self.stack.pop()] += now - self.last
+        self.last = now
+
+    def wrap(self, phase, fn):
+        timer = self
+
+        def timed(*args, **kwargs):
+            timer.enter(phase)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timer.exit()
+
+        timed.__wrapped__ = fn
+        return timed
+
+    def instrument(self):
+        """
+        Wraps the engine methods in `INSTRUMENTED` with timers. Only call this in a worker
+        process, the classes stay patched until `uninstrument`.
+        """
+        for (cls, name, phase) in INSTRUMENTED:
+            setattr(cls, name, self.wrap(phase, getattr(cls, name)))
+
+    @staticmethod
+    def uninstrument():
+        for (cls, name, _) in INSTRUMENTED:
+            fn = getattr(cls, name)
+            setattr(cls, name, getattr(fn, "__wrapped__", fn))
+
+
+class WorkerProfiler:
+    """
+    Collects the profile of one worker process, as configured by `ProfileOptions`.
+    """
+
+    def __init__(self, num, options):
+        self.num = num
+        self.options = options
+        self.profiler = cProfile.Profile() if options.cprofile else None
+        self.timer = PhaseTimer() if options.phases else None
+        self.start_time = 0
+
+    def start(self):
+        if self.options.memory:
+            tracemalloc.start()
+        if self.timer is not None:
+            self.timer.instrument()
+        self.start_time = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        """
+        Stops profiling and returns this worker's report.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+        report = {
+            "worker": self.num,
+            "pid": os.getpid(),
+            "wall": time.perf_counter() - self.start_time,
+        }
+        if self.timer is not None:
+            self.timer.uninstrument()
+            report["phases"] = self.timer.totals
+            report["phase_calls"] = self.timer.calls
+        if self.options.memory:
+            report["memory_peak"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if self.profiler is not None:
+            report["stats_file"] = os.path.join(self.options.directory, "worker-{:03d}.prof".format(self.num))
+            self.profiler.dump_stats(report["stats_file"])
+        # the parent subtracts this from the time it receives the report
+        report["sent"] = time.time()
+        return report
+
+
+def merge_stats(reports):
+    """
+    Merges the cProfile stats of all workers into one `pstats.Stats`, or `None` if there are none.
+    """
+    files = [r["stats_file"] for r in reports if "stats_file" in r]
+    if not files:
+        return None
+    return pstats.Stats(*files, stream=io.StringIO())
+
+
+def hotspots(merged, top):
+    """
+    The `top` functions by own time, as a list of dicts.
+    """
+    rows = []
+    for (func, (cc, nc, tt, ct, _)) in merged.stats.items():
+        rows.append({
+            "function": pstats.func_std_string(func),
+            "calls": nc,
+            "primitive_calls": cc,
+            "tottime": tt,
+            "cumtime": ct,
+        })
+    rows.sort(key=lambda r: r["tottime"], reverse=True)
+    return rows[:top]
+
+
+def merge_phases(reports):
+    totals = dict.fromkeys(PHASES, 0.0)
+    for r in reports:
+        for phase, t in r.get("phases", {}).items():
+            totals[phase] += t
+    return totals
+
+
+def print_report(reports, options, print_fn=print):
+    """
+    Prints the combined hotspot, phase and memory report of all workers.
+    """
+    reports = sorted(reports, key=lambda r: r["worker"])
+    print_fn("Profile:")
+    for r in reports:
+        line = "  Worker {:<3} {:>10.2f}s".format(r["worker"], r["wall"])
+        if "ipc" in r:
+            line += "  ipc {:>8.3f}s".format(r["ipc"])
+        if "memory_peak" in r:
+            line += "  peak memory {:>12,} B".format(r["memory_peak"])
+        print_fn(line)
+
+    if options.phases:
+        totals = merge_phases(reports)
+        all_time = sum(totals.values()) or 1
+        print_fn()
+        print_fn("  Phases (all workers):")
+        for phase in PHASES:
+            print_fn("    {:.<16}{:.>14.3f}s ({:>6.2%})".format(phase, totals[phase], totals[phase] / all_time))
+
+    merged = merge_stats(reports)
+    if merged is not None:
+        print_fn()
+        print_fn("  Hotspots (all workers, by own time):")
+        print_fn("    {:>10} {:>10} {:>10}  {}".format("calls", "tottime", "cumtime", "function"))
+        for row in hotspots(merged, options.top):
+            print_fn("    {:>10} {:>10.3f} {:>10.3f}  {}".format(
+                row["calls"], row["tottime"], row["cumtime"], row["function"]))
+
+
+def write_dump(path, reports, options):
+    """
+    Writes the machine-readable report to `path` (JSON) and, when cProfile was used,
+    the merged stats next to it with a ".prof" extension (loadable with `pstats`).
+    """
+    reports = sorted(reports, key=lambda r: r["worker"])
+    dump = {
+        "workers": [{k: v for k, v in r.items() if k != "stats_file"} for r in reports],
+    }
+    if options.phases:
+        dump["phases"] = merge_phases(reports)
+    if options.memory:
+        dump["memory_peak"] = max(r["memory_peak"] for r in reports)
+
+    merged = merge_stats(reports)
+    if merged is not None:
+        dump["hotspots"] = hotspots(merged, options.top)
+        dump["stats_file"] = os.path.splitext(path)[0] + ".prof"
+        merged.dump_stats(dump["stats_file"])
+
+    with open(path, "w") as f:
+        json.dump(dump, f, indent=2)
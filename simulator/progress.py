@@ -0,0 +1,95 @@
+import json
+import sys
+import time
+
+RUIN_REASON = "Ran out of gold."
+
+
+class ProgressMonitor:
+    """
+    Collects progress of the workers in the parent, renders a refreshing status line
+    and optionally appends every sample to a JSON lines metrics file.
+    """
+
+    def __init__(self, iterations, render=True, metrics_file=None, out=sys.stderr, time_limit=None):
+        self.iterations = iterations
+        # with a time limit, progress and ETA are of the time, the iterations are only a cap
+        self.time_limit = time_limit
+        self.render_line = render
+        self.metrics = open(metrics_file, 'a') if metrics_file is not None else None
+        self.out = out
+        self.start = time.perf_counter()
+        # latest counters per worker, keyed by worker number
+        self.workers = {}
+        self.width = 0
+
+    def update(self, num, done, rounds, counts):
+        """
+        Sets the latest counters of worker `num`: iterations done, rounds played and
+        end reason counts per player.
+        """
+        self.workers[num] = (done, rounds, counts)
+
+    def publish(self):
+        """
+        Renders and records a sample of the latest counters of all workers.
+        """
+        sample = self.sample()
+        if self.render_line:
+            self.render(sample)
+        if self.metrics is not None:
+            self.metrics.write(json.dumps(sample) + "\n")
+            self.metrics.flush()
+
+    def sample(self):
+        elapsed = time.perf_counter() - self.start
+        done = sum(w[0] for w in self.workers.values())
+        rounds = sum(w[1] for w in self.workers.values())
+
+        reasons = []
+        for (_, _, counts) in self.workers.values():
+            for i, pl_counts in enumerate(counts):
+                if i >= len(reasons):
+                    reasons.append({})
+                for reason, count in pl_counts.items():
+                    reasons[i][reason] = reasons[i].get(reason, 0) + count
+
+        its_per_sec = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.iterations - done) / its_per_sec if its_per_sec > 0 else None
+        if self.time_limit is not None:
+            left = max(0.0, self.time_limit - elapsed)
+            eta = left if eta is None else min(eta, left)
+        return {
+            "time": time.time(),
+            "elapsed": elapsed,
+            "iterations": done,
+            "total_iterations": self.iterations,
+            "rounds": rounds,
+            "iterations_per_sec": its_per_sec,
+            "rounds_per_sec": rounds / elapsed if elapsed > 0 else 0.0,
+            "eta": eta,
+            "ruin": [r.get(RUIN_REASON, 0) / done if done > 0 else 0.0 for r in reasons],
+            "reasons": reasons,
+            "workers": {str(num): w[0] for num, w in sorted(self.workers.items())},
+        }
+
+    def render(self, sample):
+        eta = "--" if sample["eta"] is None else "{:.0f}s".format(sample["eta"])
+        if self.time_limit is not None:
+            done = "{:>6.1%} {:,} its".format(min(1.0, sample["elapsed"] / self.time_limit), sample["iterations"])
+        else:
+            done = "{:>6.1%} {:,}/{:,} its".format(sample["iterations"] / self.iterations if self.iterations else 1.0,
+                                                  sample["iterations"], self.iterations)
+        line = "{}  {:,.1f} its/s  {:,.0f} rounds/s  ETA {}  ruin {}".format(
+            done, sample["iterations_per_sec"], sample["rounds_per_sec"], eta,
+            "/".join("{:.2%}".format(r) for r in sample["ruin"]) or "--")
+        self.out.write("\r" + line.ljust(self.width))
+        self.out.flush()
+        self.width = len(line)
+
+    def close(self):
+        if self.render_line and self.width > 0:
+            self.out.write("\n")
+            self.out.flush()
+        if self.metrics is not None:
+            self.metrics.close()
@@ -0,0 +1,185 @@
+import array
+import json
+import mmap
+import os
+import sys
+
+# End reasons known up front, so their codes are the same in every shard.
+# Reasons not in this list are appended to the shard's own table as they show up.
+END_REASONS = [
+    "N/A",
+    "Ran out of gold.",
+    "Reached target gold.",
+    "Finished rounds.",
+    "Infinite loop: zero gold bets.",
+]
+
+# (column name, `array` typecode, numpy dtype, attribute on `simulator.Player`/`BlackjackStats`)
+COLUMNS = [
+    ("player",           "B", "<u1", None),
+    ("reason",           "B", "<u1", None),
+    ("gold_end",         "q", "<i8", "gold_end"),
+    ("gold_min",         "q", "<i8", "gold_min"),
+    ("gold_max",         "q", "<i8", "gold_max"),
+    ("hands",            "L", "<u4", "total_hands"),
+    ("win_streak",       "H", "<u2", "win_streak"),
+    ("loss_streak",      "H", "<u2", "loss_streak"),
+    ("tie_streak",       "H", "<u2", "tie_streak"),
+    ("surrender_streak", "H", "<u2", "surrender_streak"),
+]
+
+INDEX_FILE = "index.json"
+
+# `array` typecodes are platform sized, pick ones matching the on-disk dtypes
+if array.array("L").itemsize != 4:
+    COLUMNS = [(n, "I" if tc == "L" else tc, dt, a) for (n, tc, dt, a) in COLUMNS]
+
+
+def column_file(shard, column):
+    """
+    File name of `column` in `shard`, relative to the records directory.
+    """
+    return "shard-{:03d}.{}.bin".format(shard, column)
+
+
+class RecordWriter:
+    """
+    Writes one row per player per iteration into a columnar shard.
+
+    Every column is a flat little-endian binary file, so a shard can be opened with
+    `numpy.memmap` (or `open_column`) without any parsing. Rows are buffered in
+    `array`s and appended to the files every `flush_every` rows, so memory use
+    stays bounded no matter how many iterations are written.
+    """
+
+    def __init__(self, directory, shard, flush_every=65536):
+        self.directory = directory
+        self.shard = shard
+        self.flush_every = flush_every
+        self.rows = 0
+        self.pending = 0
+
+        self.reasons = list(END_REASONS)
+        self.codes = {reason: i for i, reason in enumerate(self.reasons)}
+
+        self.columns = {}
+        self.files = {}
+        for (name, typecode, _, _) in COLUMNS:
+            self.columns[name] = array.array(typecode)
+            self.files[name] = open(os.path.join(directory, column_file(shard, name)), "wb")
+
+    def reason_code(self, reason):
+        if reason not in self.codes:
+            self.codes[reason] = len(self.reasons)
+            self.reasons.append(reason)
+        return self.codes[reason]
+
+    def add(self, player, pl):
+        """
+        Adds the result of one iteration of `pl` (a `simulator.Player`) sitting at seat `player`.
+        """
+        cols = self.columns
+        cols["player"].append(player)
+        cols["reason"].append(self.reason_code(pl.end_reason))
+        for (name, _, _, attr) in COLUMNS:
+            if attr is not None:
+                cols[name].append(int(getattr(pl.stats, attr)))
+        self.rows += 1
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        for name, col in self.columns.items():
+            if sys.byteorder != "little":
+                col.byteswap()
+            col.tofile(self.files[name])
+            del col[:]
+        self.pending = 0
+
+    def close(self):
+        """
+        Flushes and closes the shard, returning its entry for the index file.
+        """
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        return {
+            "shard": self.shard,
+            "rows": self.rows,
+            "reasons": self.reasons,
+            "files": {name: column_file(self.shard, name) for (name, _, _, _) in COLUMNS},
+        }
+
+
+def write_index(directory, shards, **info):
+    """
+    Writes the index file describing all `shards` (as returned by `RecordWriter.close`).
+    Any extra keyword arguments are stored as run information.
+    """
+    shards = sorted(shards, key=lambda s: s["shard"])
+    index = {
+        "version": 1,
+        "columns": [{"name": name, "dtype": dtype} for (name, _, dtype, _) in COLUMNS],
+        "rows": sum(s["rows"] for s in shards),
+        "shards": shards,
+        "info": info,
+    }
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def load_index(directory):
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        return json.load(f)
+
+
+def open_column(directory, shard, column, use_numpy=True):
+    """
+    Memory-maps `column` of the given `shard` (an entry of the index file).
+
+    Returns a read-only `numpy.memmap` if numpy is available, otherwise a `memoryview`
+    over an `mmap` with the matching typecode. Nothing is read until it is sliced.
+    """
+    dtypes = {name: (typecode, dtype) for (name, typecode, dtype, _) in COLUMNS}
+    typecode, dtype = dtypes[column]
+    path = os.path.join(directory, shard["files"][column])
+
+    if use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            if shard["rows"] == 0:
+                return numpy.zeros(0, dtype=dtype)
+            return numpy.memmap(path, dtype=dtype, mode="r", shape=(shard["rows"],))
+
+    if shard["rows"] == 0:
+        return memoryview(array.array(typecode))
+    if sys.byteorder != "little":
+        # can't map big-endian natively, fall back to reading the column
+        col = array.array(typecode)
+        with open(path, "rb") as f:
+            col.fromfile(f, shard["rows"])
+        col.byteswap()
+        return memoryview(col)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode)
+
+
+def open_records(directory, use_numpy=True):
+    """
+    Opens every shard listed in the index of `directory`.
+
+    Returns the index and a list with a `{column: array}` dict per shard. Reason codes
+    are per shard, look them up in `shard["reasons"]`.
+    """
+    index = load_index(directory)
+    shards = []
+    for shard in index["shards"]:
+        shards.append({c["name"]: open_column(directory, shard, c["name"], use_numpy)
+                       for c in index["columns"]})
+    return index, shards
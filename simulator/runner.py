@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import random
+import time
+
+from casinobot import player
+from simulator import betting, simulator, stats, strategy
+
+DEFAULT_STRAT = "strats/strat.txt"
+MAX_PLAYERS = 6
+
+# Strategies and simulators of this process, kept warm between chunks by pool workers
+_strategies = {}
+_simulators = {}
+
+
+class PlayerConfig:
+    """
+    One seat at the table: betting system, its options, gold, target gold and strategy file.
+    """
+
+    def __init__(self, bet_system, bet_options="", gold=0, target=0, strat=DEFAULT_STRAT):
+        self.bet_system = bet_system
+        self.bet_options = bet_options
+        self.gold = gold
+        self.target = target
+        self.strat = strat
+
+    def to_dict(self):
+        return {
+            "bet_system": self.bet_system,
+            "bet_options": self.bet_options,
+            "gold": self.gold,
+            "target": self.target,
+            "strat": self.strat,
+        }
+
+    @classmethod
+    def from_dict(cls, d, defaults=None):
+        d = dict(defaults or {}, **d)
+        return cls(d["bet_system"], d.get("bet_options", ""), int(d.get("gold", 0)),
+                   int(d.get("target", 0)), d.get("strat", DEFAULT_STRAT))
+
+
+class Scenario:
+    """
+    Everything needed to run a simulation: the players and the run options shared by all of them.
+    """
+
+    def __init__(self, players, iterations=1, rounds=0, anti_fallacy=False, positive_prog=False, name=None,
+                 seed=None):
+        self.players = players
+        self.iterations = iterations
+        self.rounds = rounds
+        self.anti_fallacy = anti_fallacy
+        self.positive_prog = positive_prog
+        self.name = name
+        # when set, iteration `i` always plays the same cards (see `seed_iteration`)
+        self.seed = seed
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "players": [pl.to_dict() for pl in self.players],
+            "iterations": self.iterations,
+            "rounds": self.rounds,
+            "anti_fallacy": self.anti_fallacy,
+            "positive_prog": self.positive_prog,
+            "seed": self.seed,
+        }
+
+    @classmethod
+    def from_dict(cls, d, defaults=None):
+        """
+        Builds a scenario from a dict, falling back to `defaults` for missing keys.
+
+        Either a list of `players` can be given, or the keys of a single player
+        (`bet_system`, `bet_options`, `gold`, `target`, `strat`) directly in `d`.
+        Player keys in `defaults` apply to every player.
+        """
+        d = dict(defaults or {}, **d)
+        player_keys = ("bet_system", "bet_options", "gold", "target", "strat")
+        player_defaults = {k: d[k] for k in player_keys if k in d}
+        if "players" in d:
+            players = [PlayerConfig.from_dict(pl, player_defaults) for pl in d["players"]]
+        else:
+            players = [PlayerConfig.from_dict(player_defaults)]
+        return cls(players, int(d.get("iterations", 1)), int(d.get("rounds", 0)),
+                   bool(d.get("anti_fallacy", False)), bool(d.get("positive_prog", False)), d.get("name"),
+                   d.get("seed"))
+
+    def validate(self):
+        """
+        Raises `ValueError` if the scenario can't be run.
+        """
+        if not 0 < len(self.players) <= MAX_PLAYERS:
+            raise ValueError("{} players is the maximum, {} given".format(MAX_PLAYERS, len(self.players)))
+        for pl in self.players:
+            if pl.bet_system not in betting.BETTING_SYSTEMS:
+                raise ValueError("Invalid betting system '{}'".format(pl.bet_system))
+            try:
+                betting.BETTING_SYSTEMS[pl.bet_system].from_options(pl.bet_options)
+            except RuntimeError as err:
+                raise ValueError(str(err))
+        if self.rounds == 0 and any(pl.target == 0 for pl in self.players):
+            raise ValueError("At least one end condition (target or rounds) needs to be enabled.")
+        if self.iterations < 1:
+            raise ValueError("At least one iteration is needed.")
+
+    def key(self):
+        """
+        Identifies the table this scenario plays at, ignoring its name and iteration count.
+        """
+        d = self.to_dict()
+        del d["name"]
+        del d["iterations"]
+        return json.dumps(d, sort_keys=True)
+
+    def strat_files(self):
+        return sorted(set(pl.strat for pl in self.players))
+
+    def build(self, strategies, out=None):
+        """
+        Creates the simulator for this scenario, using the loaded `strategies` (see `load_strategies`).
+        """
+        players = []
+        for i, cfg in enumerate(self.players):
+            bet_system = betting.BETTING_SYSTEMS[cfg.bet_system].from_options(cfg.bet_options)
+            strat = strategies[strategy_key(cfg.strat)]
+            players.append(simulator.Player(strat, bet_system, cfg.bet_options, cfg.gold, cfg.target, str(i + 1)))
+
+        bj = simulator.BlackjackSimulator(players, out)
+        bj.set_anti_fallacy(self.anti_fallacy)
+        bj.set_positive_prog(self.positive_prog)
+        bj.set_target_gold(self.players[0].target)
+        bj.reset()
+        return bj
+
+    def new_stats(self):
+        """
+        One `BlackjackStats` per player to merge results into.
+        """
+        total_stats = []
+        for cfg in self.players:
+            st = stats.BlackjackStats()
+            st.gold_start = cfg.gold
+            st.gold_min = cfg.gold
+            st.gold_target = cfg.target
+            total_stats.append(st)
+        return total_stats
+
+
+def strategy_key(file):
+    return os.path.realpath(file)
+
+
+def strategy_digest(file):
+    with open(file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_strategies(files, strategies=None):
+    """
+    Loads every strategy file in `files` once, returning a dict keyed by `strategy_key`.
+    Files already in `strategies` are not loaded again, and files with the same contents
+    share one table, so seats playing the same strategy from different paths cost nothing extra.
+    """
+    if strategies is None:
+        strategies = {}
+    by_digest = {st.digest: st for st in strategies.values() if st.digest is not None}
+    for file in files:
+        key = strategy_key(file)
+        if key in strategies:
+            continue
+        digest = strategy_digest(file)
+        if digest not in by_digest:
+            by_digest[digest] = strategy.BlackjackStrategy.from_file(file)
+            by_digest[digest].digest = digest
+        strategies[key] = by_digest[digest]
+    return strategies
+
+
+def new_totals(bj):
+    """
+    Empty per-player end reasons and stats for the players of `bj`.
+    """
+    reasons = []
+    total_stats = []
+    for pl in bj.players:
+        st = stats.BlackjackStats()
+        st.gold_min = pl.starting_gold
+        total_stats.append(st)
+        reasons.append({})
+    return reasons, total_stats
+
+
+def add_iteration(reasons, total_stats, pls):
+    """
+    Adds the result of one iteration (the players returned by `BlackjackSimulator.run`).
+    """
+    for i, pl in enumerate(pls):
+        total_stats[i].add(pl.stats)
+        reason = pl.end_reason
+        if reason not in reasons[i]:
+            reasons[i][reason] = {"count": 0, "gold_end": [], "hands": []}
+        reasons[i][reason]["count"] += 1
+        reasons[i][reason]["gold_end"].append(pl.stats.gold_end)
+        reasons[i][reason]["hands"].append(pl.stats.total_hands)
+
+
+def compact_reasons(reasons):
+    """
+    Replaces the per-iteration end gold and hands lists of `reasons` by their sums,
+    which is all the reports need and can be stored and merged cheaply.
+    """
+    compact = []
+    for reas in reasons:
+        compact.append({reason: {"count": r["count"], "gold_end": sum(r["gold_end"]), "hands": sum(r["hands"])}
+                        for reason, r in reas.items()})
+    return compact
+
+
+def add_compact_reasons(total_reasons, many_reasons):
+    """
+    Merges per-player end reasons made by `compact_reasons` into `total_reasons`.
+    """
+    for i, reas in enumerate(many_reasons):
+        if i >= len(total_reasons):
+            total_reasons.append({})
+        for reason, r in reas.items():
+            if reason not in total_reasons[i]:
+                total_reasons[i][reason] = dict(r)
+            else:
+                for k in ("count", "gold_end", "hands"):
+                    total_reasons[i][reason][k] += r[k]
+
+
+def seed_iteration(seed, index):
+    """
+    Seeds the global RNG for iteration `index` of a run. Every iteration gets its own
+    stream, so results don't depend on how iterations are split over processes, and
+    a run can later be extended with iterations nobody played yet.
+    """
+    random.seed("{}:{}".format(seed, index))
+
+
+def run_iterations(bj, iterations, rounds, seed=None, first=0):
+    """
+    Runs `iterations` of `bj` in this process, returning the per-player end reasons and stats.
+    With a `seed`, they are iterations `first` to `first + iterations - 1` of the seeded run.
+    """
+    reasons, total_stats = new_totals(bj)
+    for it in range(iterations):
+        if seed is not None:
+            seed_iteration(seed, first + it)
+        bj.reset()
+        add_iteration(reasons, total_stats, bj.run(rounds))
+    return reasons, total_stats
+
+
+def warm(strat_files=(), strategies=None):
+    """
+    Pool initializer: preloads `strat_files`, and any already loaded `strategies`,
+    into this process' strategy cache.
+    """
+    if strategies is not None:
+        _strategies.update(strategies)
+    load_strategies(strat_files, _strategies)
+
+
+def simulator_for(scenario):
+    """
+    The simulator of `scenario` in this process, built on first use and reused after,
+    with the strategies of the process' cache.
+    """
+    load_strategies(scenario.strat_files(), _strategies)
+    key = scenario.key()
+
+    # Seats of the scenario that ran before stay in the global player table otherwise
+    player.players.clear()
+    del player.in_game[:]
+
+    if key not in _simulators:
+        _simulators[key] = scenario.build(_strategies)
+    return _simulators[key]
+
+
+def run_chunk(scenario, iterations, first=0):
+    """
+    Runs `iterations` of `scenario` in this process, starting at iteration `first`, reusing
+    the strategies and simulator built by earlier chunks. Returns the iterations, time taken,
+    end reasons and stats.
+    """
+    bj = simulator_for(scenario)
+    start = time.perf_counter()
+    reasons, total_stats = run_iterations(bj, iterations, scenario.rounds, scenario.seed, first)
+    return iterations, time.perf_counter() - start, reasons, total_stats
+
+
+def split_iterations(iterations, chunk, first=0):
+    """
+    Splits `iterations` into chunks of at most `chunk` iterations, returning
+    (iterations, first iteration) of every chunk.
+    """
+    chunks = []
+    end = first + iterations
+    while first < end:
+        chunks.append((min(chunk, end - first), first))
+        first += chunk
+    return chunks
+
+
+def parse_duration(text):
+    """
+    Parses a duration like "90", "90s", "10m" or "1.5h" into seconds.
+    """
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip()
+    scale = 1
+    if text and text[-1] in units:
+        scale = units[text[-1]]
+        text = text[:-1]
+    seconds = float(text) * scale
+    if seconds <= 0:
+        raise ValueError("needs to be positive")
+    return seconds
+
+
+def summarize(reasons, total_stats, iterations):
+    """
+    Machine-readable summary of merged results: per player, the end reasons with their
+    share, average end gold and hands, and the merged stats. `reasons` are compacted
+    (see `compact_reasons`).
+    """
+    players = []
+    for reas, st in zip(reasons, total_stats):
+        end_reasons = {}
+        for reason in sorted(reas.keys()):
+            r = reas[reason]
+            end_reasons[reason] = {
+                "count": r["count"],
+                "fraction": r["count"] / iterations,
+                "avg_gold_end": r["gold_end"] / r["count"],
+                "avg_hands": r["hands"] / r["count"],
+            }
+        players.append({"end_reasons": end_reasons, "stats": st.to_dict()})
+    return players
+
+
+def scenario_report(scenario, reasons, total_stats, iterations, cpu_time):
+    """
+    The report of one finished scenario, as used by the batch runner and the service.
+    `reasons` are compacted (see `compact_reasons`).
+    """
+    players = summarize(reasons, total_stats, iterations)
+    for pl, cfg in zip(players, scenario.players):
+        pl["config"] = cfg.to_dict()
+    return {
+        "name": scenario.name,
+        "config": scenario.to_dict(),
+        "iterations": iterations,
+        "cpu_time": cpu_time,
+        "players": players,
+    }
@@ -0,0 +1,208 @@
+import array
+import time
+from multiprocessing import shared_memory
+
+from simulator import records, stats
+
+# Per-player stats kept in a slot, and how they are merged
+SUMMED = stats.SUMMED
+MAXED = stats.MAXED
+MINED = ["gold_min"]
+STAT_FIELDS = SUMMED + MAXED + MINED
+
+# End reasons have fixed codes, as in the record shards
+END_REASONS = records.END_REASONS
+# count, sum of end gold and sum of hands of every end reason
+REASON_SUMS = ["count", "gold_end", "hands"]
+
+# iterations done and rounds played, ahead of the players
+HEADER = ["done", "rounds"]
+
+ITEMSIZE = array.array("q").itemsize
+
+
+class SharedResults:
+    """
+    Per-worker result aggregates in one block of shared memory, so workers never pickle
+    their results and the parent can read their progress at any time without asking.
+
+    Every worker owns `batches` slots of 64-bit integers, and adds each iteration to the
+    slot of its batch (its iterations split evenly in order, or its time until a deadline). A slot holds the iterations
+    done, rounds played and, per player, the merged stats and the count, end gold sum and
+    hands sum of every end reason. `reduce` merges all slots, with numpy if it is
+    installed, and the slots themselves are batch aggregates for `intervals`.
+    """
+
+    def __init__(self, workers, starting_golds, batches=1):
+        self.workers = workers
+        self.batches = batches
+        self.slots = workers * batches
+        self.players = len(starting_golds)
+        self.player_len = len(STAT_FIELDS) + len(END_REASONS) * len(REASON_SUMS)
+        self.slot_len = len(HEADER) + self.players * self.player_len
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.slots * self.slot_len * ITEMSIZE))
+        self.view = self.shm.buf.cast("q")
+
+        for slot in range(self.slots):
+            for i in range(self.slot_len):
+                self.view[slot * self.slot_len + i] = 0
+            for p, gold in enumerate(starting_golds):
+                self.view[self.stat_index(slot, p, "gold_min")] = gold
+
+    def stat_index(self, slot, player, field):
+        return slot * self.slot_len + len(HEADER) + player * self.player_len + STAT_FIELDS.index(field)
+
+    def reason_index(self, slot, player, reason, key="count"):
+        return (slot * self.slot_len + len(HEADER) + player * self.player_len + len(STAT_FIELDS) +
+                END_REASONS.index(reason) * len(REASON_SUMS) + REASON_SUMS.index(key))
+
+    def slot(self, worker, iterations, deadline=None):
+        """
+        The writer for the slots of `worker`, which runs `iterations` or until the `deadline`
+        (a `time.time()`), used in the worker process.
+        """
+        return WorkerSlot(self, worker, iterations, deadline)
+
+    def progress(self, worker):
+        """
+        Iterations done, rounds played and end reason counts per player of `worker`,
+        as `progress.ProgressMonitor.update` takes them.
+        """
+        slots = range(worker * self.batches, (worker + 1) * self.batches)
+        counts = []
+        for p in range(self.players):
+            pl_counts = {}
+            for reason in END_REASONS:
+                count = sum(self.view[self.reason_index(slot, p, reason)] for slot in slots)
+                if count > 0:
+                    pl_counts[reason] = count
+            counts.append(pl_counts)
+        done = sum(self.view[slot * self.slot_len] for slot in slots)
+        rounds = sum(self.view[slot * self.slot_len + 1] for slot in slots)
+        return done, rounds, counts
+
+    def reduce(self, use_numpy=True):
+        """
+        Merges the slots of all workers, returning the compact end reasons (see
+        `runner.compact_reasons`) and a `BlackjackStats` per player.
+        """
+        totals = None
+        if use_numpy:
+            try:
+                import numpy
+            except ImportError:
+                pass
+            else:
+                slots = numpy.ndarray((self.slots, self.slot_len), dtype=numpy.int64, buffer=self.shm.buf)
+                summed = slots.sum(axis=0).tolist()
+                maxed = slots.max(axis=0).tolist()
+                mined = slots.min(axis=0).tolist()
+                totals = (summed, maxed, mined)
+                del slots
+        if totals is None:
+            columns = [[self.view[slot * self.slot_len + i] for slot in range(self.slots)]
+                       for i in range(self.slot_len)]
+            totals = ([sum(c) for c in columns], [max(c) for c in columns], [min(c) for c in columns])
+        return self._decode(*totals)
+
+    def batches_done(self):
+        """
+        Every slot that got at least one iteration, as its (iterations, compact end reasons,
+        stats) for `intervals.BatchIntervals`.
+        """
+        result = []
+        for slot in range(self.slots):
+            row = self.view[slot * self.slot_len:(slot + 1) * self.slot_len].tolist()
+            if row[0] > 0:
+                result.append((row[0],) + self._decode(row, row, row))
+        return result
+
+    def _decode(self, summed, maxed, mined):
+        reasons = []
+        total_stats = []
+        for p in range(self.players):
+            base = len(HEADER) + p * self.player_len
+            st = stats.BlackjackStats()
+            for f in STAT_FIELDS:
+                i = base + STAT_FIELDS.index(f)
+                setattr(st, f, summed[i] if f in SUMMED else maxed[i] if f in MAXED else mined[i])
+            total_stats.append(st)
+
+            reas = {}
+            for r, reason in enumerate(END_REASONS):
+                i = base + len(STAT_FIELDS) + r * len(REASON_SUMS)
+                if summed[i] > 0:
+                    reas[reason] = {k: summed[i + j] for j, k in enumerate(REASON_SUMS)}
+            reasons.append(reas)
+        return reasons, total_stats
+
+    def close(self):
+        """
+        Frees the shared memory. Only call this in the parent, after all workers finished.
+        """
+        self.view.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class WorkerSlot:
+    """
+    Adds the results of a worker's iterations straight into the slot of their batch. With
+    a deadline, batches split the time left instead, since the iterations are not known.
+    """
+
+    def __init__(self, results, worker, iterations, deadline=None):
+        self.view = results.view
+        self.first_slot = worker * results.batches
+        self.batches = results.batches
+        self.iterations = max(1, iterations)
+        self.start = time.time()
+        self.duration = None if deadline is None else max(1e-9, deadline - self.start)
+        self.done = 0
+        self.base = self.first_slot * results.slot_len
+        self.slot_len = results.slot_len
+        self.player_len = results.player_len
+        self.codes = {reason: i for i, reason in enumerate(END_REASONS)}
+        # end reasons without a code, sent to the parent at the end (see `runner.compact_reasons`)
+        self.other_reasons = [{} for _ in range(results.players)]
+
+    def add_iteration(self, pls, rounds):
+        """
+        Adds one iteration (the players returned by `BlackjackSimulator.run`) that lasted `rounds`.
+        """
+        v = self.view
+        if self.batches > 1:
+            if self.duration is not None:
+                batch = min(self.batches - 1, int((time.time() - self.start) * self.batches / self.duration))
+            else:
+                batch = self.done * self.batches // self.iterations
+            self.base = (self.first_slot + batch) * self.slot_len
+        self.done += 1
+        v[self.base] += 1
+        v[self.base + 1] += rounds
+        for p, pl in enumerate(pls):
+            st = pl.stats
+            i = self.base + len(HEADER) + p * self.player_len
+            for f in SUMMED:
+                v[i] += getattr(st, f)
+                i += 1
+            for f in MAXED:
+                value = getattr(st, f)
+                if value > v[i]:
+                    v[i] = value
+                i += 1
+            if st.gold_min < v[i]:
+                v[i] = st.gold_min
+            i += 1
+
+            code = self.codes.get(pl.end_reason)
+            if code is None:
+                other = self.other_reasons[p].setdefault(pl.end_reason, {k: 0 for k in REASON_SUMS})
+                other["count"] += 1
+                other["gold_end"] += st.gold_end
+                other["hands"] += st.total_hands
+                continue
+            i += code * len(REASON_SUMS)
+            v[i] += 1
+            v[i + 1] += st.gold_end
+            v[i + 2] += st.total_hands
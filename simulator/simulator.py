@@ -44,9 +44,20 @@ class BlackjackHooks:
         self.anti_fallacy = False
         self.af_trigger = False
         self.positive_prog = False
+        # optional `importance.ImportanceSampler` dealing the cards
+        self.sampler = None
+        # optional `history.HistoryWriter`, told about rounds it is capturing
+        self.tracer = None
 
         self.reset_results()
 
+    def reset(self):
+        """
+        Puts the hooks back to their state for a new iteration, keeping the options.
+        """
+        self.af_trigger = False
+        self.reset_results()
+
     def print(self, *args):
         if self.output is not None:
             self.output(*args)
@@ -67,6 +78,17 @@ class BlackjackHooks:
         """
         self.print("on_init")
 
+    def new_deck(self, bj):
+        """
+        Called when the cards are dealt, returns the shoe to deal from.
+        """
+        tracer = self.tracer
+        if tracer is not None and tracer.capturing:
+            tracer.bets(self.players)
+        if self.sampler is not None:
+            return self.sampler.new_deck()
+        return bj.new_deck()
+
     def on_begin_game(self, bj):
         """
         Called when the game starts and bets can be placed.
@@ -97,6 +119,8 @@ class BlackjackHooks:
                 pl.ended = True
             else:
                 self.print("Phenny:", pl.player.place_bet(bet))
+                if bet > pl.stats.max_bet:
+                    pl.stats.max_bet = bet
 
     def reset_results(self):
         """
@@ -151,6 +175,9 @@ class BlackjackHooks:
         """
         Called when the game is over and all cards revealed.
         """
+        tracer = self.tracer
+        if tracer is not None and tracer.capturing:
+            tracer.snapshot()
         for pl in self.players:
             res = pl.wins - pl.losses
             if self.positive_prog:
@@ -173,12 +200,11 @@ class BlackjackHooks:
         Uses the dealer's visible card and own hand to pick an action from
         the selected strategy, and translates different actions to CasinoBot calls.
         """
-        if type(uid) is not int:
-            return
         self.print("choose_action", uid)
-        pl = self.players[uid - 1]
-        bet = player.players[uid].bet
+        # split hands have a fake uid, and play for the seat they were split from
         pid = player.players[uid].uid
+        pl = self.players[pid - 1]
+        bet = player.players[uid].bet
         hand = player.players[uid].hand
         dealer = player.players[0].hand.cards[1].rank
 
@@ -193,42 +219,42 @@ class BlackjackHooks:
         self.print("Hand:", hand)
         self.print("Strat:", st)
         if st == 'H':
-            bj.hit(pid)
+            action = bj.hit
         elif st == 'S':
-            bj.stand(pid)
+            action = bj.stand
         elif st == 'P':
             if pl.gold < bet:
                 print("Not enough gold to split")
             if not bj.accept_split:
                 raise RuntimeError("Unable to split for some reason")
-            bj.split(pid)
+            action = bj.split
         elif st == 'D' or st == 'Dh':
             if bj.accept_doubledown and pl.bet_system.can_double():
                 if bet > pl.gold:
                     print("Not enough gold to doubledown")
-                bj.doubledown(pid)
+                action = bj.doubledown
             else:
-                bj.hit(pid)
+                action = bj.hit
         elif st == 'R' or st == 'Rh':
             if bj.accept_surrender:
-                bj.surrender(pid)
+                action = bj.surrender
             else:
-                bj.hit(pid)
+                action = bj.hit
         elif st == 'Rs':
             if bj.accept_surrender:
-                bj.surrender(pid)
+                action = bj.surrender
             else:
-                bj.stand(pid)
+                action = bj.stand
         elif st == 'Ds':
             if bj.accept_doubledown and pl.bet_system.can_double():
-                bj.doubledown(pid)
+                action = bj.doubledown
             else:
-                bj.stand(pid)
+                action = bj.stand
         elif st == 'H*':
             if len(hand.cards) > 2:
-                bj.stand(pid)
+                action = bj.stand
             else:
-                bj.hit(pid)
+                action = bj.hit
         elif st == '?':
             actions = [bj.stand, bj.hit]
             if bj.accept_doubledown and pl.bet_system.can_double():
@@ -237,10 +263,15 @@ class BlackjackHooks:
                 actions.append(bj.split)
             if bj.accept_surrender:
                 actions.append(bj.surrender)
-            random.choice(actions)(pid)
+            action = random.choice(actions)
         else:
             raise RuntimeError("missing strategy '{0}'".format(st))
 
+        tracer = self.tracer
+        if tracer is not None and tracer.capturing:
+            tracer.action(uid, action.__name__)
+        action(pid)
+
 
 class Player(player.Player):
     name = 'Sim'
@@ -260,24 +291,54 @@ class Player(player.Player):
         self.gold = starting_gold
         self.stats = stats.BlackjackStats()
         self.player.gold = self.gold
+        # risk tracking state, see `track_risk`
+        self.in_round = False
+        self.peak_gold = starting_gold
+        self.last_gold = starting_gold
+        self.last_hands = 0
 
     def reset(self):
-        self.stats = stats.BlackjackStats()
+        # The stats record and table player are reused, not reallocated, every iteration
+        self.stats.reset(self.starting_gold)
         self.gold = self.starting_gold
-        self.stats.gold_start = self.starting_gold
-        self.stats.gold_max = self.starting_gold
-        self.stats.gold_min = self.starting_gold
-        if self.uid in player.players:
-            player.remove_player(self.uid)
-        player.add_player(self.uid, self.name)
-        self.player = player.players[self.uid]
+        player.players[self.uid] = self.player
+        self.player.reset()
         self.player.gold = self.gold
         self.bet_system.reset()
         self.bet_system.set_player(self.player)
         self.bet_system.set_starting_gold(self.starting_gold)
         self.ended = False
+        self.in_round = False
+        self.peak_gold = self.starting_gold
+        self.last_gold = self.starting_gold
+        self.last_hands = 0
         return self
 
+    def track_risk(self):
+        """
+        Updates the drawdown, time under water and largest loss after a round, in O(1)
+        from the gold peak and the gold and hands after the previous round. Rounds the
+        player did not play in, like the one they ran out of gold at, are skipped.
+        """
+        p = self.player
+        hands = p.wins + p.losses + p.ties + p.surrenders
+        if not self.in_round or hands == self.last_hands:
+            return
+        self.last_hands = hands
+        st = self.stats
+        gold = p.gold
+        st.rounds_played += 1
+        loss = self.last_gold - gold
+        if loss > st.max_round_loss:
+            st.max_round_loss = loss
+        self.last_gold = gold
+        if gold >= self.peak_gold:
+            self.peak_gold = gold
+        else:
+            st.rounds_under_water += 1
+            if self.peak_gold - gold > st.max_drawdown:
+                st.max_drawdown = self.peak_gold - gold
+
     def __str__(self):
         return 'Player UID: ' + str(self.uid)
 
@@ -293,17 +354,33 @@ class BlackjackSimulator:
         self.starting_gold = 0
         self.target_gold = 0
         self.rounds = 0
+        self.rounds_played = 0
         self.anti_fallacy = False
         self.positive_prog = False
+        # optional `paths.PathRecorder`, fed the gold of every player after every round
+        self.recorder = None
+        self.sampler = None
+        # optional `checkpoints.Checkpoints`, snapshotting the players at some rounds
+        self.checkpoints = None
+        # optional `history.HistoryWriter`, writing the hand histories of some rounds
+        self.tracer = None
+        # when set, every round is dealt from a shoe seeded by it and the round number
+        self.round_seed = None
 
         self.players = pls
+        # The hooks and table are created once and reset in place for every iteration and round
+        self.hooks = BlackjackHooks(self.players, self.output)
+        self.game = None
 
         self.reset()
 
     def reset(self):
-        self.hooks = BlackjackHooks(self.players, self.output)
+        self.hooks.reset()
         self.hooks.set_anti_fallacy(self.anti_fallacy)
         self.hooks.set_positive_prog(self.positive_prog)
+        self.hooks.sampler = self.sampler
+        if self.sampler is not None:
+            self.sampler.begin()
         self.reset_players()
         self.reset_gold()
 
@@ -333,23 +410,62 @@ class BlackjackSimulator:
     def set_target_gold(self, target):
         self.target_gold = target
 
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+    def set_checkpoints(self, checkpoints):
+        self.checkpoints = checkpoints
+
+    def set_tracer(self, tracer):
+        self.tracer = tracer
+        self.hooks.tracer = tracer
+
+    def set_round_seed(self, seed):
+        self.round_seed = seed
+
+    def set_sampler(self, sampler):
+        """
+        Deals every round from the tilted shoes of `sampler` (an `importance.ImportanceSampler`).
+        """
+        self.sampler = sampler
+        self.hooks.sampler = sampler
+
     def print(self, *args):
         if self.output is not None:
             self.output(*args)
 
     def run(self, rounds):
         curr_round = 0
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.begin(self.players)
+        checkpoints = self.checkpoints
+        if checkpoints is not None:
+            checkpoints.begin(self.players)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.begin(self.players)
         while True:
             for p in player.in_game:
                 player.remove_from_game(p)
-            bj = blackjack.Game(self.phenny, 1, self.name, self.hooks)
+            if self.round_seed is not None:
+                random.seed("{}:{}".format(self.round_seed, curr_round))
+            bj = self.game
+            if bj is None:
+                bj = self.game = blackjack.Game(self.phenny, 1, self.name, self.hooks, keep_dealer=True)
+            else:
+                bj.new_round(1)
             for pl in self.players:
+                pl.in_round = not pl.ended
                 if pl.uid != 1 and not pl.ended:
                     bj.join(pl.uid)
+            if tracer is not None:
+                tracer.start_round(self.players)
             bj.begin_game()
-            del bj
             curr_round += 1
             for pl in self.players:
+                if pl.starting_gold > 0:
+                    pl.track_risk()
                 if 0 < rounds <= curr_round:
                     pl.end_reason = "Finished rounds."
                     pl.ended = True
@@ -362,8 +478,21 @@ class BlackjackSimulator:
                     if 0 < pl.target_gold <= pl.player.gold:
                         pl.end_reason = 'Reached target gold.'
                         pl.ended = True
+            if recorder is not None:
+                recorder.record(curr_round, self.players)
+            if checkpoints is not None and checkpoints.due(curr_round):
+                checkpoints.snapshot(self.players)
+            if tracer is not None:
+                tracer.end_round(curr_round, self.players)
             if all(pl.ended for pl in self.players):
                 break
+        self.rounds_played = curr_round
+        if recorder is not None:
+            recorder.end()
+        if checkpoints is not None:
+            checkpoints.end(self.players)
+        if tracer is not None:
+            tracer.end()
 
         # Update stats
         for pl in self.players:
@@ -383,5 +512,6 @@ class BlackjackSimulator:
             pl.stats.loss_streak = pl.player.losing_streak_max
             pl.stats.tie_streak = pl.player.tie_streak_max
             pl.stats.surrender_streak = pl.player.surrender_streak_max
+            pl.stats.end_iteration()
 
         return self.players
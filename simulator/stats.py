@@ -1,3 +1,6 @@
+import math
+import operator
+
 # What to output when `BlackjackStats.print()` is called
 OUTPUT_CONFIG = [
     #("Ending gold",     {"attr": "gold_end",    "gold": True}),
@@ -21,26 +24,78 @@ OUTPUT_CONFIG = [
 ]
 
 
+# Power of two buckets of the largest bet of every iteration: bucket `k` counts the
+# iterations whose largest bet was at most 2**k and above 2**(k-1), the last one the rest
+BET_BUCKETS = ["max_bet_bucket_{}".format(k) for k in range(24)]
+
+# Every stat, in the order `BlackjackStats.to_dict()` returns them
+FIELDS = [
+    "gold_start", "gold_target", "gold_end", "gold_max", "gold_min",
+    "total_hands", "wins", "losses", "ties", "surrenders", "nat_wins", "nat_losses",
+    "win_streak", "loss_streak", "tie_streak", "surrender_streak",
+    "rounds_played", "rounds_under_water", "max_drawdown", "drawdown_sum", "max_round_loss",
+    "max_bet", "max_bet_sum", "max_bet_sq_sum",
+] + BET_BUCKETS
+
+
+# Stats merged by `BlackjackStats.add`, and how
+SUMMED = ["total_hands", "wins", "losses", "ties", "surrenders", "nat_wins", "nat_losses",
+          "rounds_played", "rounds_under_water", "drawdown_sum", "max_bet_sum", "max_bet_sq_sum"] + BET_BUCKETS
+MAXED = ["gold_max", "win_streak", "loss_streak", "tie_streak", "surrender_streak",
+         "max_drawdown", "max_round_loss", "max_bet"]
+
+_get_summed = operator.attrgetter(*SUMMED)
+_get_maxed = operator.attrgetter(*MAXED)
+
+
 class BlackjackStats:
-    gold_start = 0
-    gold_target = 0
-    gold_end = 0
-    gold_max = 0
-    gold_min = 0
-
-    total_hands = 0
-    wins = 0
-    losses = 0
-    ties = 0
-    surrenders = 0
-
-    nat_wins = 0
-    nat_losses = 0
-
-    win_streak = 0
-    loss_streak = 0
-    tie_streak = 0
-    surrender_streak = 0
+    """
+    The stats of one player, for one iteration or merged over many.
+
+    Slotted, so records are small and attribute access skips the instance dict. A
+    player keeps one record and `reset`s it in place between iterations.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, gold_start=0, gold_target=0):
+        self.reset(gold_start, gold_target)
+
+    def reset(self, gold_start=0, gold_target=0):
+        """
+        Clears every stat, with the gold range starting at `gold_start`.
+        """
+        self.gold_start = gold_start
+        self.gold_target = gold_target
+        self.gold_end = 0
+        self.gold_max = gold_start
+        self.gold_min = gold_start
+
+        self.total_hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.ties = 0
+        self.surrenders = 0
+
+        self.nat_wins = 0
+        self.nat_losses = 0
+
+        self.win_streak = 0
+        self.loss_streak = 0
+        self.tie_streak = 0
+        self.surrender_streak = 0
+
+        # risk, tracked every round by `simulator.Player.track_risk`
+        self.rounds_played = 0
+        self.rounds_under_water = 0
+        self.max_drawdown = 0
+        self.drawdown_sum = 0
+        self.max_round_loss = 0
+        self.max_bet = 0
+        self.max_bet_sum = 0
+        self.max_bet_sq_sum = 0
+        for f in BET_BUCKETS:
+            setattr(self, f, 0)
+        return self
 
     def add(self, other):
         self.gold_max = max(self.gold_max, other.gold_max)
@@ -60,7 +115,67 @@ class BlackjackStats:
         self.surrender_streak = max(
             self.surrender_streak, other.surrender_streak)
 
-    def print(self, print_fn=print):
+        self.rounds_played += other.rounds_played
+        self.rounds_under_water += other.rounds_under_water
+        self.max_drawdown = max(self.max_drawdown, other.max_drawdown)
+        self.drawdown_sum += other.drawdown_sum
+        self.max_round_loss = max(self.max_round_loss, other.max_round_loss)
+        self.max_bet = max(self.max_bet, other.max_bet)
+        self.max_bet_sum += other.max_bet_sum
+        self.max_bet_sq_sum += other.max_bet_sq_sum
+        for f in BET_BUCKETS:
+            setattr(self, f, getattr(self, f) + getattr(other, f))
+
+    def add_all(self, others):
+        """
+        Merges many records at once, like `add` on each of them: the stats of all records are
+        read into one column per stat, and every column is reduced in a single pass. Plain
+        Python integers rather than numpy, since sums like `max_bet_sq_sum` outgrow int64.
+        """
+        others = list(others)
+        if not others:
+            return
+        summed = zip(*map(_get_summed, others))
+        for f, column in zip(SUMMED, summed):
+            setattr(self, f, getattr(self, f) + sum(column))
+        maxed = zip(*map(_get_maxed, others))
+        for f, column in zip(MAXED, maxed):
+            setattr(self, f, max(getattr(self, f), max(column)))
+        self.gold_min = min(self.gold_min, min(o.gold_min for o in others))
+
+    def end_iteration(self):
+        """
+        Adds the largest bet of the iteration this record holds to the sums and buckets
+        of largest bets, and its max drawdown to the drawdown sum.
+        """
+        self.drawdown_sum = self.max_drawdown
+        self.max_bet_sum = self.max_bet
+        self.max_bet_sq_sum = self.max_bet * self.max_bet
+        bucket = min(max(0, self.max_bet - 1).bit_length(), len(BET_BUCKETS) - 1)
+        setattr(self, BET_BUCKETS[bucket], 1)
+
+    def iterations(self):
+        """
+        How many iterations were merged into this record, as counted by the largest bet buckets.
+        """
+        return sum(getattr(self, f) for f in BET_BUCKETS)
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in FIELDS}
+
+    @classmethod
+    def from_dict(cls, d):
+        st = cls()
+        for f in FIELDS:
+            if f in d:
+                setattr(st, f, d[f])
+        return st
+
+    def print(self, print_fn=print, intervals=None):
+        """
+        Prints every stat of `OUTPUT_CONFIG`, then the risk stats. `intervals` maps stats to
+        the half-width of the 95% interval of their rate or average, printed next to it.
+        """
         for (name, stat) in OUTPUT_CONFIG:
             if name == "":
                 print_fn()
@@ -76,4 +191,44 @@ class BlackjackStats:
                 print_fn("{:.<16}{:.>20,}".format(name, attr), end='')
             if "percentage" in stat:
                 print_fn(" ({:>6.2%})".format(attr/self.total_hands), end='')
+                if intervals is not None and stat["attr"] in intervals:
+                    print_fn(" +- {:.2%}".format(intervals[stat["attr"]]), end='')
             print_fn()
+
+        if self.gold_start != 0 and self.iterations() > 0:
+            self.print_risk(print_fn, intervals)
+
+    def print_risk(self, print_fn=print, intervals=None):
+        n = self.iterations()
+
+        def interval(attr, fmt):
+            if intervals is None or attr not in intervals:
+                return ""
+            return " +- " + fmt.format(intervals[attr])
+
+        print_fn()
+        if intervals is None:
+            print_fn("Risk:")
+        else:
+            print_fn("Risk (the maxima are point estimates, without an interval):")
+        print_fn("{:.<24}{:.>12,}".format("Max drawdown", self.max_drawdown))
+        print_fn("{:.<24}{:.>12,.2f}{}".format("Avg. max drawdown", self.drawdown_sum / n,
+                                                interval("drawdown_sum", "{:,.2f}")))
+        print_fn("{:.<24}{:.>12,} ({:>6.2%} of rounds){}".format(
+            "Rounds under water", self.rounds_under_water,
+            self.rounds_under_water / self.rounds_played if self.rounds_played else 0.0,
+            interval("rounds_under_water", "{:.2%}")))
+        print_fn("{:.<24}{:.>12,}".format("Largest round loss", self.max_round_loss))
+        mean = self.max_bet_sum / n
+        sd = math.sqrt(max(0.0, (self.max_bet_sq_sum - self.max_bet_sum * mean) / (n - 1))) if n > 1 else 0.0
+        print_fn("{:.<24}{:.>12,} (avg. {:,.2f}{}, sd {:,.2f} per iteration)".format(
+            "Largest bet", self.max_bet, mean, interval("max_bet_sum", "{:,.2f}"), sd))
+        for k, f in enumerate(BET_BUCKETS):
+            count = getattr(self, f)
+            if count == 0:
+                continue
+            if k == len(BET_BUCKETS) - 1:
+                label = "  > {:,}".format(2 ** (k - 1))
+            else:
+                label = "  <= {:,}".format(2 ** k)
+            print_fn("{:.<24}{:.>12,} ({:>6.2%}){}".format(label, count, count / n, interval(f, "{:.2%}")))
@@ -5,6 +5,8 @@ class BlackjackStrategy:
     def __init__(self, strat_table, out=None):
         self.strat_table = strat_table
         self.output = out
+        # hash of the file it was loaded from, to share one table between identical files
+        self.digest = None
 
     def print(self, *args):
         if self.output is not None:
@@ -0,0 +1,323 @@
+import collections
+import itertools
+import multiprocessing
+import random
+
+from casinobot import cards
+from simulator import crn, runner
+
+# Decks in the shoe `blackjack.Game.new_deck` deals from
+DECKS = 2
+
+# The flat bet every round is played with: even, so surrenders and naturals pay whole gold
+BET = 100
+GOLD = 10 ** 12
+
+# Share of the rounds Neyman allocation plays first, proportionally, to estimate the
+# spread of every stratum
+PILOT_SHARE = 0.1
+
+# Rounds of the pooled spread of all strata every pilot spread is shrunk towards: a
+# stratum's few pilot rounds can easily all push or all win
+PRIOR_ROUNDS = 10
+
+ALLOCATIONS = ["neyman", "proportional"]
+
+# Classes of the player's two cards: the decisions and outcomes of the hands in a class
+# are alike
+HAND_CLASSES = ["Blackjack", "Pair of A", "Pair of 8", "Hard 20", "Other pair", "Soft 13-20", "Hard 5-8",
+                "Hard 9", "Hard 10", "Hard 11", "Hard 12-16", "Hard 17-19"]
+
+# Classes of the dealer's hole card value
+HOLE_CLASSES = ["A", "2-6", "7-9", "10"]
+
+# A player hand class, dealer upcard value (aces counting 1) and hole card class, with its
+# probability and the card values (player low, player high, upcard, hole card) of every
+# deal in it, with their cumulative probabilities to draw one from
+Stratum = collections.namedtuple("Stratum", ["hand", "up", "hole", "probability", "deals", "cum_weights"])
+
+
+def value(card):
+    return cards.VALUES[card.rank]
+
+
+def hand_class(low, high):
+    if low == 1 and high == 10:
+        return "Blackjack"
+    if low == high:
+        return {1: "Pair of A", 8: "Pair of 8", 10: "Hard 20"}.get(low, "Other pair")
+    if low == 1:
+        return "Soft 13-20"
+    total = low + high
+    if total <= 8:
+        return "Hard 5-8"
+    if total <= 11:
+        return "Hard {}".format(total)
+    return "Hard 12-16" if total <= 16 else "Hard 17-19"
+
+
+def hole_class(hole):
+    if hole == 1:
+        return "A"
+    if hole == 10:
+        return "10"
+    return "2-6" if hole <= 6 else "7-9"
+
+
+def shoe_counts(decks=DECKS):
+    """
+    How many cards of every value (1 to 10) a fresh shoe of `decks` decks holds.
+    """
+    counts = collections.Counter()
+    for card in cards.Deck().cards:
+        counts[value(card)] += decks
+    return counts
+
+
+def strata(decks=DECKS):
+    """
+    Every (player hand class, dealer upcard, hole card class) stratum, with its exact
+    probability in a fresh shoe of `decks` decks, summed over the card values of its
+    deals. The probabilities add up to 1.
+    """
+    counts = shoe_counts(decks)
+    total = sum(counts.values())
+    orders = total * (total - 1) * (total - 2) * (total - 3)
+    deals = collections.defaultdict(list)
+    for low in range(1, 11):
+        for high in range(low, 11):
+            for up in range(1, 11):
+                for hole in range(1, 11):
+                    left = collections.Counter(counts)
+                    ways = 1
+                    for v in (low, high, up, hole):
+                        ways *= left[v]
+                        left[v] -= 1
+                    if low != high:
+                        ways *= 2
+                    if ways:
+                        key = (hand_class(low, high), up, hole_class(hole))
+                        deals[key].append(((low, high, up, hole), ways))
+    result = []
+    for hand in HAND_CLASSES:
+        for up in range(1, 11):
+            for hole in HOLE_CLASSES:
+                members = deals[(hand, up, hole)]
+                cum_weights = list(itertools.accumulate(ways for (_, ways) in members))
+                result.append(Stratum(hand, up, hole, cum_weights[-1] / orders,
+                                      tuple(deal for (deal, _) in members), tuple(cum_weights)))
+    return result
+
+
+class StratifiedSampler:
+    """
+    Deals every round from a shoe whose first cards are forced into `stratum`: a deal of
+    the stratum is drawn by its probability, the player's two cards and the dealer's
+    upcard and hole card are random cards of its values, and the rest of the shoe is
+    shuffled. That is a draw of a round conditioned on its stratum.
+
+    Used as the sampler of a single seat `BlackjackSimulator` (see `set_sampler`), where
+    the seat gets the first and third card, and the dealer the second and (upcard) fourth.
+    """
+
+    def __init__(self, stratum=None, decks=DECKS):
+        self.stratum = stratum
+        self.deck = cards.Deck()
+        self.deck.cards = self.deck.cards * decks
+        self.shoe = list(self.deck.cards)
+
+    def begin(self):
+        pass
+
+    def new_deck(self):
+        cs = self.deck.cards
+        cs[:] = self.shoe
+        st = self.stratum
+        (low, high, up, hole) = random.choices(st.deals, cum_weights=st.cum_weights)[0]
+        up = take(cs, up)
+        hole = take(cs, hole)
+        first = take(cs, low)
+        second = take(cs, high)
+        if random.random() < 0.5:
+            first, second = second, first
+        # shuffled after the forced cards are taken, taking the first ones of a shuffled
+        # shoe would leave cards of other values more likely at its front
+        random.shuffle(cs)
+        cs[0:0] = [first, hole, second, up]
+        return self.deck
+
+
+def take(cs, v):
+    """
+    Removes and returns a random card of value `v` from `cs`.
+    """
+    matches = [i for i, card in enumerate(cs) if cards.VALUES[card.rank] == v]
+    if not matches:
+        raise ValueError("No card of value {} left".format(v))
+    return cs.pop(random.choice(matches))
+
+
+class StratifiedEstimate:
+    """
+    Mergeable sums of the gold won per round (in bets) of every stratum, and the
+    stratified estimate of the expected value per round they give:
+    `sum(p_h * mean_h)`, with variance `sum(p_h^2 * var_h / n_h)`.
+    """
+
+    def __init__(self, all_strata, allocation):
+        self.strata = all_strata
+        self.allocation = allocation
+        self.sums = [crn.PairedSums() for _ in all_strata]
+        # rounds of the Neyman pilot, not in the sums
+        self.pilot = 0
+
+    def merge(self, index, sums):
+        self.sums[index].merge(sums)
+
+    def rounds(self):
+        return sum(s.n for s in self.sums)
+
+    def variances(self):
+        result = []
+        for s in self.sums:
+            if s.n < 2:
+                result.append(0.0)
+            else:
+                result.append(max(0.0, (s.sq_total - s.total * s.total / s.n) / (s.n - 1)))
+        return result
+
+    def ev(self):
+        return sum(st.probability * s.mean() for st, s in zip(self.strata, self.sums))
+
+    def stderr(self):
+        var = sum(st.probability ** 2 * v / s.n
+                  for st, s, v in zip(self.strata, self.sums, self.variances()) if s.n > 0)
+        return var ** 0.5
+
+    def plain_variance(self):
+        """
+        The variance of a single round under plain Monte Carlo, estimated from the
+        strata: the within-strata variance plus the variance of the strata means.
+        """
+        ev = self.ev()
+        return sum(st.probability * (v + (s.mean() - ev) ** 2)
+                   for st, s, v in zip(self.strata, self.sums, self.variances()))
+
+    def by_upcard(self):
+        """
+        (upcard value, probability, expected value, standard error) for every upcard.
+        """
+        result = []
+        variances = self.variances()
+        for up in range(1, 11):
+            members = [i for i, st in enumerate(self.strata) if st.up == up]
+            p = sum(self.strata[i].probability for i in members)
+            ev = sum(self.strata[i].probability * self.sums[i].mean() for i in members) / p
+            var = sum(self.strata[i].probability ** 2 * variances[i] / self.sums[i].n
+                      for i in members if self.sums[i].n > 0) / (p * p)
+            result.append((up, p, ev, var ** 0.5))
+        return result
+
+    def print(self, strat_file, print_fn=print):
+        rounds = self.rounds()
+        se = self.stderr()
+        plain = self.plain_variance()
+        print_fn("Stratified EV of {} over {:,} rounds of a flat bet{}".format(
+            strat_file, rounds, ", after {:,} pilot rounds".format(self.pilot) if self.pilot else ""))
+        print_fn("({} strata of player hand, dealer upcard and hole card, {} allocation)".format(
+            len(self.strata), self.allocation))
+        print_fn()
+        print_fn("  {:.<22}{:>+10.4%} +- {:.4%} of the bet".format("EV per round", self.ev(), se))
+        if se > 0:
+            # against plain rounds of all the rounds played, the pilot's too
+            reduction = plain / (rounds + self.pilot) / (se * se)
+            print_fn("  {:.<22}{:>10.2f}x, plain Monte Carlo needs ~{:,.0f} rounds for this".format(
+                "Variance reduction", reduction, plain / (se * se)))
+        print_fn()
+        print_fn("  By dealer upcard:")
+        for (up, p, ev, up_se) in self.by_upcard():
+            print_fn("    {:<4}{:>7.2%} of rounds, EV {:>+8.3%} +- {:.3%}".format(
+                "A" if up == 1 else str(up), p, ev, up_se))
+
+
+def run_stratum(strat_file, stratum, rounds, seed=None):
+    """
+    Plays `rounds` rounds of `stratum` with a flat bet, returning the `crn.PairedSums`
+    of the gold won per round, in bets.
+    """
+    # one simulator per process and strategy, the rounds are passed to `run`
+    scenario = runner.Scenario([runner.PlayerConfig("simple", "bet={}".format(BET), GOLD, 0, strat_file)])
+    bj = runner.simulator_for(scenario)
+    sampler = StratifiedSampler(stratum)
+    recorder = crn.RoundRecorder(1)
+    bj.set_sampler(sampler)
+    bj.set_recorder(recorder)
+    if seed is not None:
+        random.seed(seed)
+    bj.reset()
+    bj.run(rounds)
+    bj.set_sampler(None)
+    bj.set_recorder(None)
+
+    sums = crn.PairedSums()
+    for delta in recorder.deltas[0]:
+        sums.add(delta / BET)
+    return sums
+
+
+def _run_task(task):
+    (strat_file, stratum, index, rounds, seed) = task
+    return index, run_stratum(strat_file, stratum, rounds, seed)
+
+
+def allocate(all_strata, rounds, deviations=None):
+    """
+    Splits `rounds` over the strata: proportional to their probability, or with the
+    standard `deviations` of their rounds (Neyman), proportional to both.
+    """
+    weights = [st.probability * (1.0 if deviations is None else deviations[i]) for i, st in enumerate(all_strata)]
+    total = sum(weights)
+    if total == 0:
+        weights = [st.probability for st in all_strata]
+        total = 1.0
+    return [int(round(rounds * w / total)) for w in weights]
+
+
+def estimate(strat_file, rounds, processes, allocation="neyman", pilot=PILOT_SHARE, seed=None):
+    """
+    Estimates the expected value per round of `strat_file` from `rounds` rounds,
+    allocated over all strata and played on a pool of `processes` processes, returning a
+    `StratifiedEstimate`. Neyman allocation first plays a `pilot` share of the rounds
+    proportionally to estimate the spread of every stratum, and falls back to
+    proportional allocation when that would be fewer than 4 rounds per stratum. Every
+    stratum gets at least 2 rounds either way, so small `rounds` can be exceeded.
+    """
+    if allocation not in ALLOCATIONS:
+        raise ValueError("Invalid allocation '{}', use one of: {}".format(allocation, ", ".join(ALLOCATIONS)))
+    all_strata = strata()
+    if rounds * pilot < 4 * len(all_strata):
+        allocation = "proportional"
+    result = StratifiedEstimate(all_strata, allocation)
+    strategies = runner.load_strategies([strat_file])
+
+    with multiprocessing.Pool(processes, initializer=runner.warm, initargs=((), strategies)) as pool:
+        def play(counts, phase, estimate):
+            tasks = [(strat_file, all_strata[i], i, n, None if seed is None else "{}:{}:{}".format(seed, phase, i))
+                     for i, n in enumerate(counts) if n > 0]
+            for (index, sums) in pool.imap_unordered(_run_task, tasks, chunksize=8):
+                estimate.merge(index, sums)
+
+        deviations = None
+        if allocation == "neyman":
+            # the pilot only allocates: kept in the estimate, the strata that happened to
+            # look calm would also keep their lucky means, with fewer rounds to undo them
+            trial = StratifiedEstimate(all_strata, allocation)
+            play([max(2, n) for n in allocate(all_strata, int(rounds * pilot))], "pilot", trial)
+            result.pilot = trial.rounds()
+            variances = trial.variances()
+            pooled = sum(st.probability * v for st, v in zip(all_strata, variances))
+            deviations = [((s.n * v + PRIOR_ROUNDS * pooled) / (s.n + PRIOR_ROUNDS)) ** 0.5
+                          for s, v in zip(trial.sums, variances)]
+        counts = [max(2, n) for n in allocate(all_strata, rounds - result.pilot, deviations)]
+        play(counts, "main", result)
+    return result
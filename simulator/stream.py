@@ -0,0 +1,94 @@
+import collections
+import concurrent.futures
+import multiprocessing
+
+from simulator import runner
+
+# Executors of `iterate`
+EXECUTORS = ["inline", "processes"]
+
+# The result of one player in one iteration
+PlayerResult = collections.namedtuple("PlayerResult", [
+    "end_reason", "gold_end", "gold_min", "gold_max", "hands", "wins", "losses", "ties", "surrenders",
+])
+
+# The result of one iteration: its index in the run, rounds played and a `PlayerResult` per seat
+IterationResult = collections.namedtuple("IterationResult", ["index", "rounds", "players"])
+
+
+def snapshot(index, bj, pls):
+    """
+    Copies the results out of the players `bj.run` returned, which are reused by the next iteration.
+    """
+    return IterationResult(index, bj.rounds_played, tuple(
+        PlayerResult(pl.end_reason, pl.stats.gold_end, pl.stats.gold_min, pl.stats.gold_max,
+                     pl.stats.total_hands, pl.stats.wins, pl.stats.losses, pl.stats.ties, pl.stats.surrenders)
+        for pl in pls))
+
+
+def run_records(scenario, iterations, first=0):
+    """
+    Runs iterations `first` to `first + iterations - 1` of `scenario` in this process,
+    like `runner.run_chunk`, returning an `IterationResult` per iteration.
+    """
+    bj = runner.simulator_for(scenario)
+    results = []
+    for index in range(first, first + iterations):
+        if scenario.seed is not None:
+            runner.seed_iteration(scenario.seed, index)
+        bj.reset()
+        results.append(snapshot(index, bj, bj.run(scenario.rounds)))
+    return results
+
+
+def iterate(scenario, executor="inline", processes=None, chunk=256, buffer=4):
+    """
+    Lazily yields an `IterationResult` for every iteration of `scenario`, in order.
+
+    `scenario` is a `runner.Scenario` or a dict as taken by `Scenario.from_dict`. The
+    "inline" executor plays every iteration in this process when the next result is asked
+    for. "processes" plays chunks of `chunk` iterations on a pool of `processes` processes
+    (default: one per CPU), keeping at most `buffer` chunks per process in flight or
+    waiting to be consumed, so memory stays bounded however slowly results are consumed.
+    Closing the iterator early stops the pool.
+    """
+    if isinstance(scenario, dict):
+        scenario = runner.Scenario.from_dict(scenario)
+    scenario.validate()
+    if executor not in EXECUTORS:
+        raise ValueError("Invalid executor '{}', use one of: {}".format(executor, ", ".join(EXECUTORS)))
+
+    if executor == "inline":
+        return _iterate_inline(scenario)
+    return _iterate_processes(scenario, processes or multiprocessing.cpu_count(), chunk, buffer)
+
+
+def _iterate_inline(scenario):
+    # every iteration runs within one `next`, and `reset` puts the seats back into the
+    # global player table, so iterators can be consumed interleaved
+    bj = runner.simulator_for(scenario)
+    for index in range(scenario.iterations):
+        if scenario.seed is not None:
+            runner.seed_iteration(scenario.seed, index)
+        bj.reset()
+        yield snapshot(index, bj, bj.run(scenario.rounds))
+
+
+def _iterate_processes(scenario, processes, chunk, buffer):
+    strategies = runner.load_strategies(scenario.strat_files())
+    chunks = iter(runner.split_iterations(scenario.iterations, chunk))
+    pool = concurrent.futures.ProcessPoolExecutor(processes, initializer=runner.warm, initargs=((), strategies))
+    pending = collections.deque()
+    try:
+        for (n, first) in chunks:
+            pending.append(pool.submit(run_records, scenario, n, first))
+            if len(pending) >= processes * buffer:
+                break
+        while pending:
+            results = pending.popleft().result()
+            for (n, first) in chunks:
+                pending.append(pool.submit(run_records, scenario, n, first))
+                break
+            yield from results
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
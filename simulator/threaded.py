@@ -0,0 +1,102 @@
+import random
+import sys
+import threading
+
+from casinobot import cards, player
+from simulator import importance, runner, simulator
+
+# Modules whose `random` the simulator plays with, see `install`
+RANDOM_MODULES = [cards, simulator, runner, importance]
+
+
+def free_threaded():
+    """
+    Whether this Python runs threads in parallel, a free-threaded (3.13+) build with the GIL disabled.
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class ThreadRandom(threading.local):
+    """
+    The `random` module functions, on a `random.Random` of each thread. Seeding it seeds
+    the calling thread's generator only, so a seeded iteration plays the same cards on
+    any thread, as in a worker process.
+    """
+
+    def __init__(self):
+        self.rng = random.Random()
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+class ThreadTable(threading.local):
+    """
+    A new `kind` (dict or list) on each thread, standing in for `player.players` or
+    `player.in_game`.
+    """
+
+    def __init__(self, kind):
+        # a `threading.local` runs this again on every other thread using it
+        self.table = kind()
+
+    def __getitem__(self, key):
+        return self.table[key]
+
+    def __setitem__(self, key, value):
+        self.table[key] = value
+
+    def __delitem__(self, key):
+        del self.table[key]
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getattr__(self, name):
+        # keys, pop, clear, append, remove, reverse...
+        return getattr(self.table, name)
+
+
+def installed():
+    return isinstance(player.players, ThreadTable)
+
+
+def install():
+    """
+    Gives every thread its own table (`player.players` and `player.in_game`) and random
+    number generator, so simulators can play on several threads of one process. The
+    calling thread keeps its table. Process mode never calls this and keeps the plain
+    module globals, which are faster.
+
+    `casino.gold`, the house's take, stays shared: nothing reads it.
+    """
+    if installed():
+        return
+    players = ThreadTable(dict)
+    players.table.update(player.players)
+    in_game = ThreadTable(list)
+    in_game.table.extend(player.in_game)
+    player.players = players
+    player.in_game = in_game
+    shared = ThreadRandom()
+    for module in RANDOM_MODULES:
+        module.random = shared
+
+
+def uninstall():
+    """
+    Puts the module globals back, with the calling thread's table.
+    """
+    if not installed():
+        return
+    player.players = player.players.table
+    player.in_game = player.in_game.table
+    for module in RANDOM_MODULES:
+        module.random = random
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "casinosim", "results.db")
+
+RUIN = "Ran out of gold."
+TARGET = "Reached target gold."
+FINISHED = "Finished rounds."
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        created TEXT NOT NULL,
+        source TEXT NOT NULL,
+        name TEXT,
+        version TEXT,
+        python TEXT,
+        iterations INTEGER NOT NULL,
+        rounds INTEGER NOT NULL,
+        anti_fallacy INTEGER NOT NULL,
+        positive_prog INTEGER NOT NULL,
+        seed INTEGER,
+        processes INTEGER,
+        elapsed REAL,
+        cpu_time REAL,
+        config TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS players (
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        seat INTEGER NOT NULL,
+        bet_system TEXT NOT NULL,
+        bet_options TEXT NOT NULL,
+        gold INTEGER NOT NULL,
+        target INTEGER NOT NULL,
+        strat TEXT NOT NULL,
+        strat_hash TEXT,
+        iterations INTEGER NOT NULL,
+        ruin_rate REAL NOT NULL,
+        target_rate REAL NOT NULL,
+        finished_rate REAL NOT NULL,
+        avg_gold_end REAL NOT NULL,
+        avg_hands REAL NOT NULL,
+        win_rate REAL NOT NULL,
+        loss_rate REAL NOT NULL,
+        gold_max INTEGER NOT NULL,
+        gold_min INTEGER NOT NULL,
+        reasons TEXT NOT NULL,
+        stats TEXT NOT NULL,
+        PRIMARY KEY (run_id, seat)
+    )""",
+    "CREATE INDEX IF NOT EXISTS players_bet_system ON players (bet_system, gold, target)",
+    "CREATE INDEX IF NOT EXISTS players_bet_options ON players (bet_options)",
+    "CREATE INDEX IF NOT EXISTS players_gold ON players (gold, target)",
+    "CREATE INDEX IF NOT EXISTS players_target ON players (target)",
+]
+
+# Per-player metrics that can be filtered and sorted on
+METRICS = ["ruin_rate", "target_rate", "finished_rate", "avg_gold_end", "avg_hands", "win_rate", "loss_rate",
+           "gold_max", "gold_min", "iterations"]
+
+# Columns `query` returns, run columns first
+COLUMNS = ["run_id", "created", "source", "name", "version", "seat", "bet_system", "bet_options", "gold", "target",
+           "strat"] + METRICS
+
+
+def code_version():
+    """
+    The git revision of this checkout, with "-dirty" for uncommitted changes, or `None`.
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def strat_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class Warehouse:
+    """
+    Results of past runs in a SQLite database: one row per run with its configuration,
+    timings and code version, and one per player with its aggregate metrics, indexed by
+    betting system, options, gold and target so past runs can be queried instead of
+    simulated again.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        with self.db:
+            for statement in SCHEMA:
+                self.db.execute(statement)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, report, source="casinosim", processes=None, elapsed=None):
+        """
+        Stores one finished scenario, as reported by `runner.scenario_report`, returning the run id.
+        """
+        config = report["config"]
+        with self.db:
+            run_id = self.db.execute(
+                "INSERT INTO runs (created, source, name, version, python, iterations, rounds, anti_fallacy, "
+                "positive_prog, seed, processes, elapsed, cpu_time, config) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%S"), source, report["name"], code_version(),
+                 platform.python_version(), report["iterations"], config["rounds"], int(config["anti_fallacy"]),
+                 int(config["positive_prog"]), config["seed"], processes, elapsed, report["cpu_time"],
+                 json.dumps(config, sort_keys=True))).lastrowid
+            for seat, pl in enumerate(report["players"]):
+                self.db.execute(
+                    "INSERT INTO players (run_id, seat, bet_system, bet_options, gold, target, strat, strat_hash, "
+                    "iterations, ruin_rate, target_rate, finished_rate, avg_gold_end, avg_hands, win_rate, "
+                    "loss_rate, gold_max, gold_min, reasons, stats) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, seat + 1) + player_row(pl, report["iterations"]))
+        return run_id
+
+    def query(self, bet_system=None, bet_options=None, gold=None, target=None, strat=None, min_iterations=0,
+              order="ruin_rate", descending=False, limit=10):
+        """
+        The players of past runs matching every given filter, best first by `order` (one of
+        `METRICS`, ascending unless `descending`), as dicts with the `COLUMNS`.
+        """
+        if order not in METRICS:
+            raise ValueError("Invalid metric '{}', use one of: {}".format(order, ", ".join(METRICS)))
+        where = ["p.iterations >= ?"]
+        args = [min_iterations]
+        for column, value in [("bet_system", bet_system), ("bet_options", bet_options), ("gold", gold),
+                              ("target", target), ("strat", strat)]:
+            if value is not None:
+                where.append("p.{} = ?".format(column))
+                args.append(value)
+        sql = ("SELECT r.id AS run_id, r.created, r.source, r.name, r.version, p.* FROM players p "
+               "JOIN runs r ON r.id = p.run_id WHERE {} ORDER BY p.{} {}, r.id DESC LIMIT ?").format(
+            " AND ".join(where), order, "DESC" if descending else "ASC")
+        args.append(limit)
+        return [{c: row[c] for c in COLUMNS} for row in self.db.execute(sql, args)]
+
+    def runs(self, limit=20):
+        """
+        The latest runs, newest first, with their players' betting systems.
+        """
+        rows = self.db.execute(
+            "SELECT r.id, r.created, r.source, r.name, r.version, r.iterations, r.rounds, r.elapsed, "
+            "group_concat(p.bet_system, ',') AS bet_systems FROM runs r LEFT JOIN players p ON p.run_id = r.id "
+            "GROUP BY r.id ORDER BY r.id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+
+def player_row(pl, iterations):
+    """
+    The `players` columns from `bet_system` to `stats` of one player of a `runner.scenario_report`.
+    """
+    cfg = pl["config"]
+    reasons = pl["end_reasons"]
+    st = pl["stats"]
+
+    def rate(reason):
+        return reasons[reason]["fraction"] if reason in reasons else 0.0
+
+    counted = sum(r["count"] for r in reasons.values())
+    avg_gold_end = sum(r["avg_gold_end"] * r["count"] for r in reasons.values()) / counted if counted else 0.0
+    avg_hands = sum(r["avg_hands"] * r["count"] for r in reasons.values()) / counted if counted else 0.0
+    hands = st["total_hands"]
+    return (cfg["bet_system"], cfg["bet_options"], cfg["gold"], cfg["target"], cfg["strat"],
+            strat_hash(cfg["strat"]), iterations, rate(RUIN), rate(TARGET), rate(FINISHED), avg_gold_end,
+            avg_hands, st["wins"] / hands if hands else 0.0, st["losses"] / hands if hands else 0.0,
+            st["gold_max"], st["gold_min"], json.dumps(reasons, sort_keys=True), json.dumps(st, sort_keys=True))
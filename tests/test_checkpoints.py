@@ -0,0 +1,39 @@
+import math
+import random
+
+from simulator import checkpoints
+
+
+def nearest_rank(values, ps):
+    values = sorted(values)
+    return [values[max(1, int(math.ceil(p / 100.0 * len(values)))) - 1] for p in ps]
+
+
+def test_exact_while_narrow():
+    rng = random.Random(1)
+    values = [rng.randint(0, 2000) for _ in range(5000)]
+    gold = checkpoints.GoldDistribution()
+    for v in values:
+        gold.add(v)
+    assert gold.width == 1
+    assert gold.percentiles(checkpoints.PERCENTILES) == nearest_rank(values, checkpoints.PERCENTILES)
+
+
+def test_bounded_and_mergeable():
+    rng = random.Random(2)
+    values = [int(rng.gauss(0, 10 ** 6)) for _ in range(40000)]
+    parts = [checkpoints.GoldDistribution() for _ in range(4)]
+    for i, v in enumerate(values):
+        parts[i % 4].add(v)
+    gold = checkpoints.GoldDistribution()
+    for part in parts:
+        gold.merge(part)
+        assert len(part.counts) <= checkpoints.MAX_BINS
+    assert len(gold.counts) <= checkpoints.MAX_BINS
+    assert gold.width > 1
+    assert gold.n == len(values) and gold.total == sum(values)
+    for got, exact in zip(gold.percentiles(checkpoints.PERCENTILES), nearest_rank(values, checkpoints.PERCENTILES)):
+        assert abs(got - exact) <= gold.width
+    low, high = gold.percentiles([0, 100])
+    assert min(values) <= low <= min(values) + gold.width
+    assert max(values) - gold.width <= high <= max(values)
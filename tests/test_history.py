@@ -0,0 +1,79 @@
+import os
+
+from simulator import history
+
+
+def snapshot():
+    snap = history.Snapshot()
+    snap.iteration = 12
+    snap.round = 345
+    snap.flags = history.SAMPLED | history.SPLIT
+    snap.dealer = [history.CARD_CODES["S", "K"], history.CARD_CODES["H", "6"], history.CARD_CODES["D", "9"]]
+    snap.gold = {1: 1000, 2: 250}
+    snap.gold_after = {1: 1200, 2: 150}
+    snap.bets = {1: 100, 2: 100}
+    snap.hands = {
+        1: [(1, [history.CARD_CODES["C", "8"], history.CARD_CODES["H", "3"]]),
+            ("1a", [history.CARD_CODES["S", "8"], history.CARD_CODES["D", "A"]])],
+        2: [(2, [history.CARD_CODES["H", "10"], history.CARD_CODES["C", "6"], history.CARD_CODES["S", "Q"]])],
+    }
+    snap.actions = {1: b"PH", "1a": b"S", 2: b"H"}
+    return snap
+
+
+EXPECTED = {
+    "worker": 3, "iteration": 12, "round": 345, "flags": ["sampled", "split"],
+    "dealer": ["KS", "6H", "9D"],
+    "seats": [
+        {"seat": 1, "gold": 1000, "gold_after": 1200, "bet": 100,
+         "hands": [{"cards": ["8C", "3H"], "actions": "PH"}, {"cards": ["8S", "AD"], "actions": "S"}]},
+        {"seat": 2, "gold": 250, "gold_after": 150, "bet": 100,
+         "hands": [{"cards": ["10H", "6C", "QS"], "actions": "H"}]},
+    ],
+}
+
+
+def test_encode_decode():
+    assert history.decode(bytes(snapshot().encode()), 3) == EXPECTED
+
+
+def test_card_codes_round_trip():
+    for code, name in history.CARD_NAMES.items():
+        assert history.CARD_CODES[name[-1], name[:-1]] == code
+    assert len(history.CARD_NAMES) == 52
+
+
+def test_write_read(tmp_path):
+    writer = history.HistoryWriter(str(tmp_path), 3, history.Conditions(every=1))
+    for rnd in range(1, 4):
+        snap = snapshot()
+        snap.round = rnd
+        writer.write(snap)
+    entry = writer.close()
+    assert entry == {"worker": 3, "rounds": 3, "file": history.file_name(3)}
+    index = history.write_index(str(tmp_path), [entry], seed=7)
+    assert index["rounds"] == 3
+    assert history.load_index(str(tmp_path))["info"] == {"seed": 7}
+
+    rounds = list(history.read_histories(str(tmp_path)))
+    assert [r["round"] for r in rounds] == [1, 2, 3]
+    assert rounds[0] == dict(EXPECTED, round=1)
+
+
+def test_read_rejects_other_files(tmp_path):
+    path = os.path.join(str(tmp_path), "other.bin")
+    with open(path, "wb") as f:
+        f.write(b"NOPE\x01\x00\x00")
+    try:
+        list(history.read_file(path))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("read a file without the history header")
+
+
+def test_parse_conditions():
+    conditions = history.parse_conditions("split, loss=500,ruin")
+    assert (conditions.split, conditions.loss, conditions.ruin) == (True, 500, True)
+    assert conditions.conditional()
+    assert not history.parse_conditions("").conditional()
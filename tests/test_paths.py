@@ -0,0 +1,89 @@
+import random
+import types
+
+from simulator import paths
+
+
+def test_lttb_keeps_endpoints_and_length():
+    rng = random.Random(1)
+    for size in [3, 10, 100, 1001]:
+        xs = list(range(size))
+        ys = [rng.randint(-1000, 1000) for _ in xs]
+        for n in [2, 3, 7, 64, size - 1, size, size + 5]:
+            out_x, out_y = paths.lttb(xs, ys, n)
+            assert len(out_x) == len(out_y) == min(n, size)
+            assert (out_x[0], out_y[0]) == (xs[0], ys[0])
+            assert (out_x[-1], out_y[-1]) == (xs[-1], ys[-1])
+            # kept points are points of the path, in order
+            assert out_x == sorted(set(out_x))
+            assert all(ys[x] == y for x, y in zip(out_x, out_y))
+
+
+def test_lttb_keeps_spikes():
+    xs = list(range(1000))
+    ys = [0] * 1000
+    ys[437] = 500
+    ys[803] = -700
+    out_x, out_y = paths.lttb(xs, ys, 20)
+    assert 437 in out_x and 803 in out_x
+
+
+def seat(gold):
+    return types.SimpleNamespace(player=types.SimpleNamespace(gold=gold), ended=False)
+
+
+def play(recorder, pls, rounds, step):
+    recorder.begin(pls)
+    for rnd in range(1, rounds + 1):
+        for i, pl in enumerate(pls):
+            if not pl.ended:
+                pl.player.gold += step[i](rnd)
+        if rnd == rounds:
+            for pl in pls:
+                pl.ended = True
+        recorder.record(rnd, pls)
+    recorder.end()
+
+
+def test_write_open_paths(tmp_path):
+    directory = str(tmp_path)
+    recorder = paths.PathRecorder(directory, 0, 2, 2, points=8)
+    pls = [seat(100), seat(50)]
+    play(recorder, pls, 5, [lambda rnd: 10, lambda rnd: -rnd])
+    pls = [seat(100), seat(50)]
+    play(recorder, pls, 500, [lambda rnd: 1 if rnd % 2 else -2, lambda rnd: 3])
+    # past the preallocated iterations
+    play(recorder, [seat(1), seat(1)], 3, [lambda rnd: 0, lambda rnd: 0])
+    shard = recorder.close()
+    assert (shard["rows"], shard["dropped"]) == (2, 1)
+
+    index = paths.write_index(directory, [shard], players=2, points=8, seed=7)
+    assert (index["rows"], index["dropped"]) == (2, 1)
+
+    loaded, shards = paths.open_paths(directory, use_numpy=False)
+    assert loaded["info"] == {"seed": 7}
+    arrays = shards[0]
+    assert list(arrays["length"]) == [6, 6, 8, 8]
+
+    def path(row, player):
+        slot = row * 2 + player
+        length = arrays["length"][slot]
+        return (list(arrays["rounds"][slot * 8:slot * 8 + length]),
+                list(arrays["gold"][slot * 8:slot * 8 + length]))
+
+    assert path(0, 0) == ([0, 1, 2, 3, 4, 5], [100, 110, 120, 130, 140, 150])
+    assert path(0, 1) == ([0, 1, 2, 3, 4, 5], [50, 49, 47, 44, 40, 35])
+    rounds, gold = path(1, 1)
+    assert (rounds[0], gold[0]) == (0, 50)
+    assert (rounds[-1], gold[-1]) == (500, 1550)
+    assert all(g == 50 + 3 * r for r, g in zip(rounds, gold))
+
+
+def test_points_bounds(tmp_path):
+    for points in [1, paths.MAX_POINTS + 1]:
+        try:
+            paths.PathRecorder(str(tmp_path), 0, 1, 1, points=points)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("accepted {} points".format(points))
@@ -0,0 +1,45 @@
+import types
+
+from simulator import records
+
+
+def result(reason, gold_end, hands):
+    stats = types.SimpleNamespace(gold_end=gold_end, gold_min=gold_end - 50, gold_max=gold_end + 50,
+                                  total_hands=hands, win_streak=3, loss_streak=4, tie_streak=1,
+                                  surrender_streak=0)
+    return types.SimpleNamespace(end_reason=reason, stats=stats)
+
+
+def write(directory, shard, rows, flush_every):
+    writer = records.RecordWriter(directory, shard, flush_every=flush_every)
+    for i in range(rows):
+        reason = "Ran out of gold." if i % 3 else "Something new."
+        writer.add(i % 2, result(reason, 1000 * i - 5000, 10 * i))
+    return writer.close()
+
+
+def test_write_read(tmp_path):
+    directory = str(tmp_path)
+    shards = [write(directory, 1, 10, 4), write(directory, 0, 5, 100), write(directory, 2, 0, 4)]
+    index = records.write_index(directory, shards, seed=7)
+    assert index["rows"] == 15
+    assert [s["shard"] for s in index["shards"]] == [0, 1, 2]
+
+    loaded, columns = records.open_records(directory, use_numpy=False)
+    assert loaded == records.load_index(directory)
+    assert loaded["info"] == {"seed": 7}
+
+    shard = loaded["shards"][1]
+    cols = columns[1]
+    assert list(cols["player"]) == [i % 2 for i in range(10)]
+    assert list(cols["gold_end"]) == [1000 * i - 5000 for i in range(10)]
+    assert list(cols["gold_min"]) == [1000 * i - 5050 for i in range(10)]
+    assert list(cols["hands"]) == [10 * i for i in range(10)]
+    assert set(cols["loss_streak"]) == {4}
+    reasons = [shard["reasons"][code] for code in cols["reason"]]
+    assert reasons == ["Something new." if i % 3 == 0 else "Ran out of gold." for i in range(10)]
+    # known reasons keep their codes in every shard
+    assert shard["reasons"][:len(records.END_REASONS)] == records.END_REASONS
+
+    assert len(columns[0]["gold_end"]) == 5
+    assert len(columns[2]["gold_end"]) == 0
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARGS = ["--bet-system=martingale", "--bet-options=starting-bet=10", "--gold=1000", "--target=1500",
+        "--bet-system=fibonacci", "--bet-options=starting-bet=5", "--gold=800", "--target=1200",
+        "--iterations=60", "--rounds=200"]
+
+
+def report(*args):
+    out = subprocess.run([sys.executable, os.path.join(ROOT, "casinosim.py")] + ARGS + list(args),
+                         cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True,
+                         universal_newlines=True).stdout
+    # the worker count and the time taken differ from run to run
+    return [line for line in out.splitlines() if not line.startswith(("Running ", "Completed in "))]
+
+
+def test_seed_same_across_threads():
+    one = report("--seed=7", "--threads=1")
+    assert any("Ran out of gold." in line for line in one)
+    for threads in ["2", "3"]:
+        assert report("--seed=7", "--threads=" + threads) == one
+
+
+def test_seeds_differ():
+    assert report("--seed=7", "--threads=2") != report("--seed=8", "--threads=2")
@@ -0,0 +1,28 @@
+import random
+
+from casinobot import cards
+from simulator import stratified
+
+
+def test_strata_probabilities():
+    all_strata = stratified.strata()
+    assert len(all_strata) == len(stratified.HAND_CLASSES) * 10 * len(stratified.HOLE_CLASSES)
+    assert abs(sum(st.probability for st in all_strata) - 1) < 1e-12
+    for st in all_strata:
+        assert st.probability > 0
+        for (low, high, up, hole) in st.deals:
+            assert low <= high
+            assert stratified.hand_class(low, high) == st.hand
+            assert (up, stratified.hole_class(hole)) == (st.up, st.hole)
+
+
+def test_sampler_forces_the_deal():
+    random.seed(1)
+    for st in random.sample(stratified.strata(), 40):
+        sampler = stratified.StratifiedSampler(st)
+        for _ in range(5):
+            shoe = sampler.new_deck().cards
+            assert len(shoe) == 52 * stratified.DECKS
+            first, hole, second, up = (cards.VALUES[c.rank] for c in shoe[:4])
+            deal = (min(first, second), max(first, second), up, hole)
+            assert deal in st.deals